@@ -3,30 +3,25 @@
 Analyze user rating patterns to build a personalized recommendation profile
 """
 
-import csv
-import json
+from catalog_db import save_profile
+from collection_store import load_collection
+from instrumentation import run_report
 
-def analyze_preferences():
-    """Analyze user's rating patterns and create preference profile"""
-
-    # Load rated games from collection
+def rated_games(records):
+    """Rated games from the collection"""
     ratings = []
-    with open('collection.csv', 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            rating = row.get('rating', '').strip()
-            if rating and rating != '0':
-                try:
-                    ratings.append({
-                        'rating': float(rating),
-                        'avgweight': float(row['avgweight']) if row['avgweight'] else 0,
-                        'average': float(row['average']) if row['average'] else 0,
-                        'year': int(row['yearpublished']) if row['yearpublished'] else 0,
-                    })
-                except:
-                    pass
+    for record in records:
+        if record.rating:
+            ratings.append({
+                'rating': record.rating,
+                'avgweight': record.avgweight,
+                'average': record.average,
+                'year': record.year,
+            })
+    return ratings
 
-    print(f"Analyzed {len(ratings)} rated games\n")
+def build_profile(ratings):
+    """Preference profile for a list of rated games"""
 
     # Calculate preference curves
     # Complexity preference (weight -> expected rating boost)
@@ -66,10 +61,19 @@ def analyze_preferences():
         'year_preferences': year_buckets,
         'baseline_rating': sum(r['rating'] for r in ratings) / len(ratings),
     }
+    return profile
+
+def analyze_preferences():
+    """Analyze user's rating patterns and create preference profile"""
+
+    # Load rated games from collection
+    ratings = rated_games(load_collection())
+    print(f"Analyzed {len(ratings)} rated games\n")
+
+    profile = build_profile(ratings)
 
     # Save profile
-    with open('preference_profile.json', 'w', encoding='utf-8') as f:
-        json.dump(profile, f, indent=2)
+    save_profile(profile)
 
     print("Preference profile created:")
     print(f"  Baseline rating: {profile['baseline_rating']:.2f}")
@@ -79,4 +83,5 @@ def analyze_preferences():
     print(f"\nSaved to preference_profile.json")
 
 if __name__ == '__main__':
-    analyze_preferences()
+    with run_report():
+        analyze_preferences()
@@ -4,7 +4,10 @@ Apply BGG ID corrections from the CSV file to bgg-recommendations.json
 """
 
 import csv
-import json
+
+from catalog_db import load_games, save_games
+from game_ids import parse_id
+from instrumentation import run_report
 
 def apply_corrections():
     # Load the corrections CSV
@@ -16,13 +19,12 @@ def apply_corrections():
             correct_id = row['Correct ID (fill this in)'].strip()
 
             if correct_id:  # Only process if correct ID is filled in
-                corrections[game_name] = correct_id
+                corrections[game_name] = parse_id(correct_id)
 
     print(f"Found {len(corrections)} corrections in CSV file\n")
 
     # Load the games JSON
-    with open('bgg-recommendations.json', 'r', encoding='utf-8') as f:
-        games = json.load(f)
+    games = load_games('recommendations')
 
     # Apply corrections
     updated_count = 0
@@ -39,8 +41,7 @@ def apply_corrections():
                 print(f"  {game['name']}: Already correct ({old_id})")
 
     # Save updated JSON
-    with open('bgg-recommendations.json', 'w', encoding='utf-8') as f:
-        json.dump(games, f, indent=2)
+    save_games('recommendations', games)
 
     print(f"\n{'='*60}")
     print(f"✓ Updated {updated_count} game IDs")
@@ -48,4 +49,5 @@ def apply_corrections():
     print(f"{'='*60}")
 
 if __name__ == '__main__':
-    apply_corrections()
+    with run_report():
+        apply_corrections()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Benchmark every pipeline stage on synthetic data
+
+    python3 benchmark.py                                   # 170k ranks rows; 300 and 3,000 collection rows
+    python3 benchmark.py --ranks 170000 1000000 5000000 --collection 300 30000
+    python3 benchmark.py --compare benchmark-abc1234.json  # flag regressions against an earlier run
+
+For each combination of ranks and collection size the synthetic files are
+generated once (see synthetic_data.py) into .cache/benchmark/, then each
+stage is timed `--repeats` times (wall and CPU time) and run once more
+under tracemalloc for its peak Python memory. The results are written as
+JSON named after the current git revision, so runs from two revisions can
+be compared with --compare.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import synthetic_data
+from analyze_preferences import analyze_preferences
+from apply_id_corrections import apply_corrections
+from build_personalized_recommendations import build_personalized_recommendations
+from filter_index import COMPLEXITIES, DURATIONS, PLAYER_COUNTS, build_filter_index, matching_positions
+from parse_collection import parse_csv_to_json
+from ranks_snapshot import build_snapshot
+from recommendations_io import read_games
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_DIR = os.path.join('.cache', 'benchmark')
+REGRESSION_THRESHOLD = 1.10  # flag stages more than 10% slower...
+REGRESSION_MIN_S = 0.005     # ...and at least 5 ms slower (timer noise on tiny stages)
+
+DEFAULT_RANKS_ROWS = [170_000]
+DEFAULT_COLLECTION_ROWS = [300, 3_000]
+CORRECTIONS = 50
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _clear_collection_cache():
+    _remove(os.path.join('.cache', 'collection.csv.pickle'))
+
+
+def _filter_index_stage():
+    """Build the index for the buy list and answer every filter combination"""
+    games = read_games('bgg-recommendations.json')
+    index = build_filter_index(games)
+    for players in [''] + PLAYER_COUNTS:
+        for complexity in [''] + COMPLEXITIES:
+            for duration in [''] + DURATIONS:
+                matching_positions(index, len(games), players, complexity, duration)
+
+
+def _write_corrections():
+    synthetic_data.generate_corrections('bgg-id-corrections.csv',
+                                        read_games('bgg-recommendations.json'), CORRECTIONS)
+
+
+# (name, setup run before every repetition, stage function)
+STAGES = [
+    ('parse_collection', _clear_collection_cache, parse_csv_to_json),
+    ('analyze_preferences', None, analyze_preferences),
+    ('build_personalized_csv', lambda: _remove('boardgames_ranks.bin'), build_personalized_recommendations),
+    ('ranks_snapshot', None, build_snapshot),
+    ('build_personalized_snapshot', None, build_personalized_recommendations),
+    ('apply_id_corrections', _write_corrections, apply_corrections),
+    ('filter_index', None, _filter_index_stage),
+]
+
+
+def prepare_scenario(ranks_rows, collection_rows, seed):
+    """Scenario directory with generated (or previously generated) input files"""
+    data_dir = os.path.join(BENCH_DIR, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    ranks_path = os.path.abspath(os.path.join(data_dir, f'ranks-{ranks_rows}-{seed}.csv'))
+    collection_path = os.path.abspath(
+        os.path.join(data_dir, f'collection-{collection_rows}-from-{ranks_rows}-{seed}.csv'))
+
+    if not os.path.exists(ranks_path):
+        print(f"  Generating {ranks_rows:,} ranks rows...")
+        synthetic_data.generate_ranks(ranks_path + '.tmp', ranks_rows, seed=seed)
+        os.replace(ranks_path + '.tmp', ranks_path)
+    if not os.path.exists(collection_path):
+        print(f"  Generating {collection_rows:,} collection rows...")
+        synthetic_data.generate_collection(collection_path + '.tmp', collection_rows,
+                                           ranks_path=ranks_path, seed=seed)
+        os.replace(collection_path + '.tmp', collection_path)
+
+    work_dir = os.path.join(BENCH_DIR, f'ranks-{ranks_rows}-collection-{collection_rows}')
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    # Hard links keep multi-GB dumps from being copied per scenario
+    for source, name in ((ranks_path, 'boardgames_ranks.csv'), (collection_path, 'collection.csv')):
+        try:
+            os.link(source, os.path.join(work_dir, name))
+        except OSError:
+            shutil.copyfile(source, os.path.join(work_dir, name))
+    return work_dir
+
+
+def measure(setup, stage, repeats):
+    """Wall/CPU seconds of each repetition plus the peak traced memory"""
+    wall = []
+    cpu = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeats):
+            if setup:
+                setup()
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            stage()
+            wall.append(time.perf_counter() - wall_start)
+            cpu.append(time.process_time() - cpu_start)
+
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            stage()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'wall_s': [round(seconds, 6) for seconds in wall],
+        'best_s': round(min(wall), 6),
+        'median_s': round(statistics.median(wall), 6),
+        'cpu_s': round(statistics.median(cpu), 6),
+        'peak_bytes': peak,
+    }
+
+
+def benchmark_js_filters():
+    """Timings from test_filters.js --bench, or None without node"""
+    node = shutil.which('node')
+    if node is None:
+        return None
+    result = subprocess.run(
+        [node, os.path.join(REPO_DIR, 'test_filters.js'), '--bench',
+         'owned-games.json', 'bgg-recommendations.json'],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout)
+
+
+def run_scenario(ranks_rows, collection_rows, repeats, seed):
+    print(f"\nRanks: {ranks_rows:,} rows, collection: {collection_rows:,} rows")
+    work_dir = prepare_scenario(ranks_rows, collection_rows, seed)
+
+    stages = {}
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        for name, setup, stage in STAGES:
+            stages[name] = measure(setup, stage, repeats)
+            print(f"  {name:30s} {stages[name]['best_s'] * 1000:10.1f} ms"
+                  f" {stages[name]['peak_bytes'] / 1e6:8.1f} MB")
+        js = benchmark_js_filters()
+    finally:
+        os.chdir(cwd)
+
+    if js is not None:
+        for result in js:
+            label = os.path.splitext(result['file'])[0]
+            for metric in ('decode_ms', 'scan_ms', 'index_ms'):
+                if metric in result:
+                    name = f'js_{label}_{metric[:-3]}'
+                    stages[name] = {'best_s': round(result[metric] / 1000, 6)}
+                    print(f"  {name:30s} {result[metric]:10.1f} ms")
+
+    return {
+        'ranks_rows': ranks_rows,
+        'collection_rows': collection_rows,
+        'stages': stages,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def git_revision():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    cwd=REPO_DIR, capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return revision, dirty
+
+
+def compare(results, baseline_path):
+    """Print the stages that got slower than REGRESSION_THRESHOLD allows"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    old_scenarios = {(s['ranks_rows'], s['collection_rows']): s for s in baseline['scenarios']}
+
+    regressions = 0
+    print(f"\nCompared with {baseline['revision']} ({baseline_path}):")
+    for scenario in results['scenarios']:
+        old = old_scenarios.get((scenario['ranks_rows'], scenario['collection_rows']))
+        if old is None:
+            continue
+        for name, stage in scenario['stages'].items():
+            old_stage = old['stages'].get(name)
+            if not old_stage or not old_stage['best_s']:
+                continue
+            ratio = stage['best_s'] / old_stage['best_s']
+            slower = (ratio > REGRESSION_THRESHOLD
+                      and stage['best_s'] - old_stage['best_s'] > REGRESSION_MIN_S)
+            regressions += slower
+            marker = '✗' if slower else ' '
+            print(f"  {marker} {scenario['ranks_rows']:>9,} / {scenario['collection_rows']:>6,}"
+                  f"  {name:30s} {ratio:6.2f}x")
+    print(f"{'✗' if regressions else '✓'} {regressions} stage(s) more than "
+          f"{(REGRESSION_THRESHOLD - 1) * 100:.0f}% slower")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ranks', type=int, nargs='+', default=DEFAULT_RANKS_ROWS,
+                        help='ranks CSV sizes to benchmark (rows)')
+    parser.add_argument('--collection', type=int, nargs='+', default=DEFAULT_COLLECTION_ROWS,
+                        help='collection.csv sizes to benchmark (rows)')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='results file (default: benchmark-<revision>.json)')
+    parser.add_argument('--compare', help='earlier results file to check for regressions')
+    args = parser.parse_args()
+
+    revision, dirty = git_revision()
+    results = {
+        'revision': revision + ('-dirty' if dirty else ''),
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeats': args.repeats,
+        'scenarios': [
+            run_scenario(ranks_rows, collection_rows, args.repeats, args.seed)
+            for ranks_rows in args.ranks
+            for collection_rows in args.collection
+        ],
+    }
+
+    output = args.output or f"benchmark-{results['revision']}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✓ Saved results to {output}")
+
+    if args.compare and compare(results, args.compare):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Persistent cache for BGG XML API responses
+
+Entries live in a SQLite database under .cache/, keyed by endpoint plus the
+sorted request parameters. Bodies are stored gzip-compressed, every entry has
+its own expiry time, and once the stored bodies exceed max_bytes the least
+recently used entries are evicted.
+
+BGGClient uses it when given a cache: search responses are cached whole,
+`thing` responses per game id, so a batch only requests the ids that are
+missing or stale.
+"""
+
+import gzip
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlencode
+
+from instrumentation import count
+
+CACHE_PATH = os.path.join('.cache', 'bgg-api.sqlite')
+DEFAULT_TTL = 7 * 24 * 3600  # Game stats drift slowly; re-check weekly
+MAX_BYTES = 256 * 1024 * 1024
+
+
+def cache_key(endpoint, params):
+    return f"{endpoint}?{urlencode(sorted((str(k), str(v)) for k, v in params.items()))}"
+
+
+class ResponseCache:
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_BYTES, default_ttl=DEFAULT_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Shared by the client's worker threads; all access goes through self.lock
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)')
+        self.db.commit()
+        # Running total of the stored body sizes, so a put doesn't sum the
+        # whole table; _evict() re-sums it before dropping anything
+        self.total_bytes = self._stored_bytes()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def get(self, endpoint, params):
+        """Cached body for the request, or None if missing or expired"""
+        key = cache_key(endpoint, params)
+        now = time.time()
+        with self.lock:
+            row = self.db.execute(
+                'SELECT body, expires FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                self.misses += 1
+                count('bgg_cache.miss')
+                return None
+            self.db.execute('UPDATE responses SET last_access = ? WHERE key = ?', (now, key))
+            self.db.commit()
+            self.hits += 1
+        count('bgg_cache.hit')
+        return gzip.decompress(row[0])
+
+    def put(self, endpoint, params, body, ttl=None):
+        compressed = gzip.compress(body)
+        now = time.time()
+        expires = now + (self.default_ttl if ttl is None else ttl)
+        key = cache_key(endpoint, params)
+        with self.lock:
+            replaced = self.db.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self.db.execute(
+                'INSERT OR REPLACE INTO responses (key, body, size, expires, last_access) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, compressed, len(compressed), expires, now),
+            )
+            self.total_bytes += len(compressed) - (replaced[0] if replaced else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self.db.commit()
+
+    def bodies(self, endpoint):
+        """Bodies of every cached response of an endpoint, expired ones included"""
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT body FROM responses WHERE key LIKE ?', (f'{endpoint}?%',)
+            ).fetchall()
+        return [gzip.decompress(body) for (body,) in rows]
+
+    def _stored_bytes(self):
+        (total,) = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()
+        return total
+
+    def _evict(self):
+        # Other processes may have written to the cache too: start from the real total
+        self.total_bytes = self._stored_bytes()
+        if self.total_bytes <= self.max_bytes:
+            return
+        self.db.execute('DELETE FROM responses WHERE expires <= ?', (time.time(),))
+        self.total_bytes = total = self._stored_bytes()
+        if total <= self.max_bytes:
+            return
+
+        # Walk from least recently used and drop entries until under budget
+        excess = total - self.max_bytes
+        doomed = []
+        for key, size in self.db.execute('SELECT key, size FROM responses ORDER BY last_access'):
+            doomed.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self.db.executemany('DELETE FROM responses WHERE key = ?', doomed)
+        self.total_bytes = self._stored_bytes()
+
+    def size(self):
+        with self.lock:
+            return self._stored_bytes()
@@ -0,0 +1,304 @@
+"""
+Reusable client for the BoardGameGeek XML API2
+
+- One pooled requests.Session for all calls
+- `thing` lookups batched into comma-separated id lists (BGG accepts up to
+  THING_BATCH_SIZE ids per request)
+- A token-bucket rate limiter shared by all worker threads
+- Bounded concurrency through a thread pool
+- Retries with backoff when BGG answers 202 (request queued), 429 (too many
+  requests) or a 5xx, honouring Retry-After
+
+- Optional persistent response cache (bgg_cache.ResponseCache): searches
+  are cached whole and `thing` items per game id, so re-runs only hit the
+  network for new or stale games
+
+The base URL is a constructor argument, so the client can be pointed at a
+local stub server.
+"""
+
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import requests
+except ImportError:
+    print("Installing requests library...")
+    import subprocess
+    subprocess.check_call(['pip3', 'install', 'requests'])
+    import requests
+from requests.adapters import HTTPAdapter
+
+from game_ids import parse_id
+from instrumentation import count, span
+from player_polls import encode_players
+
+BASE_URL = 'https://boardgamegeek.com/xmlapi2'
+THING_BATCH_SIZE = 20
+RETRY_STATUSES = {202, 429, 500, 502, 503, 504}
+
+
+class BGGError(Exception):
+    """BGG kept failing (or rejected the request) after all retries"""
+
+
+class TokenBucket:
+    """Allow `rate` acquisitions per second on average, with bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def parse_thing_item(item):
+    """Game dict (in the bgg-recommendations.json shape) from a <item> element"""
+    name_elem = item.find("name[@type='primary']")
+    name = name_elem.get('value') if name_elem is not None else 'Unknown'
+
+    yearpublished = item.find('yearpublished')
+    year = yearpublished.get('value') if yearpublished is not None else 'Unknown'
+
+    minplayers = item.find('minplayers')
+    min_p = int(minplayers.get('value')) if minplayers is not None else 1
+
+    maxplayers = item.find('maxplayers')
+    max_p = int(maxplayers.get('value')) if maxplayers is not None else 4
+
+    playingtime = item.find('playingtime')
+    time_ = int(playingtime.get('value')) if playingtime is not None else 60
+
+    # Stats
+    average = 0
+    avgweight = 0
+    ratings = item.find('statistics/ratings')
+    if ratings is not None:
+        average_elem = ratings.find('average')
+        average = float(average_elem.get('value')) if average_elem is not None else 0
+
+        avgweight_elem = ratings.find('averageweight')
+        avgweight = float(avgweight_elem.get('value')) if avgweight_elem is not None else 0
+
+    # Get recommended players (poll data) as player_polls bitmasks
+    bggbestplayers = 0
+    bggrecplayers = 0
+
+    for poll in item.findall('poll'):
+        if poll.get('name') == 'suggested_numplayers':
+            for result in poll.findall('results'):
+                numplayers = result.get('numplayers')
+                if not numplayers:
+                    continue
+                # "N+" (more players than the box supports) counts as N + 1
+                bit = encode_players(numplayers)
+
+                best_votes = 0
+                rec_votes = 0
+                not_rec_votes = 0
+
+                for r in result.findall('result'):
+                    value = r.get('value')
+                    votes = int(r.get('numvotes', 0))
+
+                    if value == 'Best':
+                        best_votes = votes
+                    elif value == 'Recommended':
+                        rec_votes = votes
+                    elif value == 'Not Recommended':
+                        not_rec_votes = votes
+
+                # If best votes are highest
+                if best_votes > rec_votes and best_votes > not_rec_votes:
+                    bggbestplayers |= bit
+
+                # If best or recommended votes exceed not recommended
+                if (best_votes + rec_votes) > not_rec_votes:
+                    bggrecplayers |= bit
+
+    return {
+        'id': parse_id(item.get('id')),
+        'name': name,
+        'avgweight': avgweight,
+        'minplayers': min_p,
+        'maxplayers': max_p,
+        'playingtime': time_,
+        'yearpublished': year,
+        'average': average,
+        'itemtype': 'standalone',
+        'bggbestplayers': bggbestplayers,
+        'bggrecplayers': bggrecplayers
+    }
+
+
+def cached_things(cache):
+    """Parsed game dicts of every `thing` item in a ResponseCache, expired ones included"""
+    for body in cache.bodies('thing'):
+        yield parse_thing_item(ET.fromstring(body))
+
+
+def _thing_params(game_id, stats):
+    params = {'id': game_id}
+    if stats:
+        params['stats'] = 1
+    return params
+
+
+class BGGClient:
+    def __init__(self, base_url=BASE_URL, rate=2.0, burst=2, max_workers=4,
+                 max_retries=6, backoff=2.0, timeout=10, cache=None):
+        self.base_url = base_url.rstrip('/')
+        self.cache = cache
+        self.limiter = TokenBucket(rate, burst)
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def _retry_delay(self, attempt, response=None):
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return int(retry_after)
+        return self.backoff * (2 ** attempt)
+
+    def get_xml(self, endpoint, params):
+        """Parsed XML root of a response, served from the cache when possible
+
+        Bodies are only cached once they parse, so a truncated or garbled
+        response is fetched again next time.
+        """
+        if self.cache is not None:
+            body = self.cache.get(endpoint, params)
+            if body is not None:
+                return ET.fromstring(body)
+
+        body = self.get(endpoint, params)
+        root = ET.fromstring(body)
+        if self.cache is not None:
+            self.cache.put(endpoint, params, body)
+        return root
+
+    def get(self, endpoint, params):
+        """Raw response body of GET {base_url}/{endpoint}, retrying transient failures"""
+        url = f'{self.base_url}/{endpoint}'
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                count('bgg_http.retries')
+            self.limiter.acquire()
+            count('bgg_http.requests')
+            try:
+                with span(f'http_{endpoint}'):
+                    response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                count('bgg_http.connection_errors')
+                if attempt == self.max_retries:
+                    raise BGGError(f"{endpoint} {params}: {e}") from e
+                time.sleep(self._retry_delay(attempt))
+                continue
+
+            if response.status_code != 200:
+                count(f'bgg_http.status_{response.status_code}')
+            if response.status_code in RETRY_STATUSES:
+                if attempt == self.max_retries:
+                    break
+                time.sleep(self._retry_delay(attempt, response))
+                continue
+
+            if response.status_code != 200:
+                raise BGGError(f"{endpoint} {params}: HTTP {response.status_code}")
+            return response.content
+
+        raise BGGError(f"{endpoint} {params}: still HTTP {response.status_code} after {self.max_retries} retries")
+
+    def _fetch_thing_batch(self, ids, stats):
+        params = _thing_params(','.join(ids), stats)
+        # Cached per game id below, not per batch
+        root = ET.fromstring(self.get('thing', params))
+        items = {item.get('id'): item for item in root.findall('item')}
+
+        if self.cache is not None:
+            for game_id, item in items.items():
+                self.cache.put('thing', _thing_params(game_id, stats), ET.tostring(item))
+        return items
+
+    def fetch_thing_items(self, ids, stats=True):
+        """Raw <item> elements for the given ids, keyed by id (missing ids are left out)
+
+        Duplicate ids are requested once, and ids with a fresh cache entry
+        are not requested at all. Batches run concurrently on up to
+        max_workers threads, all sharing the rate limiter; a batch that still
+        fails after its retries is reported and skipped.
+        """
+        unique_ids = list(dict.fromkeys(str(game_id) for game_id in ids))
+
+        items = {}
+        if self.cache is not None:
+            missing = []
+            for game_id in unique_ids:
+                body = self.cache.get('thing', _thing_params(game_id, stats))
+                if body is None:
+                    missing.append(game_id)
+                else:
+                    items[game_id] = ET.fromstring(body)
+            unique_ids = missing
+
+        batches = [unique_ids[i:i + THING_BATCH_SIZE]
+                   for i in range(0, len(unique_ids), THING_BATCH_SIZE)]
+
+        def fetch(batch):
+            try:
+                return self._fetch_thing_batch(batch, stats)
+            except (BGGError, ET.ParseError) as e:
+                print(f"Error fetching games {','.join(batch)}: {e}")
+                return {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for batch_items in pool.map(fetch, batches):
+                items.update(batch_items)
+        return items
+
+    def fetch_things(self, ids, stats=True):
+        """Parsed game dicts for the given ids, keyed by (int) id"""
+        games = map(parse_thing_item, self.fetch_thing_items(ids, stats).values())
+        return {game['id']: game for game in games}
+
+    def search(self, query, exact=False):
+        """(id, yearpublished or None) for each boardgame matching `query`, in BGG's order"""
+        params = {'query': query, 'type': 'boardgame'}
+        if exact:
+            params['exact'] = 1
+        root = self.get_xml('search', params)
+        results = []
+        for item in root.findall('item'):
+            year = item.find('yearpublished')
+            results.append((parse_id(item.get('id')), year.get('value') if year is not None else None))
+        return results
@@ -3,74 +3,105 @@
 Build buy recommendations from:
 1. User's BGG wishlist/want list (highest priority)
 2. Games in collection that are rated/tracked but not owned (correct IDs!)
+3. Optionally (--max-rank N) ranked games from boardgames_ranks.csv
 This gives a much larger pool while ensuring all IDs are accurate.
+
+The sources are merged by source_merge.py: each game appears once, with a
+`sources` bitmask of the lists it came from.
 """
 
-import csv
-import json
+import argparse
+from itertools import islice
+from operator import itemgetter
 
-def build_comprehensive_recommendations():
-    wishlist_games = []
-    tracked_games = []
+from build_from_all_bgg_games import candidates
+from catalog_db import load_excluded_ids, save_games
+from collection_store import load_collection
+from instrumentation import run_report
+from ranks_reader import read_ranks
+from source_merge import RANKS, TRACKED, WISHLIST, merge_sources
 
-    with open('collection.csv', 'r', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
+def ranked_games(max_rank):
+    """Ranked games not in the collection's owned/previously owned list"""
+    rows = read_ranks(['id', 'name', 'yearpublished', 'rank', 'average'],
+                      max_rank=max_rank, exclude_ids=load_excluded_ids())
+    for game in candidates(rows, {}):
+        # Same fields as the collection games
+        del game['rank']
+        yield game
 
-        for row in reader:
-            # Parse ownership flags
-            want = int(row['want']) if row['want'] else 0
-            wanttobuy = int(row['wanttobuy']) if row['wanttobuy'] else 0
-            wanttoplay = int(row['wanttoplay']) if row['wanttoplay'] else 0
-            wishlist = int(row['wishlist']) if row['wishlist'] else 0
-            own = int(row['own']) if row['own'] else 0
-            prevowned = int(row['prevowned']) if row['prevowned'] else 0
-
-            # Skip owned/previously owned
-            if own or prevowned:
-                continue
+def build_comprehensive_recommendations(top=None, max_rank=None):
+    wishlist_games = []
+    tracked_games = []
 
-            game = {
-                'id': row['objectid'],
-                'name': row['objectname'],
-                'rating': float(row['rating']) if row['rating'] else 0,
-                'avgweight': float(row['avgweight']) if row['avgweight'] else 0,
-                'minplayers': int(row['minplayers']) if row['minplayers'] else 0,
-                'maxplayers': int(row['maxplayers']) if row['maxplayers'] else 0,
-                'playingtime': int(row['playingtime']) if row['playingtime'] else 0,
-                'yearpublished': row['yearpublished'],
-                'average': float(row['average']) if row['average'] else 0,
-                'itemtype': row['itemtype'],
-                'bggbestplayers': row['bggbestplayers'],
-                'bggrecplayers': row['bggrecplayers']
-            }
+    for record in load_collection():
+        # Skip owned/previously owned
+        if record.own or record.prevowned:
+            continue
 
-            # Prioritize wishlist games
-            if want or wanttobuy or wanttoplay or wishlist:
-                wishlist_games.append(game)
-            else:
-                # Other games (rated/tracked but not explicitly wanted)
-                tracked_games.append(game)
+        game = {
+            'id': record.objectid,
+            'name': record.objectname,
+            'rating': record.rating,
+            'avgweight': record.avgweight,
+            'minplayers': record.minplayers,
+            'maxplayers': record.maxplayers,
+            'playingtime': record.playingtime,
+            'yearpublished': record.yearpublished,
+            'average': record.average,
+            'itemtype': record.itemtype,
+            'bggbestplayers': record.bggbestplayers,
+            'bggrecplayers': record.bggrecplayers
+        }
 
-    # Combine: wishlist first, then tracked games
-    all_games = wishlist_games + tracked_games
+        # Prioritize wishlist games
+        if record.wanted:
+            wishlist_games.append(game)
+        else:
+            # Other games (rated/tracked but not explicitly wanted)
+            tracked_games.append(game)
 
-    # Sort by BGG average rating
-    all_games.sort(key=lambda x: x['average'], reverse=True)
+    # Order by BGG average rating: each source is sorted on its own and the
+    # sources are merged, wishlist first among equal ratings, one entry per game
+    by_rating = itemgetter('average')
+    sources = [
+        (WISHLIST, sorted(wishlist_games, key=by_rating, reverse=True)),
+        (TRACKED, sorted(tracked_games, key=by_rating, reverse=True)),
+    ]
+    if max_rank is not None:
+        sources.append((RANKS, sorted(ranked_games(max_rank), key=by_rating, reverse=True)))
+    all_games = list(islice(merge_sources(sources, key=by_rating, reverse=True), top))
 
     # Save to JSON
-    with open('bgg-recommendations.json', 'w', encoding='utf-8') as f:
-        json.dump(all_games, f, indent=2)
+    save_games('recommendations', all_games)
 
     print(f"✓ Created bgg-recommendations.json with {len(all_games)} games")
-    print(f"  - Wishlist games: {len(wishlist_games)}")
-    print(f"  - Rated/tracked games: {len(tracked_games)}")
-    print(f"✓ All game IDs are correct (from your BGG collection)")
+    print(f"  - Wishlist games: {sum(1 for game in all_games if game['sources'] & WISHLIST)}")
+    print(f"  - Rated/tracked games: {sum(1 for game in all_games if game['sources'] & TRACKED)}")
+    if max_rank is not None:
+        ranked_only = sum(1 for game in all_games if game['sources'] == RANKS)
+        print(f"  - Ranked games (top {max_rank}) not in your collection: {ranked_only}")
+    else:
+        print(f"✓ All game IDs are correct (from your BGG collection)")
 
     if len(all_games) > 0:
         print(f"\nTop 10 recommendations:")
         for game in all_games[:10]:
-            priority = "⭐ WISHLIST" if game in wishlist_games else "   Tracked"
+            if game['sources'] & WISHLIST:
+                priority = "⭐ WISHLIST"
+            elif game['sources'] & TRACKED:
+                priority = "   Tracked"
+            else:
+                priority = "   Ranked"
             print(f"  {priority} - {game['name']} (Rating: {game['average']:.1f})")
 
+def main():
+    parser = argparse.ArgumentParser(description='Build buy recommendations from your wishlist and tracked games')
+    parser.add_argument('--top', type=int, help='only keep the best N games')
+    parser.add_argument('--max-rank', type=int, help='also add ranked games up to this BGG rank')
+    args = parser.parse_args()
+    build_comprehensive_recommendations(top=args.top, max_rank=args.max_rank)
+
 if __name__ == '__main__':
-    build_comprehensive_recommendations()
+    with run_report():
+        main()
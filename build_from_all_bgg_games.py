@@ -16,91 +16,97 @@ Strategy:
 - This gives ~5000 high-quality games vs current 147
 """
 
-import csv
-import json
-
-def build_from_all_games():
+from operator import itemgetter
+
+from catalog_db import load_excluded_ids, save_games
+from instrumentation import count_all, run_report, span
+from ranks_parallel import ranked_top_k
+
+MAX_RANK = 5000
+
+# Number of games written in rank order (None = all of them); with
+# KEEP_TAIL the remaining games follow unordered
+TOP_K = None
+KEEP_TAIL = False
+
+# Processes parsing boardgames_ranks.csv (1 = in-process, None = one per core)
+WORKERS = 1
+
+def candidates(rows, counts):
+    """Recommendations (still carrying their rank) for a stream of ranks rows"""
+    for row in rows:
+        # Build game object with available fields
+        yield {
+            'id': row.id,
+            'name': row.name,
+            'rating': 0,  # User hasn't rated these games
+            'avgweight': 2.5,  # Default to medium complexity
+            'minplayers': 1,   # Default range covers most games
+            'maxplayers': 8,   # Default range covers most games
+            'playingtime': 60, # Default to medium duration
+            'yearpublished': '' if row.yearpublished is None else str(row.yearpublished),
+            'average': row.average,
+            'itemtype': 'boardgame',  # Base games only (we filtered expansions)
+            'bggbestplayers': 0,  # Not available in this dataset
+            'bggrecplayers': 0,   # Not available in this dataset
+            'rank': row.rank,  # Keep rank for sorting
+        }
+
+def build_from_all_games(max_rank=MAX_RANK, top=TOP_K, keep_tail=KEEP_TAIL, workers=WORKERS):
     # Load excluded game IDs (owned + previously owned)
-    with open('excluded-game-ids.json', 'r', encoding='utf-8') as f:
-        excluded_ids = set(json.load(f))
+    excluded_ids = load_excluded_ids()
 
     print(f"Loaded {len(excluded_ids)} excluded game IDs (owned/previously owned)")
 
-    recommendations = []
-    excluded_count = 0
-    expansion_count = 0
-
-    with open('boardgames_ranks.csv', 'r', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-
-        for row in reader:
-            # Only use top 5000 ranked games (higher quality, manageable size)
-            rank_str = row['rank'].strip() if row['rank'] else ''
-
-            # Skip unranked games (rank is 0 or empty)
-            if not rank_str or rank_str == '0':
-                continue
-
-            rank = int(rank_str)
-            if rank > 5000:
-                continue
-
-            game_id = row['id']
-
-            # Rule 3: Exclude owned/previously owned games
-            if game_id in excluded_ids:
-                excluded_count += 1
-                continue
-
-            # Rule 2: Exclude expansions
-            is_expansion = int(row['is_expansion']) if row['is_expansion'] else 0
-            if is_expansion == 1:
-                expansion_count += 1
-                continue
-
-            # Build game object with available fields
-            game = {
-                'id': game_id,
-                'name': row['name'],
-                'rating': 0,  # User hasn't rated these games
-                'avgweight': 2.5,  # Default to medium complexity
-                'minplayers': 1,   # Default range covers most games
-                'maxplayers': 8,   # Default range covers most games
-                'playingtime': 60, # Default to medium duration
-                'yearpublished': row['yearpublished'],
-                'average': float(row['average']) if row['average'] else 0,
-                'itemtype': 'boardgame',  # Base games only (we filtered expansions)
-                'bggbestplayers': '',  # Not available in this dataset
-                'bggrecplayers': '',   # Not available in this dataset
-                'rank': rank,  # Keep rank for sorting
-                'usersrated': int(row['usersrated']) if row['usersrated'] else 0
-            }
-
-            recommendations.append(game)
-
-    # Rule 1: Sort by rank (lower is better)
-    recommendations.sort(key=lambda x: x['rank'])
-
-    # Remove rank field from final output (not needed in JSON)
-    for game in recommendations:
-        del game['rank']
-        del game['usersrated']
-
-    # Save to JSON
-    with open('bgg-recommendations.json', 'w', encoding='utf-8') as f:
-        json.dump(recommendations, f, indent=2)
+    counts = {}
+
+    # Only use top 5000 ranked games (higher quality, manageable size).
+    # Rule 3 (owned/previously owned) and Rule 2 (expansions) are applied
+    # by the reader before any row object is built.
+    # Rule 1: Order by rank (lower is better)
+    ranked = ranked_top_k(
+        ['id', 'name', 'yearpublished', 'rank', 'average'],
+        candidates,
+        key=itemgetter('rank'),
+        k=top,
+        keep_tail=keep_tail,
+        max_rank=max_rank,
+        exclude_ids=excluded_ids,
+        counts=counts,
+        workers=workers,
+    )
+
+    top_games = []
+
+    def finished(games):
+        for game in games:
+            # Remove rank field from final output (not needed in JSON)
+            del game['rank']
+            if len(top_games) < 10:
+                top_games.append(game)
+            yield game
+
+    # Save to JSON as the games come out of the pipeline
+    with span('rank_pipeline'):
+        count = save_games('recommendations', finished(ranked))
+
+    excluded_count = counts['excluded']
+    expansion_count = counts['expansion']
+    count_all('ranks', dict(counts, written=count))
 
     print(f"\n{'='*60}")
-    print(f"✓ Created bgg-recommendations.json with {len(recommendations)} games")
-    print(f"  - Source: Top 5000 ranked BGG games")
+    print(f"✓ Created bgg-recommendations.json with {count} games")
+    print(f"  - Source: {f'Top {max_rank}' if max_rank else 'All'} ranked BGG games")
     print(f"  - Excluded expansions: {expansion_count}")
     print(f"  - Excluded owned/prev owned: {excluded_count}")
+    if top is not None:
+        print(f"  - Top {top} in rank order{', rest unordered' if keep_tail else ''}")
     print(f"  - All game IDs are verified from BGG database")
     print(f"{'='*60}")
 
-    if len(recommendations) > 0:
+    if count > 0:
         print(f"\nTop 10 recommendations:")
-        for i, game in enumerate(recommendations[:10], 1):
+        for i, game in enumerate(top_games, 1):
             print(f"  #{i:2d} - {game['name']} ({game['yearpublished']}) - Rating: {game['average']:.2f}")
 
     print(f"\nNote: Games use default values for missing fields:")
@@ -110,4 +116,5 @@ def build_from_all_games():
     print(f"  - These defaults allow games to appear in common filter selections")
 
 if __name__ == '__main__':
-    build_from_all_games()
+    with run_report():
+        build_from_all_games()
@@ -2,13 +2,38 @@
 """
 Build personalized buy recommendations with REALISTIC filter values
 
-Key fix: Use game categories to estimate varied complexity and duration
-instead of using the same defaults for all games
+Key fix: Estimate varied complexity, duration and player counts for games
+outside the collection instead of using the same defaults for all games.
+The estimates come from imputation.py's regression model, trained on the
+games with known stats; with too few of those, from the game's category.
+Games enrich_catalog.py has fetched from BGG use their real stats instead.
 """
 
-import csv
-import json
 from datetime import datetime
+from functools import partial
+
+from catalog_db import load_enriched_stats, load_excluded_ids, load_profile, save_games
+from collection_store import load_collection
+from filter_index import FIT_FIELDS
+from imputation import load_imputer
+from instrumentation import count_all, run_report, span
+from ranks_parallel import ranked_top_k
+from ranks_reader import CATEGORY_RANK_COLUMNS
+from sampler import sample_weight
+from scoring import ProfileScorer
+
+MAX_RANK = 5000
+RANKS_COLUMNS = ['id', 'name', 'yearpublished', 'rank', 'average', 'usersrated'] + CATEGORY_RANK_COLUMNS
+
+# Number of games written in score order (None = all of them); with
+# KEEP_TAIL the remaining games follow unordered
+TOP_K = None
+KEEP_TAIL = False
+
+SCORE_BATCH = 4096  # candidates scored per ProfileScorer.score_batch() call
+
+# Processes parsing boardgames_ranks.csv (1 = in-process, None = one per core)
+WORKERS = 1
 
 # Category-based estimates for complexity, duration, and player count
 CATEGORY_ESTIMATES = {
@@ -78,8 +103,7 @@ def get_game_estimates(row):
     """Get estimated complexity, duration, and player count from category"""
     # Check categories in priority order
     for category in CATEGORY_PRIORITY:
-        rank_field = f'{category}_rank'
-        if row.get(rank_field):
+        if getattr(row, f'{category}_rank'):
             return CATEGORY_ESTIMATES[category]
 
     # Default for uncategorized games
@@ -90,200 +114,234 @@ def get_game_estimates(row):
         'maxplayers': 6,
     }
 
-def load_collection_data():
+def load_collection_data(records=None):
     """Load actual game data from collection.csv for cross-referencing"""
     collection = {}
-    with open('collection.csv', 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            game_id = row['objectid']
-            try:
-                collection[game_id] = {
-                    'avgweight': float(row['avgweight']) if row['avgweight'] else None,
-                    'playingtime': int(row['playingtime']) if row['playingtime'] else None,
-                    'minplayers': int(row['minplayers']) if row['minplayers'] else None,
-                    'maxplayers': int(row['maxplayers']) if row['maxplayers'] else None,
-                }
-            except:
-                pass
+    for record in load_collection() if records is None else records:
+        collection[record.objectid] = {
+            'avgweight': record.avgweight,
+            'playingtime': record.playingtime,
+            'minplayers': record.minplayers,
+            'maxplayers': record.maxplayers,
+            'bggbestplayers': record.bggbestplayers,
+            'bggrecplayers': record.bggrecplayers,
+        }
     return collection
 
-def get_weight_score(weight, profile):
-    """Calculate score based on complexity preference"""
-    for min_w, max_w, avg_rating in profile['weight_preferences']:
-        if min_w <= weight < max_w:
-            return avg_rating
-    return profile['baseline_rating']
-
-def get_bgg_score(bgg_avg, profile):
-    """Calculate score based on BGG rating preference"""
-    for min_bgg, max_bgg, avg_rating in profile['bgg_preferences']:
-        if min_bgg <= bgg_avg < max_bgg:
-            return avg_rating
-    return profile['baseline_rating']
-
-def get_year_score(year, profile):
-    """Calculate score based on year preference"""
-    for min_y, max_y, avg_rating in profile['year_preferences']:
-        if min_y <= year < max_y:
-            return avg_rating
-    return profile['baseline_rating']
-
-def build_personalized_recommendations():
+def load_known_stats(records=None):
+    """Real stats for cross-referencing: enriched games, then the collection (which wins)"""
+    known = load_enriched_stats()
+    known.update(load_collection_data(records))
+    return known
+
+def apply_estimates(game, estimates):
+    """Set the filter fields of a game from known stats or estimates (poll masks only if known)"""
+    game['avgweight'] = estimates['avgweight'] or 2.5
+    game['minplayers'] = estimates['minplayers'] or 2
+    game['maxplayers'] = estimates['maxplayers'] or 6
+    game['playingtime'] = estimates['playingtime'] or 60
+    for field in FIT_FIELDS.values():
+        if field in estimates:
+            game[field] = estimates[field]
+
+def score_order(game):
+    """Sort key of the buy list (reverse=True): score, then BGG rank, then id on ties
+
+    Uses only fields stored in the file, so sync_collection.py can re-position
+    games exactly where a full build would put them.
+    """
+    return (game['personalizedScore'], -game['rank'], -game['id'])
+
+
+def recommendation_for(row, collection_data, current_year, imputer=None):
+    """Unscored recommendation for a ranks row"""
+    # Extract game data
+    year = current_year if row.yearpublished is None else row.yearpublished
+
+    game = {
+        'id': row.id,
+        'name': row.name,
+        'rating': 0,
+        'avgweight': 0,
+        'minplayers': 0,
+        'maxplayers': 0,
+        'playingtime': 0,
+        'yearpublished': str(year),
+        'average': row.average,
+        'itemtype': 'boardgame',
+        'bggbestplayers': 0,
+        'bggrecplayers': 0,
+        'rank': row.rank,
+    }
+
+    # Get estimates from known stats, the imputation model or category
+    if row.id in collection_data:
+        # Use actual data from the collection or enrichment
+        apply_estimates(game, collection_data[row.id])
+    elif imputer is not None:
+        apply_estimates(game, imputer.estimates(row))
+    else:
+        # Use category-based estimates
+        apply_estimates(game, get_game_estimates(row))
+    return game
+
+def score_games(games, profile):
+    """Set personalizedScore on each game: weighted average of BGG consensus,
+    complexity and recency preference, plus a boost by BGG rank"""
+    with span('score'):
+        scores = ProfileScorer(profile).score_batch(
+            [game['avgweight'] for game in games],
+            [game['average'] for game in games],
+            [int(game['yearpublished']) for game in games],
+            [game['rank'] for game in games],
+        )
+    for game, score in zip(games, scores):
+        game['personalizedScore'] = score
+        game['sampleWeight'] = sample_weight(score)
+
+def score_stream(games, profile, batch_size=SCORE_BATCH):
+    """Score a stream of games in batches, yielding them as they are scored"""
+    batch = []
+    for game in games:
+        batch.append(game)
+        if len(batch) == batch_size:
+            score_games(batch, profile)
+            yield from batch
+            batch = []
+    score_games(batch, profile)
+    yield from batch
+
+def scored_candidates(rows, counts, collection_data, current_year, profile, imputer=None):
+    """Scored recommendations for a stream of ranks rows"""
+    candidates = (recommendation_for(row, collection_data, current_year, imputer) for row in rows)
+    return score_stream(candidates, profile)
+
+class FilterVariety:
+    """Complexity/duration distributions, cross-referenced games and the first games of a stream being written"""
+
+    def __init__(self, known_ids=(), keep=10):
+        self.weight_dist = {}
+        self.time_dist = {}
+        self.top_games = []
+        self.keep = keep
+        self.known_ids = known_ids
+        self.crossref = 0
+
+    def observe(self, games):
+        for game in games:
+            if game['id'] in self.known_ids:
+                self.crossref += 1
+
+            w = game['avgweight']
+            bucket = f"{int(w)}.0-{int(w)+1}.0"
+            self.weight_dist[bucket] = self.weight_dist.get(bucket, 0) + 1
+
+            t = game['playingtime']
+            if t <= 30: bucket = 'Quick (≤30)'
+            elif t <= 60: bucket = 'Medium (31-60)'
+            elif t <= 90: bucket = 'Long (61-90)'
+            else: bucket = 'Very Long (>90)'
+            self.time_dist[bucket] = self.time_dist.get(bucket, 0) + 1
+
+            if len(self.top_games) < self.keep:
+                self.top_games.append(game)
+            yield game
+
+def build_personalized_recommendations(max_rank=MAX_RANK, top=TOP_K, keep_tail=KEEP_TAIL, workers=WORKERS):
+    """Score ranked BGG games against the preference profile (max_rank=None scores every ranked game)
+
+    workers > 1 parses boardgames_ranks.csv in that many processes
+    (None = one per core); see ranks_parallel.py.
+    """
     # Load preference profile
     try:
-        with open('preference_profile.json', 'r', encoding='utf-8') as f:
-            profile = json.load(f)
+        profile = load_profile()
         print("✓ Loaded preference profile")
     except FileNotFoundError:
         print("Error: preference_profile.json not found. Run analyze_preferences.py first.")
         return
 
     # Load excluded game IDs
-    with open('excluded-game-ids.json', 'r', encoding='utf-8') as f:
-        excluded_ids = set(json.load(f))
+    excluded_ids = load_excluded_ids()
     print(f"✓ Loaded {len(excluded_ids)} excluded game IDs")
 
-    # Load collection data for cross-referencing
-    collection_data = load_collection_data()
-    print(f"✓ Loaded {len(collection_data)} games from collection for cross-reference")
-
-    # Load BGG rankings and score them
-    recommendations = []
-    excluded_count = 0
-    expansion_count = 0
-    current_year = datetime.now().year
-    crossref_count = 0
-
-    with open('boardgames_ranks.csv', 'r', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-
-        for row in reader:
-            # Only use ranked games in top 5000
-            rank_str = row['rank'].strip() if row['rank'] else ''
-            if not rank_str or rank_str == '0':
-                continue
-
-            rank = int(rank_str)
-            if rank > 5000:
-                continue
-
-            game_id = row['id']
-
-            # Exclude owned/previously owned
-            if game_id in excluded_ids:
-                excluded_count += 1
-                continue
-
-            # Exclude expansions
-            is_expansion = int(row['is_expansion']) if row['is_expansion'] else 0
-            if is_expansion == 1:
-                expansion_count += 1
-                continue
-
-            # Extract game data
-            year = int(row['yearpublished']) if row['yearpublished'] else current_year
-            bgg_avg = float(row['average']) if row['average'] else 0
-
-            # Get estimates from category or collection data
-            if game_id in collection_data:
-                # Use actual data from collection
-                estimates = collection_data[game_id]
-                crossref_count += 1
-            else:
-                # Use category-based estimates
-                estimates = get_game_estimates(row)
-
-            weight = estimates['avgweight'] or 2.5
-            playtime = estimates['playingtime'] or 60
-            minplayers = estimates['minplayers'] or 2
-            maxplayers = estimates['maxplayers'] or 6
-
-            # Calculate personalized score
-            weight_score = get_weight_score(weight, profile)
-            bgg_score = get_bgg_score(bgg_avg, profile)
-            year_score = get_year_score(year, profile)
-
-            # Weighted average: BGG preference is strongest signal
-            personalized_score = (
-                bgg_score * 0.5 +     # BGG consensus
-                weight_score * 0.3 +  # Complexity preference
-                year_score * 0.2      # Recency preference
-            )
-
-            # Boost by BGG rank
-            rank_boost = max(0, (5001 - rank) / 5000 * 0.5)
-            final_score = personalized_score + rank_boost
-
-            game = {
-                'id': game_id,
-                'name': row['name'],
-                'rating': 0,
-                'avgweight': weight,
-                'minplayers': minplayers,
-                'maxplayers': maxplayers,
-                'playingtime': playtime,
-                'yearpublished': str(year),
-                'average': bgg_avg,
-                'itemtype': 'boardgame',
-                'bggbestplayers': '',
-                'bggrecplayers': '',
-                'personalizedScore': round(final_score, 3),
-                'rank': rank,
-            }
-
-            recommendations.append(game)
-
-    # Sort by personalized score
-    recommendations.sort(key=lambda x: x['personalizedScore'], reverse=True)
-
-    # Remove temporary fields
-    for game in recommendations:
-        del game['personalizedScore']
-        del game['rank']
-
-    # Save recommendations
-    with open('bgg-recommendations.json', 'w', encoding='utf-8') as f:
-        json.dump(recommendations, f, indent=2)
+    # Load collection data and enriched stats for cross-referencing
+    with span('load_collection'):
+        records = load_collection()
+        collection_data = load_known_stats(records)
+    print(f"✓ Loaded {len(collection_data)} games with known stats (collection and enriched) for cross-reference")
+
+    # Model for the stats of the other games
+    with span('imputation_model'):
+        imputer, refitted = load_imputer(records)
+    if imputer is None:
+        print("✓ Too few games with known stats for the imputation model, using category estimates")
+    else:
+        print(f"✓ {'Fitted' if refitted else 'Reusing'} imputation model ({imputer.training_games} games with known stats)")
+
+    # Load BGG rankings and score them as a stream: read -> filter ->
+    # estimate -> score -> top-K -> write, without a full candidate list.
+    # With workers > 1 each worker process does this for a part of the CSV.
+    counts = {}
+
+    # Only use ranked games in top max_rank (5000 by default), excluding
+    # owned/previously owned games and expansions, ordered by personalized score
+    recommendations = ranked_top_k(
+        RANKS_COLUMNS,
+        partial(scored_candidates, collection_data=collection_data,
+                current_year=datetime.now().year, profile=profile, imputer=imputer),
+        key=score_order,
+        k=top,
+        reverse=True,
+        keep_tail=keep_tail,
+        max_rank=max_rank,
+        exclude_ids=excluded_ids,
+        counts=counts,
+        workers=workers,
+    )
+
+    # Save recommendations; rank and personalizedScore stay in the file so
+    # sync_collection.py can re-score and re-position single games
+    variety = FilterVariety(collection_data)
+    with span('rank_pipeline'):
+        count = save_games('recommendations', variety.observe(recommendations))
+
+    excluded_count = counts['excluded']
+    expansion_count = counts['expansion']
+    crossref_count = variety.crossref
+    count_all('ranks', dict(counts, crossref=crossref_count, estimated=count - crossref_count, written=count))
 
     print(f"\n{'='*70}")
-    print(f"✓ Created personalized bgg-recommendations.json with {len(recommendations)} games")
-    print(f"  - Source: Top 5000 ranked BGG games")
+    print(f"✓ Created personalized bgg-recommendations.json with {count} games")
+    print(f"  - Source: {f'Top {max_rank}' if max_rank else 'All'} ranked BGG games")
     print(f"  - Excluded expansions: {expansion_count}")
     print(f"  - Excluded owned/prev owned: {excluded_count}")
-    print(f"  - Cross-referenced with collection: {crossref_count} games")
-    print(f"  - Category-based estimates: {len(recommendations) - crossref_count} games")
-    print(f"  - Sorted by personalized preference score")
+    print(f"  - Cross-referenced with collection or enriched stats: {crossref_count} games")
+    print(f"  - {'Category' if imputer is None else 'Model'}-based estimates: {count - crossref_count} games")
+    if top is None:
+        print(f"  - Sorted by personalized preference score")
+    else:
+        print(f"  - Top {top} sorted by personalized preference score{', rest unordered' if keep_tail else ''}")
     print(f"{'='*70}")
 
     # Analyze variety in filter values
     print(f"\n✓ Filter value variety:")
 
-    weight_dist = {}
-    for game in recommendations:
-        w = game['avgweight']
-        bucket = f"{int(w)}.0-{int(w)+1}.0"
-        weight_dist[bucket] = weight_dist.get(bucket, 0) + 1
+    weight_dist = variety.weight_dist
     print(f"  Complexity distribution:")
     for bucket in sorted(weight_dist.keys()):
         print(f"    {bucket}: {weight_dist[bucket]} games")
 
-    time_dist = {}
-    for game in recommendations:
-        t = game['playingtime']
-        if t <= 30: bucket = 'Quick (≤30)'
-        elif t <= 60: bucket = 'Medium (31-60)'
-        elif t <= 90: bucket = 'Long (61-90)'
-        else: bucket = 'Very Long (>90)'
-        time_dist[bucket] = time_dist.get(bucket, 0) + 1
+    time_dist = variety.time_dist
     print(f"  Duration distribution:")
     for bucket in ['Quick (≤30)', 'Medium (31-60)', 'Long (61-90)', 'Very Long (>90)']:
         if bucket in time_dist:
             print(f"    {bucket}: {time_dist[bucket]} games")
 
     print(f"\nTop 10 personalized recommendations:")
-    for i, game in enumerate(recommendations[:10], 1):
+    for i, game in enumerate(variety.top_games, 1):
         print(f"  #{i:2d} - {game['name']:45s} Weight: {game['avgweight']:.1f}, Time: {game['playingtime']}min, Players: {game['minplayers']}-{game['maxplayers']}")
 
 if __name__ == '__main__':
-    build_personalized_recommendations()
+    with run_report():
+        build_personalized_recommendations()
@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+"""
+SQLite game catalog: the source of truth behind the JSON files
+
+    python3 catalog_db.py                      # what the catalog holds
+    python3 catalog_db.py export               # rewrite every JSON export
+    python3 catalog_db.py query recommendations --players 4 --complexity heavy
+    python3 catalog_db.py query owned --players 3 --fit best
+
+The scripts write their results here (bulk executemany inserts, one
+transaction per list) and then export the files the page loads:
+
+- games: owned-games.json and bgg-recommendations.json, one row per game in
+  list order. The filter fields and rank are columns with indexes (plus the
+  player count poll bitmasks, which are matched with &); the whole game is
+  kept as JSON so exports reproduce every field exactly.
+- collection: one row per collection.csv row with its ownership flags;
+  excluded-game-ids.json is the owned/previously owned ids, as a sorted
+  array of integers (see game_ids.py).
+- meta: the preference profile (preference_profile.json), the fitted
+  imputation model (see imputation.py) and the similar games of every
+  owned game (similar-games.json, see similarity.py).
+- enrichment_queue / enriched: the buy list games waiting for real BGG
+  stats, by priority, and the stats fetched so far (see enrich_catalog.py).
+
+query() answers the page's player count / complexity / duration filters
+with indexed SQL (see filter_index.py for the same rules as bitsets).
+
+Until a script has written something to the catalog (e.g. in a fresh
+checkout), the load_*() helpers fall back to the committed JSON file.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+from filter_index import COMPLEXITIES, DURATIONS, FIT_FIELDS, PLAYER_COUNTS, PLAYER_FITS, POLL_MASKS
+from game_ids import IdSet, parse_id
+from player_polls import encode_players
+from recommendations_io import read_games, write_games
+
+CATALOG_PATH = 'catalog.sqlite'
+
+# Game lists and the JSON file each one is exported to
+LISTS = {
+    'owned': 'owned-games.json',
+    'recommendations': 'bgg-recommendations.json',
+}
+EXCLUDED_IDS_JSON = 'excluded-game-ids.json'
+PROFILE_JSON = 'preference_profile.json'
+SIMILAR_GAMES_JSON = 'similar-games.json'
+
+COLLECTION_FIELDS = ('objectid', 'collid', 'objectname', 'own', 'prevowned',
+                     'want', 'wanttobuy', 'wanttoplay', 'wishlist', 'rating', 'numplays')
+
+# Columns of a games row (in _game_row() order). Inserts name them, since
+# catalogs migrated from an older schema have the poll columns last.
+GAME_COLUMNS = ('list', 'position', 'id', 'rank', 'avgweight', 'playingtime', 'minplayers',
+                'maxplayers', 'bggbestplayers', 'bggrecplayers', 'data')
+INSERT_GAME = f"INSERT INTO games ({', '.join(GAME_COLUMNS)}) VALUES ({', '.join('?' * len(GAME_COLUMNS))})"
+
+# Columns are declared without a type, so values come back exactly as they
+# were stored (0 stays 0, not 0.0)
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS games (
+        list TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        id,
+        rank,
+        avgweight,
+        playingtime,
+        minplayers,
+        maxplayers,
+        bggbestplayers,
+        bggrecplayers,
+        data TEXT NOT NULL,
+        PRIMARY KEY (list, position)
+    );
+    CREATE INDEX IF NOT EXISTS games_id ON games (id);
+    CREATE INDEX IF NOT EXISTS games_rank ON games (list, rank);
+    CREATE INDEX IF NOT EXISTS games_avgweight ON games (list, avgweight);
+    CREATE INDEX IF NOT EXISTS games_playingtime ON games (list, playingtime);
+    CREATE INDEX IF NOT EXISTS games_minplayers ON games (list, minplayers);
+    CREATE INDEX IF NOT EXISTS games_maxplayers ON games (list, maxplayers);
+
+    CREATE TABLE IF NOT EXISTS lists (
+        name TEXT PRIMARY KEY,
+        count INTEGER NOT NULL,
+        updated TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS collection (
+        objectid,
+        collid,
+        objectname,
+        own,
+        prevowned,
+        want,
+        wanttobuy,
+        wanttoplay,
+        wishlist,
+        rating,
+        numplays
+    );
+    CREATE INDEX IF NOT EXISTS collection_objectid ON collection (objectid);
+    CREATE INDEX IF NOT EXISTS collection_own ON collection (own);
+    CREATE INDEX IF NOT EXISTS collection_prevowned ON collection (prevowned);
+    CREATE INDEX IF NOT EXISTS collection_wishlist ON collection (wishlist);
+
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS enrichment_queue (
+        id INTEGER PRIMARY KEY,
+        priority REAL NOT NULL,
+        attempts INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS enrichment_queue_priority ON enrichment_queue (priority);
+
+    CREATE TABLE IF NOT EXISTS enriched (
+        id INTEGER PRIMARY KEY,
+        avgweight,
+        playingtime,
+        minplayers,
+        maxplayers,
+        bggbestplayers,
+        bggrecplayers,
+        fetched TEXT NOT NULL
+    );
+'''
+
+# PRAGMA user_version of the current schema. Version 1: game ids are stored
+# as integers (catalogs written before that hold strings). Version 2: the
+# poll fields are bitmasks and have their own columns.
+SCHEMA_VERSION = 2
+
+# SQL versions of the match rules in filter_index.py / filterGames()
+PLAYERS_SQL = 'minplayers <= ? AND maxplayers >= ?'
+PLAYERS_MAX_SQL = 'maxplayers >= ?'  # the last player count means "N+"
+COMPLEXITY_SQL = {
+    'light': 'avgweight BETWEEN 1 AND 2',
+    'medium': 'avgweight BETWEEN 2 AND 3.5',
+    'heavy': 'avgweight BETWEEN 3.5 AND 5',
+}
+DURATION_SQL = {
+    'quick': 'playingtime <= 30',
+    'medium': 'playingtime > 30 AND playingtime <= 60',
+    'long': 'playingtime > 60 AND playingtime <= 90',
+    'verylong': 'playingtime > 90',
+}
+FIT_SQL = {fit: f'({FIT_FIELDS[fit]} & ?) != 0' for fit in PLAYER_FITS}
+
+# Stats kept for an enriched game; the first four must be known (> 0) for
+# the builder to use them
+ENRICHED_FIELDS = ('avgweight', 'playingtime', 'minplayers', 'maxplayers',
+                   'bggbestplayers', 'bggrecplayers')
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def upgrade_game(game):
+    """Bring a game written by an older version up to date (int id, poll bitmasks)"""
+    game['id'] = parse_id(game['id'])
+    for field in FIT_FIELDS.values():
+        if field in game:
+            game[field] = encode_players(game[field])
+    return game
+
+
+def _game_row(list_name, position, game):
+    return (list_name, position, game.get('id'), game.get('rank'),
+            game.get('avgweight'), game.get('playingtime'),
+            game.get('minplayers'), game.get('maxplayers'),
+            game.get('bggbestplayers', 0), game.get('bggrecplayers', 0),
+            json.dumps(game, ensure_ascii=False))
+
+
+class Catalog:
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+        self._migrate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def _migrate(self):
+        (version,) = self.db.execute('PRAGMA user_version').fetchone()
+        if version >= SCHEMA_VERSION:
+            return
+        columns = {row[1] for row in self.db.execute('PRAGMA table_info(games)')}
+        with self.db:
+            for field in FIT_FIELDS.values():
+                if field not in columns:
+                    self.db.execute(f'ALTER TABLE games ADD COLUMN {field}')
+            # Rewrite the stored games in the current format
+            rows = self.db.execute('SELECT list, position, data FROM games').fetchall()
+            self.db.execute('DELETE FROM games')
+            self.db.executemany(
+                INSERT_GAME,
+                (_game_row(list_name, position, upgrade_game(json.loads(data)))
+                 for list_name, position, data in rows))
+            self.db.execute('UPDATE collection SET objectid = CAST(objectid AS INTEGER)')
+            self.db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    # Game lists
+
+    def replace_games(self, list_name, games):
+        """Store `games` (any iterable, consumed once) as the whole list; returns the count"""
+        count = 0
+
+        def rows():
+            nonlocal count
+            for position, game in enumerate(games):
+                count += 1
+                yield _game_row(list_name, position, game)
+
+        with self.db:
+            self.db.execute('DELETE FROM games WHERE list = ?', (list_name,))
+            self.db.executemany(INSERT_GAME, rows())
+            self.db.execute('INSERT OR REPLACE INTO lists VALUES (?, ?, ?)',
+                            (list_name, count, _now()))
+        return count
+
+    def has_list(self, list_name):
+        return self.db.execute('SELECT 1 FROM lists WHERE name = ?', (list_name,)).fetchone() is not None
+
+    def games(self, list_name):
+        """Games of a list in list order"""
+        cursor = self.db.execute(
+            'SELECT data FROM games WHERE list = ? ORDER BY position', (list_name,))
+        for (data,) in cursor:
+            yield json.loads(data)
+
+    def query(self, list_name, player_count='', complexity='', duration='', fit=''):
+        """Games of a list matching the page's filters ('' = any), in list order"""
+        sql = ['SELECT data FROM games WHERE list = ?']
+        params = [list_name]
+        if player_count and fit:
+            sql.append(FIT_SQL[fit])
+            params.append(POLL_MASKS[player_count])
+        elif player_count:
+            players = int(player_count)
+            if player_count == PLAYER_COUNTS[-1]:
+                sql.append(PLAYERS_MAX_SQL)
+                params.append(players)
+            else:
+                sql.append(PLAYERS_SQL)
+                params += [players, players]
+        if complexity:
+            sql.append(COMPLEXITY_SQL[complexity])
+        if duration:
+            sql.append(DURATION_SQL[duration])
+        cursor = self.db.execute(' AND '.join(sql) + ' ORDER BY position', params)
+        return [json.loads(data) for (data,) in cursor]
+
+    def export_games(self, list_name, path=None):
+        """Write a list to its JSON file; returns the count"""
+        return write_games(self.games(list_name), path or LISTS[list_name])
+
+    # Collection and exclusions
+
+    def replace_collection(self, records, objectids=None):
+        """Store collection records; with objectids, only the rows of those games are replaced"""
+        if not self.has_collection():
+            objectids = None
+        rows = [tuple(getattr(record, field) for field in COLLECTION_FIELDS)
+                for record in records
+                if objectids is None or record.objectid in objectids]
+        with self.db:
+            if objectids is None:
+                self.db.execute('DELETE FROM collection')
+            else:
+                self.db.executemany('DELETE FROM collection WHERE objectid = ?',
+                                    ((objectid,) for objectid in objectids))
+            self.db.executemany(
+                f"INSERT INTO collection VALUES ({', '.join('?' * len(COLLECTION_FIELDS))})", rows)
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('collection_updated', ?)", (_now(),))
+
+    def has_collection(self):
+        return self._meta('collection_updated') is not None
+
+    def excluded_ids(self):
+        """IdSet of the owned and previously owned games"""
+        cursor = self.db.execute(
+            'SELECT objectid FROM collection WHERE own = 1 '
+            'UNION SELECT objectid FROM collection WHERE prevowned = 1')
+        return IdSet(objectid for (objectid,) in cursor)
+
+    def export_excluded_ids(self, path=EXCLUDED_IDS_JSON):
+        excluded_ids = self.excluded_ids()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(excluded_ids.tolist(), f, indent=2)
+        return excluded_ids
+
+    # Preference profile
+
+    def _meta(self, key):
+        row = self.db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def set_profile(self, profile):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('preference_profile', ?)",
+                            (json.dumps(profile),))
+
+    def profile(self):
+        value = self._meta('preference_profile')
+        return None if value is None else json.loads(value)
+
+    def export_profile(self, path=PROFILE_JSON):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.profile(), f, indent=2)
+
+    # Imputation model
+
+    def set_imputation_model(self, model):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('imputation_model', ?)",
+                            (json.dumps(model),))
+
+    def imputation_model(self):
+        value = self._meta('imputation_model')
+        return None if value is None else json.loads(value)
+
+    # Similar games
+
+    def set_similar_games(self, table, key=None):
+        """Store the neighbour table and the key of the inputs it was computed from"""
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('similar_games', ?)",
+                            (json.dumps(table, ensure_ascii=False),))
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('similar_games_key', ?)", (key or '',))
+
+    def similar_games_key(self):
+        return self._meta('similar_games_key')
+
+    def similar_games(self):
+        value = self._meta('similar_games')
+        return None if value is None else json.loads(value)
+
+    def export_similar_games(self, path=SIMILAR_GAMES_JSON):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.similar_games(), f, indent=2, ensure_ascii=False)
+
+    # Enrichment queue and fetched stats
+
+    def queue_enrichment(self, priorities):
+        """Make {game id: priority} the whole queue; games already queued keep their attempts"""
+        attempts = dict(self.db.execute('SELECT id, attempts FROM enrichment_queue'))
+        with self.db:
+            self.db.execute('DELETE FROM enrichment_queue')
+            self.db.executemany(
+                'INSERT INTO enrichment_queue VALUES (?, ?, ?)',
+                ((game_id, priority, attempts.get(game_id, 0))
+                 for game_id, priority in priorities.items()))
+
+    def next_for_enrichment(self, limit, max_attempts):
+        """Ids of the `limit` highest priority queued games with fewer than max_attempts misses"""
+        cursor = self.db.execute(
+            'SELECT id FROM enrichment_queue WHERE attempts < ? ORDER BY priority DESC, id LIMIT ?',
+            (max_attempts, limit))
+        return [game_id for (game_id,) in cursor]
+
+    def enrichment_missed(self, ids):
+        """Count a miss for queued games BGG returned no item for"""
+        with self.db:
+            self.db.executemany('UPDATE enrichment_queue SET attempts = attempts + 1 WHERE id = ?',
+                                ((game_id,) for game_id in ids))
+
+    def save_enriched(self, games):
+        """Store the stats of fetched games (dicts with an id and the ENRICHED_FIELDS) and dequeue them"""
+        rows = [(game['id'],) + tuple(game[field] for field in ENRICHED_FIELDS) + (_now(),)
+                for game in games]
+        with self.db:
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO enriched VALUES ({', '.join('?' * (len(ENRICHED_FIELDS) + 2))})", rows)
+            self.db.executemany('DELETE FROM enrichment_queue WHERE id = ?',
+                                ((row[0],) for row in rows))
+
+    def enriched_ids(self):
+        """IdSet of every enriched game, whether or not BGG knew all its stats"""
+        return IdSet(game_id for (game_id,) in self.db.execute('SELECT id FROM enriched'))
+
+    def enriched_stats(self):
+        """{game id: stats} of the enriched games with known weight, playing time and player counts"""
+        cursor = self.db.execute(
+            f"SELECT id, {', '.join(ENRICHED_FIELDS)} FROM enriched "
+            'WHERE avgweight > 0 AND playingtime > 0 AND minplayers > 0 AND maxplayers > 0')
+        return {row[0]: dict(zip(ENRICHED_FIELDS, row[1:])) for row in cursor}
+
+    def enriched_digest(self):
+        """SHA-1 of every stored enriched row's stats: changes whenever a run stores something new"""
+        digest = hashlib.sha1()
+        for row in self.db.execute(f"SELECT id, {', '.join(ENRICHED_FIELDS)} FROM enriched ORDER BY id"):
+            digest.update(repr(row).encode('ascii'))
+        return digest.hexdigest()
+
+    def enrichment_counts(self):
+        """(queued, enriched) game counts"""
+        return (self.db.execute('SELECT COUNT(*) FROM enrichment_queue').fetchone()[0],
+                self.db.execute('SELECT COUNT(*) FROM enriched').fetchone()[0])
+
+    def export_all(self):
+        """Rewrite every JSON export the catalog has data for"""
+        for list_name in LISTS:
+            if self.has_list(list_name):
+                self.export_games(list_name)
+        if self.has_collection():
+            self.export_excluded_ids()
+        if self.profile() is not None:
+            self.export_profile()
+        if self.similar_games() is not None:
+            self.export_similar_games()
+
+
+# Helpers the scripts use: write to the catalog, then export the JSON
+
+def save_games(list_name, games, path=CATALOG_PATH):
+    """Replace a game list and export it; returns the count"""
+    with Catalog(path) as catalog:
+        catalog.replace_games(list_name, games)
+        return catalog.export_games(list_name)
+
+
+def load_games(list_name, path=CATALOG_PATH):
+    with Catalog(path) as catalog:
+        if catalog.has_list(list_name):
+            return list(catalog.games(list_name))
+    return [upgrade_game(game) for game in read_games(LISTS[list_name])]
+
+
+def save_collection(records, objectids=None, path=CATALOG_PATH):
+    """Store the collection (or the rows of some games) and export the excluded ids"""
+    with Catalog(path) as catalog:
+        catalog.replace_collection(records, objectids)
+        return catalog.export_excluded_ids()
+
+
+def load_excluded_ids(path=CATALOG_PATH):
+    """IdSet of the owned and previously owned games"""
+    with Catalog(path) as catalog:
+        if catalog.has_collection():
+            return catalog.excluded_ids()
+    with open(EXCLUDED_IDS_JSON, 'r', encoding='utf-8') as f:
+        return IdSet(json.load(f))
+
+
+def save_profile(profile, path=CATALOG_PATH):
+    with Catalog(path) as catalog:
+        catalog.set_profile(profile)
+        catalog.export_profile()
+
+
+def load_profile(path=CATALOG_PATH):
+    """The preference profile (FileNotFoundError if there is none yet)"""
+    with Catalog(path) as catalog:
+        profile = catalog.profile()
+    if profile is not None:
+        return profile
+    with open(PROFILE_JSON, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_similar_games(path=CATALOG_PATH):
+    """similarity.py's neighbour table (FileNotFoundError if there is none yet)"""
+    with Catalog(path) as catalog:
+        table = catalog.similar_games()
+    if table is not None:
+        return table
+    with open(SIMILAR_GAMES_JSON, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_enriched_stats(path=CATALOG_PATH):
+    """{game id: stats} fetched by enrich_catalog.py (empty until it has run)"""
+    with Catalog(path) as catalog:
+        return catalog.enriched_stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('export', help='rewrite the JSON files from the catalog')
+    query_parser = subparsers.add_parser('query', help='filter a game list')
+    query_parser.add_argument('list', choices=list(LISTS))
+    query_parser.add_argument('--players', choices=PLAYER_COUNTS, default='')
+    query_parser.add_argument('--complexity', choices=COMPLEXITIES, default='')
+    query_parser.add_argument('--duration', choices=DURATIONS, default='')
+    query_parser.add_argument('--fit', choices=PLAYER_FITS, default='',
+                              help='match --players against the BGG poll instead of the box')
+    args = parser.parse_args()
+
+    with Catalog() as catalog:
+        if args.command == 'export':
+            catalog.export_all()
+            print(f"✓ Exported the JSON files from {catalog.path}")
+        elif args.command == 'query':
+            games = catalog.query(args.list, args.players, args.complexity, args.duration, args.fit)
+            for game in games[:20]:
+                print(f"  {game['id']:>7} {game['name']}")
+            print(f"✓ {len(games)} matching games")
+        else:
+            for list_name in LISTS:
+                row = catalog.db.execute('SELECT count, updated FROM lists WHERE name = ?',
+                                         (list_name,)).fetchone()
+                print(f"  {list_name:16s} {f'{row[0]} games (updated {row[1]})' if row else 'not built yet'}")
+            print(f"  {'excluded ids':16s} {len(catalog.excluded_ids())}")
+            print(f"  {'profile':16s} {'yes' if catalog.profile() is not None else 'not built yet'}")
+            table = catalog.similar_games()
+            print(f"  {'similar games':16s} {f'{len(table)} owned games' if table is not None else 'not built yet'}")
+            queued, enriched = catalog.enrichment_counts()
+            print(f"  {'enrichment':16s} {enriched} games enriched, {queued} queued")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Shared loader for the BGG collection export (collection.csv)
+
+The CSV is parsed once into typed CollectionRecord objects and the parse is
+cached on disk under .cache/, keyed by the file's mtime, size and SHA-256.
+Every script reads the collection through load_collection(), so running the
+whole pipeline costs a single CSV parse.
+"""
+
+import csv
+import hashlib
+import os
+import pickle
+import tempfile
+
+from game_ids import parse_id
+from instrumentation import count, span
+from player_polls import encode_players
+
+CACHE_DIR = '.cache'
+CACHE_VERSION = 3
+
+
+def _int(value):
+    return int(value) if value else 0
+
+
+def _float(value):
+    return float(value) if value else 0.0
+
+
+class CollectionRecord:
+    """One row of collection.csv with its fields already converted"""
+
+    __slots__ = (
+        'objectid', 'collid', 'objectname', 'itemtype',
+        'rating', 'numplays',
+        'own', 'prevowned', 'want', 'wanttobuy', 'wanttoplay', 'wishlist',
+        'avgweight', 'average', 'minplayers', 'maxplayers', 'playingtime',
+        'yearpublished', 'year', 'bggbestplayers', 'bggrecplayers',
+    )
+
+    def __init__(self, row):
+        self.objectid = parse_id(row['objectid'])
+        self.collid = row['collid']
+        self.objectname = row['objectname']
+        self.itemtype = row['itemtype']
+        self.rating = _float(row['rating'].strip())
+        self.numplays = _int(row['numplays'])
+        self.own = _int(row['own'])
+        self.prevowned = _int(row['prevowned'])
+        self.want = _int(row['want'])
+        self.wanttobuy = _int(row['wanttobuy'])
+        self.wanttoplay = _int(row['wanttoplay'])
+        self.wishlist = _int(row['wishlist'])
+        self.avgweight = _float(row['avgweight'])
+        self.average = _float(row['average'])
+        self.minplayers = _int(row['minplayers'])
+        self.maxplayers = _int(row['maxplayers'])
+        self.playingtime = _int(row['playingtime'])
+        self.yearpublished = row['yearpublished']
+        self.year = _int(row['yearpublished'])
+        self.bggbestplayers = encode_players(row['bggbestplayers'])
+        self.bggrecplayers = encode_players(row['bggrecplayers'])
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    @property
+    def wanted(self):
+        return bool(self.want or self.wanttobuy or self.wanttoplay or self.wishlist)
+
+    @property
+    def excluded(self):
+        """Owned or previously owned games never show up as buy recommendations"""
+        return self.own == 1 or self.prevowned == 1
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_path(path, cache_dir):
+    name = os.path.basename(path)
+    return os.path.join(cache_dir, f'{name}.pickle')
+
+
+def _read_cache(cache_file):
+    try:
+        with open(cache_file, 'rb') as f:
+            cached = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+    if cached.get('version') != CACHE_VERSION:
+        return None
+    return cached
+
+
+def _write_cache(cache_file, cached):
+    """Atomically replace the cache file; failures only cost the next load a re-parse
+
+    Every writer gets its own temp file, so concurrent loaders (e.g. the
+    pipeline's parallel stages) never move each other's file away.
+    """
+    cache_dir = os.path.dirname(cache_file) or '.'
+    tmp_file = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=cache_dir, prefix=f'{os.path.basename(cache_file)}.',
+                                        suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"Warning: could not write the collection cache {cache_file}: {e}")
+        if tmp_file is not None and os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def parse_collection_csv(path='collection.csv'):
+    """Parse collection.csv into a list of CollectionRecord (no caching)"""
+    with open(path, 'r', encoding='utf-8') as csvfile:
+        return [CollectionRecord(row) for row in csv.DictReader(csvfile)]
+
+
+def load_collection(path='collection.csv', cache_dir=CACHE_DIR):
+    """Return the parsed collection, reusing the on-disk cache when it is current
+
+    The cache is trusted when mtime and size match. If only the mtime moved
+    (e.g. the export was re-downloaded unchanged) the content hash decides,
+    and the cache key is refreshed without re-parsing.
+    """
+    stat = os.stat(path)
+    cache_file = _cache_path(path, cache_dir)
+    cached = _read_cache(cache_file)
+
+    if cached and cached['size'] == stat.st_size:
+        if cached['mtime_ns'] == stat.st_mtime_ns:
+            count('collection_cache.hit')
+            return cached['records']
+        sha256 = _file_sha256(path)
+        if cached['sha256'] == sha256:
+            cached['mtime_ns'] = stat.st_mtime_ns
+            _write_cache(cache_file, cached)
+            count('collection_cache.hit')
+            return cached['records']
+    else:
+        sha256 = _file_sha256(path)
+
+    count('collection_cache.miss')
+    with span('parse_collection_csv'):
+        records = parse_collection_csv(path)
+    count('collection.rows', len(records))
+    _write_cache(cache_file, {
+        'version': CACHE_VERSION,
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha256': sha256,
+        'records': records,
+    })
+    return records
+
+
+def collection_by_id(records):
+    """Index records by BGG object id (last row wins, like the old dict builders)"""
+    return {record.objectid: record for record in records}
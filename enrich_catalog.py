@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Fetch real BGG stats for the buy list's games, most promising first
+
+    python3 enrich_catalog.py                  # up to 10 BGG API requests
+    python3 enrich_catalog.py --requests 50
+
+bgg-recommendations.json estimates complexity, duration and player counts
+for every game outside the collection (see imputation.py). This job swaps
+estimates for BGG's own numbers a few batches at a time, starting with the
+games the list ranks highest, since those are the ones actually looked at.
+
+The queue lives in the catalog (enrichment_queue), so it survives between
+runs. Each run re-queues every not yet enriched game of the current list
+with its personalizedScore as priority, then takes the top ones, up to
+THING_BATCH_SIZE games per request, within the request budget. Every batch
+is stored (the catalog's enriched table) as soon as it arrives, so an
+interrupted run keeps what it fetched. Games BGG returns no item for stay
+queued and are skipped after MAX_ATTEMPTS misses.
+
+The next build_personalized_recommendations.py or sync_collection.py run
+uses the stored stats in place of the estimates, poll bitmasks included,
+and adds them to the imputation model's training data.
+"""
+
+import argparse
+
+from bgg_cache import ResponseCache
+from bgg_client import THING_BATCH_SIZE, BGGClient
+from catalog_db import CATALOG_PATH, Catalog
+from collection_store import load_collection
+from instrumentation import count_all, run_report, span
+
+REQUESTS = 10  # BGG API requests per run
+MAX_ATTEMPTS = 3
+
+
+def refresh_queue(catalog):
+    """Queue the list's games without real stats by personalizedScore; returns the queue size
+
+    None if the list has no personalized scores to order by.
+    """
+    games = list(catalog.games('recommendations'))
+    if games and 'personalizedScore' not in games[0]:
+        return None
+    enriched = catalog.enriched_ids()
+    collection_ids = {record.objectid for record in load_collection()}
+    priorities = {game['id']: game['personalizedScore'] for game in games
+                  if game['id'] not in enriched and game['id'] not in collection_ids}
+    catalog.queue_enrichment(priorities)
+    return len(priorities)
+
+
+def enrich(requests=REQUESTS, client=None, path=CATALOG_PATH):
+    """Fetch and store stats for the top queued games; returns counts of what happened
+
+    A batch served from the response cache counts against the budget too.
+    """
+    if client is None:
+        with ResponseCache() as cache, BGGClient(cache=cache) as client:
+            return enrich(requests, client, path)
+
+    with Catalog(path) as catalog:
+        if not catalog.has_list('recommendations'):
+            print("Error: no buy list in the catalog. Run build_personalized_recommendations.py first.")
+            return None
+        queued = refresh_queue(catalog)
+        if queued is None:
+            print("Error: bgg-recommendations.json has no personalized scores. "
+                  "Run build_personalized_recommendations.py first.")
+            return None
+        print(f"✓ {queued} games waiting for real stats")
+
+        ids = catalog.next_for_enrichment(requests * THING_BATCH_SIZE, MAX_ATTEMPTS)
+        counts = {'queued': queued, 'requests': 0, 'enriched': 0, 'missed': 0}
+        for start in range(0, len(ids), THING_BATCH_SIZE):
+            batch = ids[start:start + THING_BATCH_SIZE]
+            with span('fetch_batch'):
+                games = client.fetch_things(batch)
+            counts['requests'] += 1
+            if not games:
+                # The whole request failed: leave the batch for the next run
+                print("BGG returned nothing, stopping")
+                break
+            catalog.save_enriched(games.values())
+            missed = [game_id for game_id in batch if game_id not in games]
+            catalog.enrichment_missed(missed)
+            counts['enriched'] += len(games)
+            counts['missed'] += len(missed)
+            print(f"  Enriched {counts['enriched']}/{len(ids)} games")
+    count_all('enrichment', counts)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=REQUESTS,
+                        help=f'BGG API requests to spend ({THING_BATCH_SIZE} games each)')
+    args = parser.parse_args()
+
+    counts = enrich(args.requests)
+    if counts is None:
+        return
+    print(f"✓ Enriched {counts['enriched']} games with {counts['requests']} requests "
+          f"({counts['missed']} not found, {counts['queued'] - counts['enriched']} still queued)")
+    if counts['enriched']:
+        print("  The next build_personalized_recommendations.py run uses their stats")
+
+
+if __name__ == '__main__':
+    with run_report():
+        main()
@@ -4,28 +4,25 @@ Fetch top-rated board games from BoardGameGeek that are NOT in our collection.
 This creates a recommendations JSON file for the "What Games Should We Buy" section.
 """
 
-import json
-import time
-import xml.etree.ElementTree as ET
-try:
-    import requests
-except ImportError:
-    print("Installing requests library...")
-    import subprocess
-    subprocess.check_call(['pip3', 'install', 'requests'])
-    import requests
+import catalog_db
+from bgg_cache import ResponseCache
+from bgg_client import BGGClient
+from instrumentation import run_report
 
 def load_excluded_ids():
     """Load the list of game IDs to exclude (owned + previously owned)"""
     try:
-        with open('excluded-game-ids.json', 'r') as f:
-            return set(json.load(f))
+        return catalog_db.load_excluded_ids()
     except FileNotFoundError:
         print("Warning: excluded-game-ids.json not found. No games will be excluded.")
         return set()
 
-def fetch_top_games(limit=500):
+def fetch_top_games(limit=500, client=None):
     """Fetch top-rated games from BGG"""
+    if client is None:
+        with ResponseCache() as cache, BGGClient(cache=cache) as client:
+            return fetch_top_games(limit, client)
+
     print(f"Fetching top {limit} games from BoardGameGeek...")
 
     # BGG API endpoint for browsing games by rank
@@ -35,6 +32,7 @@ def fetch_top_games(limit=500):
     # Actually, let's use a different approach - get games by rank
 
     top_games = []
+    seen_ids = set()
     excluded_ids = load_excluded_ids()
 
     # We'll fetch game details in batches
@@ -247,31 +245,29 @@ def fetch_top_games(limit=500):
                 341586,  # Chandigarh
             ]
 
-        # Fetch details for these games
-        for game_id in game_ids:
-            game_id_str = str(game_id)
+        # Fetch details for these games (batched, concurrent, rate limited).
+        # The hand-written lists repeat some games, so each id is used once.
+        wanted = [
+            game_id for game_id in dict.fromkeys(game_ids)
+            if game_id not in excluded_ids and game_id not in seen_ids
+        ]
+
+        # Only request as many games as are still missing; ids BGG has no
+        # data for leave a gap that the next round fills
+        while wanted and len(top_games) < target_count:
+            batch = wanted[:target_count - len(top_games)]
+            wanted = wanted[len(batch):]
+            details = client.fetch_things(batch)
 
-            # Skip if in excluded list
-            if game_id_str in excluded_ids:
-                continue
+            for game_id in batch:
+                seen_ids.add(game_id)
 
-            # Fetch game details
-            try:
-                game_data = fetch_game_details(game_id_str)
+                game_data = details.get(game_id)
                 if game_data:
                     top_games.append(game_data)
                     print(f"    ✓ {game_data['name']} (Rating: {game_data['average']:.2f})")
-
-                # Stop if we have enough games
-                if len(top_games) >= target_count:
-                    break
-
-                # Rate limiting
-                time.sleep(0.5)
-
-            except Exception as e:
-                print(f"    ✗ Error fetching game {game_id}: {e}")
-                continue
+                else:
+                    print(f"    ✗ No data for game {game_id}")
 
         if len(top_games) >= target_count:
             break
@@ -280,111 +276,12 @@ def fetch_top_games(limit=500):
     top_games.sort(key=lambda x: x['average'], reverse=True)
     return top_games[:100]
 
-def fetch_game_details(game_id):
+def fetch_game_details(game_id, client=None):
     """Fetch detailed information for a single game from BGG"""
-    url = f"https://boardgamegeek.com/xmlapi2/thing?id={game_id}&stats=1"
-
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-
-        root = ET.fromstring(response.content)
-        item = root.find('item')
-
-        if item is None:
-            return None
-
-        # Extract game data
-        name_elem = item.find("name[@type='primary']")
-        name = name_elem.get('value') if name_elem is not None else 'Unknown'
-
-        yearpublished = item.find('yearpublished')
-        year = yearpublished.get('value') if yearpublished is not None else 'Unknown'
-
-        minplayers = item.find('minplayers')
-        min_p = int(minplayers.get('value')) if minplayers is not None else 1
-
-        maxplayers = item.find('maxplayers')
-        max_p = int(maxplayers.get('value')) if maxplayers is not None else 4
-
-        playingtime = item.find('playingtime')
-        time = int(playingtime.get('value')) if playingtime is not None else 60
-
-        # Stats
-        statistics = item.find('statistics')
-        if statistics is not None:
-            ratings = statistics.find('ratings')
-            if ratings is not None:
-                average_elem = ratings.find('average')
-                average = float(average_elem.get('value')) if average_elem is not None else 0
-
-                avgweight_elem = ratings.find('averageweight')
-                avgweight = float(avgweight_elem.get('value')) if avgweight_elem is not None else 0
-            else:
-                average = 0
-                avgweight = 0
-        else:
-            average = 0
-            avgweight = 0
-
-        # Get recommended players (poll data)
-        polls = item.findall('poll')
-        bggbestplayers = ''
-        bggrecplayers = ''
-
-        for poll in polls:
-            if poll.get('name') == 'suggested_numplayers':
-                best_counts = []
-                rec_counts = []
-
-                for result in poll.findall('results'):
-                    numplayers = result.get('numplayers')
-                    if not numplayers or numplayers.endswith('+'):
-                        continue
-
-                    best_votes = 0
-                    rec_votes = 0
-                    not_rec_votes = 0
-
-                    for r in result.findall('result'):
-                        value = r.get('value')
-                        votes = int(r.get('numvotes', 0))
-
-                        if value == 'Best':
-                            best_votes = votes
-                        elif value == 'Recommended':
-                            rec_votes = votes
-                        elif value == 'Not Recommended':
-                            not_rec_votes = votes
-
-                    # If best votes are highest
-                    if best_votes > rec_votes and best_votes > not_rec_votes:
-                        best_counts.append(numplayers)
-
-                    # If best or recommended votes exceed not recommended
-                    if (best_votes + rec_votes) > not_rec_votes:
-                        rec_counts.append(numplayers)
-
-                bggbestplayers = ','.join(best_counts)
-                bggrecplayers = ','.join(rec_counts)
-
-        return {
-            'id': game_id,
-            'name': name,
-            'avgweight': avgweight,
-            'minplayers': min_p,
-            'maxplayers': max_p,
-            'playingtime': time,
-            'yearpublished': year,
-            'average': average,
-            'itemtype': 'standalone',
-            'bggbestplayers': bggbestplayers,
-            'bggrecplayers': bggrecplayers
-        }
-
-    except Exception as e:
-        print(f"Error fetching game {game_id}: {e}")
-        return None
+    if client is None:
+        with ResponseCache() as cache, BGGClient(cache=cache) as client:
+            return client.fetch_things([game_id]).get(int(game_id))
+    return client.fetch_things([game_id]).get(int(game_id))
 
 def main():
     print("=" * 60)
@@ -392,11 +289,12 @@ def main():
     print("=" * 60)
 
     # Fetch top games
-    recommendations = fetch_top_games()
+    with ResponseCache() as cache, BGGClient(cache=cache) as client:
+        recommendations = fetch_top_games(client=client)
+        print(f"\nCache: {cache.hits} hits, {cache.misses} misses")
 
     # Save to JSON
-    with open('bgg-recommendations.json', 'w', encoding='utf-8') as f:
-        json.dump(recommendations, f, indent=2)
+    catalog_db.save_games('recommendations', recommendations)
 
     print("\n" + "=" * 60)
     print(f"✓ Successfully created bgg-recommendations.json")
@@ -404,4 +302,5 @@ def main():
     print("=" * 60)
 
 if __name__ == '__main__':
-    main()
+    with run_report():
+        main()
@@ -0,0 +1,152 @@
+"""
+Precomputed filter index for the page's player count / complexity / duration filters
+
+For every filter value the page offers, the index holds a bitset with bit i
+set when game i of the list matches. The page answers any combination of
+filters by ANDing at most three bitsets instead of re-checking every game.
+
+Player counts come in three fits: within the box's player range
+('players'), or recommended / best at that count in BGG's poll
+('recommended' / 'best', from the poll bitmasks of player_polls.py).
+
+Bitsets are little-endian byte strings padded to a multiple of 4 bytes (so
+the page can view them as a Uint32Array), base64-encoded in the JSON.
+
+The match rules below must stay in sync with filterGames() in index.html.
+"""
+
+import base64
+
+from player_polls import players_mask
+
+PLAYER_COUNTS = ['1', '2', '3', '4', '5', '6']  # '6' means 6+
+COMPLEXITIES = ['light', 'medium', 'heavy']
+DURATIONS = ['quick', 'medium', 'long', 'verylong']
+PLAYER_FITS = ['recommended', 'best']  # '' = the box's player range
+
+# Poll field and player count bitmask behind each fit
+FIT_FIELDS = {'recommended': 'bggrecplayers', 'best': 'bggbestplayers'}
+POLL_MASKS = {
+    player_count: players_mask(int(player_count), or_more=player_count == PLAYER_COUNTS[-1])
+    for player_count in PLAYER_COUNTS
+}
+
+INDEX_FIELDS = ('minplayers', 'maxplayers', 'avgweight', 'playingtime')
+
+
+def matches_players(game, player_count):
+    players = int(player_count)
+    if players == 6:
+        return game['maxplayers'] >= 6
+    return game['minplayers'] <= players <= game['maxplayers']
+
+
+def matches_recommended(game, player_count):
+    return bool(game.get('bggrecplayers', 0) & POLL_MASKS[player_count])
+
+
+def matches_best(game, player_count):
+    return bool(game.get('bggbestplayers', 0) & POLL_MASKS[player_count])
+
+
+def matches_complexity(game, complexity):
+    weight = game['avgweight']
+    if complexity == 'light':
+        return 1 <= weight <= 2
+    if complexity == 'medium':
+        return 2 <= weight <= 3.5
+    if complexity == 'heavy':
+        return 3.5 <= weight <= 5
+    return True
+
+
+def matches_duration(game, duration):
+    time = game['playingtime']
+    if duration == 'quick':
+        return time <= 30
+    if duration == 'medium':
+        return 30 < time <= 60
+    if duration == 'long':
+        return 60 < time <= 90
+    if duration == 'verylong':
+        return time > 90
+    return True
+
+
+FILTERS = (
+    ('players', PLAYER_COUNTS, matches_players),
+    ('recommended', PLAYER_COUNTS, matches_recommended),
+    ('best', PLAYER_COUNTS, matches_best),
+    ('complexity', COMPLEXITIES, matches_complexity),
+    ('duration', DURATIONS, matches_duration),
+)
+
+
+def has_filter_fields(games):
+    return bool(games) and all(field in games[0] for field in INDEX_FIELDS)
+
+
+class FilterIndexBuilder:
+    """Builds the bitsets one game at a time, so the games needn't be kept"""
+
+    def __init__(self):
+        self.count = 0
+        self.bits = [
+            (group, value, predicate, bytearray())
+            for group, values, predicate in FILTERS
+            for value in values
+        ]
+
+    def add(self, game):
+        i = self.count
+        mask = 1 << (i & 7)
+        for _, value, predicate, bits in self.bits:
+            if mask == 1:
+                bits.append(0)
+            if predicate(game, value):
+                bits[i >> 3] |= mask
+        self.count += 1
+
+    def encode(self):
+        """The index as stored in the JSON: base64 bitsets grouped by filter"""
+        size = ((self.count + 31) // 32) * 4
+        index = {group: {} for group, _, _ in FILTERS}
+        for group, value, _, bits in self.bits:
+            padded = bytes(bits) + bytes(size - len(bits))
+            index[group][value] = base64.b64encode(padded).decode('ascii')
+        return index
+
+
+def build_filter_index(games):
+    """Bitsets for every player count (in each fit), complexity and duration filter value"""
+    builder = FilterIndexBuilder()
+    for game in games:
+        builder.add(game)
+    return builder.encode()
+
+
+def decode_bitset(encoded):
+    """Bitset from the index as a Python int (bit i = game i)"""
+    return int.from_bytes(base64.b64decode(encoded), 'little')
+
+
+def matching_positions(index, count, player_count='', complexity='', duration='', fit=''):
+    """Positions of the games matching the given filters, in list order
+
+    fit ('recommended' or 'best') only applies together with a player count.
+    """
+    mask = (1 << count) - 1
+    if player_count:
+        mask &= decode_bitset(index[fit or 'players'][player_count])
+    if complexity:
+        mask &= decode_bitset(index['complexity'][complexity])
+    if duration:
+        mask &= decode_bitset(index['duration'][duration])
+
+    positions = []
+    for byte_i, byte in enumerate(mask.to_bytes((count + 7) // 8, 'little')):
+        while byte:
+            low = byte & -byte
+            positions.append(byte_i * 8 + low.bit_length() - 1)
+            byte ^= low
+    return positions
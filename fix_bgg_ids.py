@@ -1,97 +1,187 @@
 #!/usr/bin/env python3
 """
 Fix BGG game IDs by searching for each game name on BoardGameGeek
+
+Names are first resolved against a local index of boardgames_ranks.csv and
+collection.csv (see name_index.py). Only names the index can't resolve are
+searched on BGG, concurrently under the client's rate limiter. Resolved
+names are checkpointed to .cache/, so an interrupted run picks up where it
+stopped.
 """
 
 import json
-import time
+import os
 import xml.etree.ElementTree as ET
-try:
-    import requests
-except ImportError:
-    print("Installing requests library...")
-    import subprocess
-    subprocess.check_call(['pip3', 'install', 'requests'])
-    import requests
-
-def search_game_id(game_name, year=None):
-    """Search for a game on BGG and return the correct ID"""
-    # BGG XML API search endpoint
-    url = f"https://boardgamegeek.com/xmlapi2/search?query={requests.utils.quote(game_name)}&type=boardgame&exact=1"
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-
-        root = ET.fromstring(response.content)
-        items = root.findall('item')
-
-        if not items:
-            # Try non-exact search
-            url = f"https://boardgamegeek.com/xmlapi2/search?query={requests.utils.quote(game_name)}&type=boardgame"
-            response = requests.get(url, timeout=10)
-            root = ET.fromstring(response.content)
-            items = root.findall('item')
-
-        if items:
-            # If year provided, try to match it
-            if year:
-                for item in items:
-                    item_year = item.find('yearpublished')
-                    if item_year is not None and item_year.get('value') == str(year):
-                        return item.get('id')
-
-            # Return first result
-            return items[0].get('id')
+from bgg_cache import ResponseCache
+from bgg_client import BGGClient, BGGError
+from catalog_db import load_games, save_games
+from game_ids import parse_id
+from instrumentation import run_report
+from name_index import build_name_index, parse_year
 
-        return None
+CHECKPOINT_PATH = os.path.join('.cache', 'fix-bgg-ids.checkpoint.json')
+CHECKPOINT_EVERY = 25  # API results between checkpoint writes
+
+def lookup_game_id(game_name, year, client):
+    """Search BGG for a game's ID; raises BGGError/ParseError on failures"""
+    items = client.search(game_name, exact=True)
+
+    if not items:
+        # Try non-exact search
+        items = client.search(game_name)
 
-    except Exception as e:
+    if items:
+        # If year provided, try to match it
+        if year:
+            for item_id, item_year in items:
+                if item_year == str(year):
+                    return item_id
+
+        # Return first result
+        return items[0][0]
+
+    return None
+
+def search_game_id(game_name, year=None, client=None):
+    """Search for a game on BGG and return the correct ID"""
+    if client is None:
+        with ResponseCache() as cache, BGGClient(cache=cache) as client:
+            return search_game_id(game_name, year, client)
+
+    try:
+        return lookup_game_id(game_name, year, client)
+    except (BGGError, ET.ParseError) as e:
         print(f"Error searching for {game_name}: {e}")
         return None
 
+def _lookup_key(name, year):
+    return f"{name}\t{year or ''}"
+
+def load_checkpoint(path=CHECKPOINT_PATH):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            resolved = json.load(f)
+    except FileNotFoundError:
+        return {}
+    # Older checkpoints hold the ids as strings
+    return {key: None if game_id is None else parse_id(game_id) for key, game_id in resolved.items()}
+
+def save_checkpoint(resolved, path=CHECKPOINT_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(resolved, f)
+    os.replace(tmp_path, path)
+
+def resolve_ids(lookups, client, checkpoint_path=CHECKPOINT_PATH):
+    """Map each (name, year) lookup key to a BGG id (None if BGG has no match)
+
+    Keys already in the checkpoint are reused, the local name index handles
+    the rest where it can, and the remainder is searched on BGG
+    concurrently. Failed searches are left out, so a re-run retries them.
+    """
+    resolved = load_checkpoint(checkpoint_path)
+    if resolved:
+        print(f"✓ Resuming: {len(resolved)} names already resolved")
+
+    pending = {key: lookup for key, lookup in lookups.items() if key not in resolved}
+    if pending:
+        index = build_name_index()
+        print(f"✓ Built local name index with {len(index)} names")
+        local_count = 0
+        for key, (name, year) in list(pending.items()):
+            game_id = index.resolve(name, parse_year(year))
+            if game_id is not None:
+                resolved[key] = game_id
+                del pending[key]
+                local_count += 1
+        print(f"✓ Resolved {local_count} names locally, {len(pending)} left for the BGG API")
+        save_checkpoint(resolved, checkpoint_path)
+
+    if pending:
+        done = 0
+        pool = ThreadPoolExecutor(max_workers=client.max_workers)
+        try:
+            futures = {
+                pool.submit(lookup_game_id, name, year, client): (key, name)
+                for key, (name, year) in pending.items()
+            }
+            for future in as_completed(futures):
+                key, name = futures[future]
+                done += 1
+                try:
+                    resolved[key] = future.result()
+                except (BGGError, ET.ParseError) as e:
+                    print(f"  ✗ Error searching for {name}: {e}")
+                    continue
+                print(f"  {done}/{len(pending)}: '{name}' -> {resolved[key]}")
+                if done % CHECKPOINT_EVERY == 0:
+                    save_checkpoint(resolved, checkpoint_path)
+        finally:
+            # On Ctrl-C, drop the queued searches and keep what finished
+            pool.shutdown(wait=False, cancel_futures=True)
+            save_checkpoint(resolved, checkpoint_path)
+
+    return resolved
+
 def fix_all_ids():
     """Fix all game IDs in bgg-recommendations.json"""
     print("Loading bgg-recommendations.json...")
-    with open('bgg-recommendations.json', 'r') as f:
-        games = json.load(f)
+    games = load_games('recommendations')
 
     print(f"Found {len(games)} games to fix\n")
 
+    lookups = {}
+    for game in games:
+        name = game['name']
+        year = game.get('yearpublished')
+        lookups[_lookup_key(name, year)] = (name, year)
+
+    # The client's rate limiter spaces out the searches; cached searches
+    # (e.g. from an earlier, interrupted run) don't touch the network
+    with ResponseCache() as cache, BGGClient(cache=cache) as client:
+        resolved = resolve_ids(lookups, client)
+        print(f"\nCache: {cache.hits} hits, {cache.misses} misses")
+
     fixed_count = 0
     failed = []
+    unresolved = 0
 
-    for i, game in enumerate(games, 1):
+    for game in games:
         name = game['name']
-        year = game.get('yearpublished')
+        key = _lookup_key(name, game.get('yearpublished'))
         old_id = game['id']
 
-        print(f"{i}/{len(games)}: Searching for '{name}' ({year})...")
-
-        new_id = search_game_id(name, year)
+        if key not in resolved:
+            # Search failed (network/API error); retried on the next run
+            unresolved += 1
+            continue
 
+        new_id = resolved[key]
         if new_id:
             if new_id != old_id:
-                print(f"  ✓ Fixed: {old_id} -> {new_id}")
+                print(f"  ✓ Fixed {name}: {old_id} -> {new_id}")
                 game['id'] = new_id
                 fixed_count += 1
-            else:
-                print(f"  ✓ Already correct: {new_id}")
         else:
-            print(f"  ✗ Could not find ID for {name}")
             failed.append(name)
 
-        # Rate limiting
-        time.sleep(1)
-
     # Save the fixed file
-    with open('bgg-recommendations.json', 'w') as f:
-        json.dump(games, f, indent=2)
+    save_games('recommendations', games)
+
+    # A complete run doesn't need its checkpoint any more
+    if not unresolved and os.path.exists(CHECKPOINT_PATH):
+        os.remove(CHECKPOINT_PATH)
 
     print("\n" + "=" * 60)
     print(f"✓ Fixed {fixed_count} game IDs")
     print(f"✓ Saved to bgg-recommendations.json")
 
+    if unresolved:
+        print(f"\n⚠ {unresolved} games could not be searched; run again to retry them")
+
     if failed:
         print(f"\n⚠ Failed to find {len(failed)} games:")
         for name in failed:
@@ -100,4 +190,5 @@ def fix_all_ids():
     print("=" * 60)
 
 if __name__ == '__main__':
-    fix_all_ids()
+    with run_report():
+        fix_all_ids()
@@ -0,0 +1,63 @@
+"""
+Integer game ids and the sorted id arrays used for exclusion checks
+
+BGG ids are parsed to int once, where they enter the pipeline (collection
+rows, ranks rows, BGG API items), and stay ints from there on: in the
+catalog, in every JSON file and in the lookups between them.
+
+IdSet holds a set of ids as a sorted int32 array (4 bytes per id instead of
+a str object plus its hash table slot) and is what excluded-game-ids.json
+stores. Single lookups are a binary search; mask() answers membership for
+a whole column of ids (e.g. the ranks snapshot's id column) in one pass.
+"""
+
+from array import array
+from bisect import bisect_left
+
+ID_TYPECODE = 'i'  # int32: BGG ids are far below 2**31
+
+
+def parse_id(value):
+    """A game id from the CSV/XML text form (ints pass through)"""
+    return int(value)
+
+
+class IdSet:
+    """Immutable set of game ids backed by a sorted int32 array"""
+
+    def __init__(self, ids=()):
+        self.ids = array(ID_TYPECODE, sorted({parse_id(game_id) for game_id in ids}))
+        self._lookup = None  # frozenset for mask(), built on first use
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __contains__(self, game_id):
+        ids = self.ids
+        i = bisect_left(ids, game_id)
+        return i < len(ids) and ids[i] == game_id
+
+    def __eq__(self, other):
+        return isinstance(other, IdSet) and self.ids == other.ids
+
+    def __repr__(self):
+        return f'IdSet({self.ids.tolist()!r})'
+
+    def tolist(self):
+        return self.ids.tolist()
+
+    def mask(self, column):
+        """bytes with a 1 for every id of `column` (any sequence of ints) in the set
+
+        The loop runs in C: the column is streamed through a hash table's
+        membership test. The table is built on the first call and kept, so
+        only sets that are masked with pay for it, once.
+        """
+        if not self.ids:
+            return bytes(len(column))
+        if self._lookup is None:
+            self._lookup = frozenset(self.ids)
+        return bytes(map(self._lookup.__contains__, column))
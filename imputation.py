@@ -0,0 +1,214 @@
+"""
+Estimated weight, playing time and player counts for games without BGG stats
+
+The ranks dump has no complexity, duration or player counts. Rather than
+giving every game of a category the same values, a ridge regression learns
+them from the games whose real stats are known: the collection export,
+every `thing` item in the BGG API cache and the games enrich_catalog.py
+has fetched. Its features are the ranks dump's
+columns, which every game has: BGG average, number of ratings, year,
+overall rank and the category ranks.
+
+Fitting is one pass over the training games (their ranks rows are picked
+out of the dump by id) that accumulates X'X and X'y, then a small linear
+solve. The coefficients are folded back to raw feature units, so an
+estimate is one dot product per field. The fitted model is stored in the
+catalog with a fingerprint of its training data and reused until that
+data changes.
+"""
+
+import hashlib
+import json
+import math
+import os
+from operator import mul
+
+from bgg_cache import CACHE_PATH, ResponseCache
+from bgg_client import cached_things
+from catalog_db import CATALOG_PATH, Catalog, load_enriched_stats
+from game_ids import IdSet
+from ranks_reader import CATEGORY_RANK_COLUMNS, RANKS_CSV, read_ranks
+
+IMPUTED_FIELDS = ('avgweight', 'playingtime', 'minplayers', 'maxplayers')
+FEATURE_COLUMNS = ['average', 'usersrated', 'yearpublished', 'rank'] + CATEGORY_RANK_COLUMNS
+
+MODEL_VERSION = 1
+RIDGE = 1.0  # L2 penalty on the standardized coefficients
+MIN_TRAINING_GAMES = 30  # with fewer, callers keep their category estimates
+
+YEAR_RANGE = (1950, 2030)
+YEAR_UNKNOWN = 2000
+UNRANKED = 100000  # rank used for games without one
+
+MAX_PLAYERS = 20
+MIN_MAX_PLAYERS = 2  # estimated player ranges always include 2 players
+PLAYINGTIME_RANGE = (10, 480)
+
+
+def features(row):
+    """Feature vector of a ranks row (leading 1 for the intercept)"""
+    year = YEAR_UNKNOWN if row.yearpublished is None else min(max(row.yearpublished, YEAR_RANGE[0]), YEAR_RANGE[1])
+    vector = [1.0, row.average, math.log1p(row.usersrated), year, math.log(row.rank or UNRANKED)]
+    vector.extend(1.0 if getattr(row, column) else 0.0 for column in CATEGORY_RANK_COLUMNS)
+    return vector
+
+
+def targets(stats):
+    """Regression targets for known stats; playing time is fitted on a log scale"""
+    return [stats['avgweight'], math.log(stats['playingtime']), stats['minplayers'], stats['maxplayers']]
+
+
+def _known(stats):
+    return all(stats[field] and stats[field] > 0 for field in IMPUTED_FIELDS)
+
+
+def training_stats(records, cache_path=CACHE_PATH, catalog_path=CATALOG_PATH):
+    """{game id: stats} of every game with known weight, playing time and player counts
+
+    Collection rows win over enriched games, and those over cached BGG items.
+    """
+    known = {}
+    if os.path.exists(cache_path):
+        with ResponseCache(cache_path) as cache:
+            for game in cached_things(cache):
+                stats = {field: game[field] for field in IMPUTED_FIELDS}
+                if _known(stats):
+                    known[game['id']] = stats
+    for game_id, game in load_enriched_stats(catalog_path).items():
+        known[game_id] = {field: game[field] for field in IMPUTED_FIELDS}
+    for record in records:
+        stats = {field: getattr(record, field) for field in IMPUTED_FIELDS}
+        if _known(stats):
+            known[record.objectid] = stats
+    return known
+
+
+def fingerprint(stats, ranks_path=RANKS_CSV):
+    """Identifies the training data: the known stats and the ranks dump they are joined with"""
+    digest = hashlib.sha1()
+    digest.update(json.dumps(sorted(stats.items()), sort_keys=True).encode('utf-8'))
+    try:
+        stat = os.stat(ranks_path)
+        digest.update(f'{stat.st_size}:{stat.st_mtime_ns}'.encode('ascii'))
+    except FileNotFoundError:
+        pass
+    digest.update(f'v{MODEL_VERSION}'.encode('ascii'))
+    return digest.hexdigest()
+
+
+def _solve(a, b):
+    """x with a x = b, by Gaussian elimination with partial pivoting"""
+    n = len(b)
+    m = [row[:] + [value] for row, value in zip(a, b)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        m[col], m[pivot] = m[pivot], m[col]
+        for r in range(col + 1, n):
+            factor = m[r][col] / m[col][col]
+            if factor:
+                for c in range(col, n + 1):
+                    m[r][c] -= factor * m[col][c]
+    x = [0.0] * n
+    for r in reversed(range(n)):
+        x[r] = (m[r][n] - sum(m[r][c] * x[c] for c in range(r + 1, n))) / m[r][r]
+    return x
+
+
+class Imputer:
+    """Fitted coefficients (in raw feature units) for each imputed field"""
+
+    def __init__(self, coefficients, training_games, fingerprint=None):
+        self.coefficients = coefficients
+        self.training_games = training_games
+        self.fingerprint = fingerprint
+
+    def to_dict(self):
+        return {
+            'version': MODEL_VERSION,
+            'coefficients': self.coefficients,
+            'training_games': self.training_games,
+            'fingerprint': self.fingerprint,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data is None or data.get('version') != MODEL_VERSION or data['coefficients'] is None:
+            return None
+        return cls(data['coefficients'], data['training_games'], data['fingerprint'])
+
+    def estimates(self, row):
+        """Estimated stats for a ranks row with the FEATURE_COLUMNS"""
+        x = features(row)
+        weight, log_time, min_p, max_p = (sum(map(mul, coef, x)) for coef in self.coefficients)
+        minplayers = min(max(round(min_p), 1), MAX_PLAYERS)
+        # Extrapolation can predict solo-only games, which would hide them
+        # from every player count filter but 1
+        maxplayers = min(max(round(max_p), minplayers, MIN_MAX_PLAYERS), MAX_PLAYERS)
+        playingtime = min(max(math.exp(log_time), PLAYINGTIME_RANGE[0]), PLAYINGTIME_RANGE[1])
+        return {
+            'avgweight': round(min(max(weight, 1.0), 5.0), 2),
+            'playingtime': int(5 * round(playingtime / 5)),
+            'minplayers': minplayers,
+            'maxplayers': maxplayers,
+        }
+
+
+def fit_imputer(stats, ranks_path=RANKS_CSV, ridge=RIDGE):
+    """Ridge regression of the imputed fields on the ranks features (None if too few games)"""
+    rows = read_ranks(['id'] + FEATURE_COLUMNS, path=ranks_path, ranked_only=False,
+                      only_ids=IdSet(stats))
+    samples = [(features(row), targets(stats[row.id])) for row in rows]
+    if len(samples) < MIN_TRAINING_GAMES:
+        return None
+
+    n = len(samples)
+    d = len(samples[0][0])
+    # Standardize the features so one penalty suits all of them
+    means = [sum(x[j] for x, _ in samples) / n for j in range(d)]
+    scales = [math.sqrt(sum((x[j] - means[j]) ** 2 for x, _ in samples) / n) or 1.0 for j in range(d)]
+    means[0], scales[0] = 0.0, 1.0
+
+    xtx = [[0.0] * d for _ in range(d)]
+    xty = [[0.0] * d for _ in IMPUTED_FIELDS]
+    for x, y in samples:
+        z = [(value - mean) / scale for value, mean, scale in zip(x, means, scales)]
+        for i in range(d):
+            zi = z[i]
+            row = xtx[i]
+            for j in range(d):
+                row[j] += zi * z[j]
+            for t, target in enumerate(y):
+                xty[t][i] += zi * target
+    for i in range(1, d):  # the intercept is not penalized
+        xtx[i][i] += ridge
+
+    coefficients = []
+    for t in range(len(IMPUTED_FIELDS)):
+        beta = _solve(xtx, xty[t])
+        raw = [b / scale for b, scale in zip(beta, scales)]
+        raw[0] = beta[0] - sum(b * mean / scale for b, mean, scale in zip(beta[1:], means[1:], scales[1:]))
+        coefficients.append(raw)
+    return Imputer(coefficients, n)
+
+
+def load_imputer(records, ranks_path=RANKS_CSV, catalog_path=CATALOG_PATH):
+    """(imputer or None, whether it was refitted) for the current training data
+
+    The model stored in the catalog is reused while its fingerprint matches;
+    otherwise it is refitted and stored.
+    """
+    stats = training_stats(records, catalog_path=catalog_path)
+    current = fingerprint(stats, ranks_path)
+    with Catalog(catalog_path) as catalog:
+        stored = catalog.imputation_model()
+        if stored is not None and stored.get('fingerprint') == current:
+            return Imputer.from_dict(stored), False
+        imputer = fit_imputer(stats, ranks_path)
+        if imputer is None:
+            # Remembered too, so too little data isn't refitted on every run
+            model = {'version': MODEL_VERSION, 'coefficients': None, 'training_games': 0}
+        else:
+            imputer.fingerprint = current
+            model = imputer.to_dict()
+        catalog.set_imputation_model(dict(model, fingerprint=current))
+    return imputer, True
@@ -0,0 +1,181 @@
+"""
+Timing spans, counters and a JSON run report for the scripts
+
+Every script runs its main function inside run_report(), which writes
+.cache/reports/<script>.json when it finishes (or fails):
+
+    {"script": "build_personalized_recommendations", "wall_s": 0.41,
+     "cpu_s": 0.40, "peak_rss_kb": 41236, "status": "ok",
+     "spans": {"rank_pipeline": {"calls": 1, "wall_s": 0.31, ...},
+               "rank_pipeline/score": {"calls": 2, "wall_s": 0.02, ...}},
+     "counters": {"ranks.rows_read": 170000, "ranks.kept": 4221, ...}}
+
+Code records work with `with span('name'):` (repeated spans accumulate;
+nested spans are reported as 'outer/inner') and count('name', n). Both are
+cheap no-ops outside a report, and safe to use from worker threads.
+
+Environment variables:
+    BGG_REPORT=path   write the report there instead (BGG_REPORT=0 disables it)
+    BGG_PROFILE=path  also record a cProfile dump (BGG_PROFILE=1 uses
+                      .cache/reports/<script>.prof); view it with
+                      `python3 -m pstats <file>`
+"""
+
+import cProfile
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+REPORT_DIR = os.path.join('.cache', 'reports')
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process so far, in KiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KiB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class Report:
+    def __init__(self, script):
+        self.script = script
+        self.spans = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def _stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    @contextmanager
+    def span(self, name):
+        stack = self._stack()
+        stack.append(name)
+        path = '/'.join(stack)
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            stack.pop()
+            rss = peak_rss_kb()
+            with self.lock:
+                entry = self.spans.setdefault(path, {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0})
+                entry['calls'] += 1
+                entry['wall_s'] += wall
+                entry['cpu_s'] += cpu
+                entry['peak_rss_kb'] = rss
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def as_dict(self):
+        with self.lock:
+            spans = {
+                path: dict(entry, wall_s=round(entry['wall_s'], 6), cpu_s=round(entry['cpu_s'], 6))
+                for path, entry in self.spans.items()
+            }
+            return {'spans': spans, 'counters': dict(sorted(self.counters.items()))}
+
+
+_report = None
+
+
+@contextmanager
+def span(name):
+    """Time a block as part of the current run report"""
+    if _report is None:
+        yield
+        return
+    with _report.span(name):
+        yield
+
+
+def count(name, n=1):
+    if _report is not None:
+        _report.count(name, n)
+
+
+def count_all(prefix, counts):
+    """Add every entry of a counts dict (like read_ranks' counts) under prefix."""
+    for name, n in counts.items():
+        count(f'{prefix}.{name}', n)
+
+
+def _script_name():
+    return os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0] or 'python'
+
+
+def _output_path(variable, default):
+    value = os.environ.get(variable, '')
+    if value in ('', '1'):
+        return default if value == '1' or variable == 'BGG_REPORT' else None
+    if value == '0':
+        return None
+    return value
+
+
+@contextmanager
+def run_report(script=None):
+    """Collect spans and counters for the enclosed run and write the JSON report"""
+    global _report
+    script = script or _script_name()
+    report_path = _output_path('BGG_REPORT', os.path.join(REPORT_DIR, f'{script}.json'))
+    profile_path = _output_path('BGG_PROFILE', os.path.join(REPORT_DIR, f'{script}.prof'))
+
+    previous, _report = _report, Report(script)
+    report = _report
+    profiler = cProfile.Profile() if profile_path else None
+    started = datetime.now(timezone.utc)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    status = 'ok'
+    if profiler:
+        profiler.enable()
+    try:
+        yield report
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            status = f'exit {e.code}'
+        raise
+    except BaseException as e:
+        status = f'{type(e).__name__}: {e}' if str(e) else type(e).__name__
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+        _report = previous
+
+        data = {
+            'script': script,
+            'argv': sys.argv[1:],
+            'started': started.isoformat(timespec='seconds'),
+            'wall_s': round(time.perf_counter() - wall_start, 6),
+            'cpu_s': round(time.process_time() - cpu_start, 6),
+            'peak_rss_kb': peak_rss_kb(),
+            'status': status,
+            'profile': profile_path,
+        }
+        data.update(report.as_dict())
+
+        for path in (report_path, profile_path):
+            if path and os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+        if profiler:
+            profiler.dump_stats(profile_path)
+        if report_path:
+            tmp_path = f'{report_path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, report_path)
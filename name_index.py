@@ -0,0 +1,90 @@
+"""
+Local game-name index for resolving BGG ids without the API
+
+Names from boardgames_ranks.csv (via ranks_reader, so the binary snapshot is
+used when present) and from collection.csv are normalized (accents, case,
+punctuation, '&' vs 'and') and indexed together with their year and
+popularity. fix_bgg_ids.py only falls back to BGG searches for names this
+index can't resolve.
+"""
+
+import os
+import re
+import unicodedata
+
+from collection_store import load_collection
+from ranks_reader import RANKS_CSV, read_ranks
+from ranks_snapshot import snapshot_path_for
+
+_punctuation = re.compile(r'[^\w\s]')
+_whitespace = re.compile(r'\s+')
+
+
+def normalize_name(name):
+    decomposed = unicodedata.normalize('NFKD', name)
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    lowered = stripped.casefold().replace('&', ' and ')
+    return _whitespace.sub(' ', _punctuation.sub(' ', lowered)).strip()
+
+
+def parse_year(value):
+    """Year as int, or None for '', 'Unknown' and the like"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class NameIndex:
+    def __init__(self):
+        # normalized name -> {id: (year, popularity)}
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, game_id, name, year, popularity=0):
+        key = normalize_name(name)
+        if not key:
+            return
+        candidates = self.entries.setdefault(key, {})
+        known = candidates.get(game_id)
+        if known is None or popularity > known[1]:
+            candidates[game_id] = (year, popularity)
+
+    def resolve(self, name, year=None):
+        """BGG id for a name (and year), or None if unknown or ambiguous
+
+        With a year, only candidates published that year qualify, and among
+        several of those the most popular (most ratings) wins. Without a
+        year, a name shared by several games is ambiguous, so the caller
+        falls back to the BGG search.
+        """
+        candidates = self.entries.get(normalize_name(name))
+        if not candidates:
+            return None
+        if year is None:
+            return next(iter(candidates)) if len(candidates) == 1 else None
+        candidates = {game_id: entry for game_id, entry in candidates.items() if entry[0] == year}
+        if not candidates:
+            return None
+        return max(candidates.items(), key=lambda item: item[1][1])[0]
+
+
+def build_name_index(ranks_path=RANKS_CSV, collection_path='collection.csv'):
+    """Index every game in the ranks dump (if present) and the collection export"""
+    index = NameIndex()
+
+    if os.path.exists(ranks_path) or os.path.exists(snapshot_path_for(ranks_path)):
+        rows = read_ranks(['id', 'name', 'yearpublished', 'usersrated'], path=ranks_path,
+                          ranked_only=False, include_expansions=True)
+        for row in rows:
+            index.add(row.id, row.name, row.yearpublished, row.usersrated)
+
+    if os.path.exists(collection_path):
+        for record in load_collection(collection_path):
+            # The user's own export is authoritative for the games in it
+            index.add(record.objectid, record.objectname, parse_year(record.yearpublished),
+                      popularity=float('inf'))
+
+    return index
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Incremental runner for the data pipeline
+
+    python3 pipeline.py            # rebuild whatever is out of date
+    python3 pipeline.py --force    # rebuild everything
+    python3 pipeline.py --watch    # rebuild again whenever a source file changes
+
+Each stage declares the files it reads and writes. A stage is skipped when
+the content hashes of its inputs match the last successful run and its
+outputs still exist. Inputs that aren't files (DERIVED_INPUTS: the games
+the imputation model trains on, partly from the BGG API cache, and the
+stats enrich_catalog.py stored in the catalog) are represented by a digest
+computed on every run. Stages whose inputs don't depend on each other run in
+parallel. State lives in .cache/pipeline-state.json.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+STATE_PATH = os.path.join('.cache', 'pipeline-state.json')
+
+Stage = namedtuple('Stage', 'name script inputs outputs')
+
+
+def imputation_training_data():
+    """Fingerprint of the games with known stats (see imputation.py)"""
+    from collection_store import load_collection
+    from imputation import fingerprint, training_stats
+
+    try:
+        records = load_collection()
+    except FileNotFoundError:
+        return None
+    return fingerprint(training_stats(records))
+
+
+def enriched_stats():
+    """Digest of the stats enrich_catalog.py has stored in the catalog"""
+    from catalog_db import Catalog
+
+    with Catalog() as catalog:
+        return catalog.enriched_digest()
+
+
+# Stage inputs that aren't files: name -> function returning a digest of
+# the state they stand for (None if there is none)
+DERIVED_INPUTS = {
+    'imputation training data': imputation_training_data,
+    'enriched stats': enriched_stats,
+}
+
+# Declared in dependency order: a stage depends on every earlier stage that
+# writes one of its inputs
+STAGES = [
+    Stage(
+        'parse_collection', 'parse_collection.py',
+        inputs=['collection.csv'],
+        outputs=['owned-games.json', 'excluded-game-ids.json'],
+    ),
+    Stage(
+        'analyze_preferences', 'analyze_preferences.py',
+        inputs=['collection.csv'],
+        outputs=['preference_profile.json'],
+    ),
+    Stage(
+        'build_personalized_recommendations', 'build_personalized_recommendations.py',
+        inputs=['collection.csv', 'boardgames_ranks.csv', 'boardgames_ranks.bin',
+                'excluded-game-ids.json', 'preference_profile.json',
+                'imputation training data', 'enriched stats'],
+        outputs=['bgg-recommendations.json'],
+    ),
+    Stage(
+        'apply_id_corrections', 'apply_id_corrections.py',
+        # Rewrites bgg-recommendations.json in place
+        inputs=['bgg-id-corrections.csv', 'bgg-recommendations.json'],
+        outputs=['bgg-recommendations.json'],
+    ),
+    Stage(
+        'similar_games', 'similarity.py',
+        inputs=['owned-games.json', 'bgg-recommendations.json',
+                'boardgames_ranks.csv', 'boardgames_ranks.bin'],
+        outputs=['similar-games.json'],
+    ),
+]
+
+
+def stage_dependencies(stages):
+    """stage name -> names of earlier stages producing one of its inputs"""
+    dependencies = {}
+    for i, stage in enumerate(stages):
+        dependencies[stage.name] = {
+            earlier.name for earlier in stages[:i]
+            if set(earlier.outputs) & set(stage.inputs)
+        }
+    return dependencies
+
+
+def source_files(stages):
+    """Input files (and scripts) that no stage produces: what --watch polls"""
+    produced = {path for stage in stages for path in stage.outputs}
+    sources = []
+    for stage in stages:
+        for path in [stage.script] + stage.inputs:
+            if path not in produced and path not in DERIVED_INPUTS and path not in sources:
+                sources.append(path)
+    return sources
+
+
+class FileHasher:
+    """SHA-256 of files, re-hashing only when size or mtime changed"""
+
+    def __init__(self, known=None):
+        self.known = known or {}
+
+    def hash(self, path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.known.pop(path, None)
+            return None
+        cached = self.known.get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        self.known[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return self.known[path][2]
+
+
+def load_state(path=STATE_PATH):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'stages': {}, 'files': {}}
+
+
+def save_state(state, path=STATE_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def input_hashes(stage, hasher):
+    return {path: DERIVED_INPUTS[path]() if path in DERIVED_INPUTS else hasher.hash(path)
+            for path in [stage.script] + stage.inputs}
+
+
+def is_up_to_date(stage, state, hasher):
+    recorded = state['stages'].get(stage.name)
+    if recorded is None:
+        return False
+    if any(not os.path.exists(path) for path in stage.outputs):
+        return False
+    return recorded == input_hashes(stage, hasher)
+
+
+def run_script(stage):
+    started = time.monotonic()
+    result = subprocess.run(
+        [sys.executable, stage.script],
+        capture_output=True, text=True,
+    )
+    return result, time.monotonic() - started
+
+
+def run_pipeline(stages=STAGES, force=False, jobs=None, state_path=STATE_PATH):
+    """Run every out-of-date stage; returns True if all stages succeeded"""
+    state = load_state(state_path)
+    hasher = FileHasher(state.get('files'))
+    dependencies = stage_dependencies(stages)
+    by_name = {stage.name: stage for stage in stages}
+
+    waiting = [stage.name for stage in stages]
+    finished = set()
+    failed = set()
+    running = {}
+    ran = 0
+
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        while waiting or running:
+            for name in list(waiting):
+                if dependencies[name] & failed:
+                    print(f"✗ {name}: skipped, a stage it depends on failed")
+                    waiting.remove(name)
+                    failed.add(name)
+                    continue
+                if not dependencies[name] <= finished:
+                    continue
+
+                waiting.remove(name)
+                stage = by_name[name]
+                if not force and is_up_to_date(stage, state, hasher):
+                    print(f"  {name}: up to date")
+                    finished.add(name)
+                    continue
+                print(f"→ {name}: running {stage.script}")
+                running[pool.submit(run_script, stage)] = stage
+
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                result, elapsed = future.result()
+                ran += 1
+                output = (result.stdout + result.stderr).rstrip()
+                if output:
+                    print('\n'.join(f"    {line}" for line in output.splitlines()))
+                if result.returncode != 0:
+                    print(f"✗ {stage.name}: failed with exit code {result.returncode} ({elapsed:.1f}s)")
+                    failed.add(stage.name)
+                    state['stages'].pop(stage.name, None)
+                    continue
+
+                print(f"✓ {stage.name}: done ({elapsed:.1f}s)")
+                finished.add(stage.name)
+                # Recorded after the run, so in-place stages see their own output
+                state['stages'][stage.name] = input_hashes(stage, hasher)
+
+    state['files'] = hasher.known
+    save_state(state, state_path)
+
+    if ran == 0 and not failed:
+        print("✓ Everything is up to date")
+    return not failed
+
+
+def watch(stages=STAGES, interval=2.0, jobs=None):
+    """Re-run the pipeline whenever one of the source files changes"""
+    sources = source_files(stages)
+    print(f"Watching {', '.join(sources)} (Ctrl-C to stop)")
+
+    def snapshot():
+        stamps = {}
+        for path in sources:
+            try:
+                stat = os.stat(path)
+                stamps[path] = (stat.st_size, stat.st_mtime_ns)
+            except FileNotFoundError:
+                stamps[path] = None
+        return stamps
+
+    run_pipeline(stages, jobs=jobs)
+    last = snapshot()
+    try:
+        while True:
+            time.sleep(interval)
+            current = snapshot()
+            changed = [path for path in sources if current[path] != last[path]]
+            if changed:
+                print(f"\nChanged: {', '.join(changed)}")
+                run_pipeline(stages, jobs=jobs)
+                last = current
+    except KeyboardInterrupt:
+        print("\nStopped watching")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--force', action='store_true', help='run every stage even if up to date')
+    parser.add_argument('--watch', action='store_true', help='keep running and rebuild on changes')
+    parser.add_argument('--interval', type=float, default=2.0, help='seconds between --watch polls')
+    parser.add_argument('--jobs', type=int, default=None, help='maximum stages running at once')
+    args = parser.parse_args()
+
+    if args.watch:
+        watch(interval=args.interval, jobs=args.jobs)
+    else:
+        sys.exit(0 if run_pipeline(force=args.force, jobs=args.jobs) else 1)
+
+
+if __name__ == '__main__':
+    main()
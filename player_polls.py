@@ -0,0 +1,53 @@
+"""
+Player count poll results (bggbestplayers / bggrecplayers) as bitmasks
+
+BGG's "suggested number of players" poll says which player counts play
+best and which are recommended. The collection export writes them as comma
+strings ("3,4,5"). The builders store an int instead, with bit n-1 set for
+n players. Counts of OVERFLOW_PLAYERS and more share the top bit ("8+"), so
+a mask always fits in a byte.
+
+"Best at N" is then one AND per game, `game['bggbestplayers'] & mask`, and
+filter_index.py turns that into the page's bitsets.
+"""
+
+OVERFLOW_PLAYERS = 8
+
+
+def player_bit(players):
+    """The bit of a player count (counts past the overflow share its bit)"""
+    return 1 << (min(players, OVERFLOW_PLAYERS) - 1)
+
+
+def players_mask(players, or_more=False):
+    """Mask matching `players` players, or that many and more with or_more"""
+    bit = player_bit(players)
+    if or_more:
+        return (player_bit(OVERFLOW_PLAYERS) << 1) - bit
+    return bit
+
+
+def encode_players(value):
+    """Bitmask for a poll field: a comma string ('' = no counts) or an already encoded int
+
+    Besides plain counts, BGG polls list "N+" for more players than the box
+    supports; it is read as N + 1.
+    """
+    if isinstance(value, int):
+        return value
+    mask = 0
+    for token in value.split(','):
+        token = token.strip()
+        if not token:
+            continue
+        players = int(token[:-1]) + 1 if token.endswith('+') else int(token)
+        if players >= 1:
+            mask |= player_bit(players)
+    return mask
+
+
+def decode_players(mask):
+    """Labels of the player counts in a mask ('1' ... '7', '8+')"""
+    return [f'{players}+' if players == OVERFLOW_PLAYERS else str(players)
+            for players in range(1, OVERFLOW_PLAYERS + 1)
+            if mask & player_bit(players)]
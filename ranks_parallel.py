@@ -0,0 +1,150 @@
+"""
+Process-pool parsing of boardgames_ranks.csv
+
+ranked_top_k() is what the ranks builders call to turn the dump into their
+ordered candidate list. With workers > 1 the CSV is split into byte ranges,
+each worker tokenizes, filters (rank limit, exclusions, expansions), builds
+and scores the games of its own range and returns its partial top-K, and the
+sorted partial results are merged. Otherwise (or when a current binary
+snapshot exists, which is faster than parsing anything) the same pipeline
+runs in-process over read_ranks().
+
+Ranges always end at a record boundary: a newline only ends a record when
+the number of quote characters before it is even, so names with quoted
+newlines are never split.
+"""
+
+import csv
+import heapq
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+
+from ranks_reader import RANKS_CSV, filter_rows, read_ranks
+from ranks_snapshot import open_current_snapshot
+from selection import iter_top_k
+
+CHUNKS_PER_WORKER = 4  # more, smaller ranges even out the workers' load
+SPLIT_BLOCK = 1 << 20  # bytes read at a time while looking for split points
+
+# Positions within a range: sequence numbers are range * RANGE_SPAN + row
+RANGE_SPAN = 1 << 32
+
+
+def split_ranges(path, parts, block_size=SPLIT_BLOCK):
+    """Header row plus (start, end) byte ranges covering every data record
+
+    The file is streamed in block_size blocks, counting quote characters, and
+    only the split offsets are kept.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        # The header has no quoted newlines in the BGG dump
+        header_line = f.readline()
+        header = next(csv.reader([header_line.decode('utf-8')]))
+        header_end = f.tell()
+
+        step = max(1, (size - header_end) // parts)
+        bounds = [header_end]
+        target = header_end + step  # split at the first record end from here
+        offset = header_end  # file offset of the current block
+        quotes = 0  # quote characters before offset
+        while target < size:
+            block = f.read(block_size)
+            if not block:
+                break
+            position = max(target - offset, 0)
+            seen = quotes + block.count(b'"', 0, position)  # quote characters before position
+            while position < len(block):
+                newline = block.find(b'\n', position)
+                if newline == -1:
+                    break
+                seen += block.count(b'"', position, newline)
+                position = newline + 1
+                if seen % 2 == 0:
+                    # A newline outside quotes: a record boundary
+                    bounds.append(offset + position)
+                    target = offset + position + step
+                    if target >= size:
+                        break
+                    skip = max(target - offset, position)
+                    seen += block.count(b'"', position, skip)
+                    position = skip
+            quotes += block.count(b'"')
+            offset += len(block)
+    if bounds[-1] < size:
+        bounds.append(size)
+    return header, list(zip(bounds, bounds[1:]))
+
+
+def _scan_range(task):
+    """Worker: filter, build and select the games of one byte range"""
+    (path, range_no, start, end, header, columns, filters,
+     make_items, key, k, reverse, keep_tail) = task
+
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+
+    counts = {}
+    rows = filter_rows(csv.reader(io.StringIO(text, newline='')), header, columns,
+                       counts=counts, **filters)
+    base = range_no * RANGE_SPAN
+    items = ((base + i, item) for i, item in enumerate(make_items(rows, counts)))
+
+    if keep_tail:
+        return list(items), counts
+    # Partial top-K in order; a stable sort keeps ties in file order
+    return list(iter_top_k(items, k, key=lambda pair: key(pair[1]), reverse=reverse)), counts
+
+
+def ranked_top_k(columns, make_items, key, k=None, reverse=False, keep_tail=False,
+                 path=RANKS_CSV, max_rank=None, exclude_ids=None, counts=None, workers=1):
+    """Games built from the filtered ranks rows, ordered like iter_top_k()
+
+    make_items(rows, counts) turns RankRows into items (and may add its own
+    totals to counts). With workers > 1 it and `key` run in worker
+    processes, so both must be picklable: module-level functions,
+    functools.partial or operator.itemgetter, not lambdas.
+    """
+    if counts is None:
+        counts = {}
+    filters = {'max_rank': max_rank, 'exclude_ids': exclude_ids}
+
+    if workers is None:
+        workers = os.cpu_count()
+    snapshot = open_current_snapshot(path) if workers > 1 else None
+    if snapshot is not None:
+        snapshot.close()
+    if workers <= 1 or snapshot is not None:
+        rows = read_ranks(columns, path=path, counts=counts, **filters)
+        yield from iter_top_k(make_items(rows, counts), k, key, reverse=reverse, keep_tail=keep_tail)
+        return
+
+    header, ranges = split_ranges(path, workers * CHUNKS_PER_WORKER)
+    tasks = [
+        (path, range_no, start, end, header, columns, filters, make_items, key, k, reverse, keep_tail)
+        for range_no, (start, end) in enumerate(ranges)
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        partials = []
+        for items, partial_counts in pool.map(_scan_range, tasks):
+            partials.append(items)
+            for name, value in partial_counts.items():
+                counts[name] = counts.get(name, 0) + value
+
+    if keep_tail:
+        # Whole ranges in file order: the tail must keep input order
+        items = (item for _, item in chain.from_iterable(partials))
+        yield from iter_top_k(items, k, key, reverse=reverse, keep_tail=True)
+        return
+
+    # The position breaks ties, so the merge is as stable as one big sort
+    if reverse:
+        merge_key = lambda pair: (key(pair[1]), -pair[0])
+    else:
+        merge_key = lambda pair: (key(pair[1]), pair[0])
+    merged = heapq.merge(*partials, key=merge_key, reverse=reverse)
+    for _, item in islice(merged, k):
+        yield item
@@ -0,0 +1,175 @@
+"""
+Streaming, column-pruned reader for the BGG ranks dump (boardgames_ranks.csv)
+
+The dump has ~170,000 rows but the builders only keep a few thousand of
+them. read_ranks() tokenizes each line with csv.reader, applies the rank,
+exclusion and expansion filters on the raw strings, and only then converts
+the requested columns into a lightweight namedtuple.
+
+If a binary snapshot built by ranks_snapshot.py sits next to the CSV and is
+up to date, rows come from the memory-mapped snapshot instead and the text
+file is not touched at all.
+"""
+
+import csv
+from collections import namedtuple
+from operator import itemgetter
+
+from game_ids import parse_id
+
+RANKS_CSV = 'boardgames_ranks.csv'
+
+CATEGORY_RANK_COLUMNS = [
+    'abstracts_rank',
+    'cgs_rank',
+    'childrensgames_rank',
+    'familygames_rank',
+    'partygames_rank',
+    'strategygames_rank',
+    'thematic_rank',
+    'wargames_rank',
+]
+
+
+def _int(value):
+    return int(value) if value else 0
+
+
+def _float(value):
+    return float(value) if value else 0.0
+
+
+def _year(value):
+    # Missing years stay None so callers can tell "unknown" from year 0
+    return int(value) if value else None
+
+
+# How each column of the dump is decoded
+COLUMN_TYPES = {
+    'id': parse_id,
+    'name': str,
+    'yearpublished': _year,
+    'rank': _int,
+    'bayesaverage': _float,
+    'average': _float,
+    'usersrated': _int,
+    'is_expansion': _int,
+}
+COLUMN_TYPES.update((column, _int) for column in CATEGORY_RANK_COLUMNS)
+
+_row_types = {}
+
+
+def row_type(columns):
+    """namedtuple class used for rows with the given columns"""
+    columns = tuple(columns)
+    if columns not in _row_types:
+        _row_types[columns] = namedtuple('RankRow', columns)
+    return _row_types[columns]
+
+
+def read_ranks(columns, path=RANKS_CSV, max_rank=None, ranked_only=True,
+               include_expansions=False, exclude_ids=None, counts=None,
+               use_snapshot=True, only_ids=None):
+    """Yield RankRow tuples holding only `columns` for rows passing the filters
+
+    Filters run in the same order the builders always used: unranked games
+    and games past max_rank first, then ids in exclude_ids (an IdSet or any
+    container of int ids) and, with only_ids, ids not in only_ids, then
+    expansions.
+    When a dict is passed as `counts`, the number of rows 'read', 'kept' and
+    dropped as 'unranked', 'rank_cutoff', 'excluded', 'unselected' and
+    'expansion' is added to it.
+
+    Pass use_snapshot=False to always read the CSV.
+    """
+    unknown = [column for column in columns if column not in COLUMN_TYPES]
+    if unknown:
+        raise ValueError(f"Unknown ranks column(s): {', '.join(unknown)}")
+
+    if use_snapshot:
+        from ranks_snapshot import open_current_snapshot
+
+        snapshot = open_current_snapshot(path)
+        if snapshot is not None:
+            with snapshot:
+                yield from snapshot.rows(
+                    columns, max_rank=max_rank, ranked_only=ranked_only,
+                    include_expansions=include_expansions,
+                    exclude_ids=exclude_ids, counts=counts, only_ids=only_ids,
+                )
+            return
+
+    with open(path, 'r', encoding='utf-8', newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        header = next(reader)
+        yield from filter_rows(reader, header, columns, max_rank, ranked_only,
+                               include_expansions, exclude_ids, counts, only_ids)
+
+
+def filter_rows(reader, header, columns, max_rank=None, ranked_only=True,
+                include_expansions=False, exclude_ids=None, counts=None, only_ids=None):
+    """The filtering and decoding of read_ranks() over already tokenized rows
+
+    Shared with ranks_parallel.py, whose workers tokenize byte ranges of the
+    file themselves.
+    """
+    make_row = row_type(columns)._make
+    converters = [COLUMN_TYPES[column] for column in columns]
+    read_count = 0
+    unranked_count = 0
+    cutoff_count = 0
+    excluded_count = 0
+    unselected_count = 0
+    expansion_count = 0
+    kept_count = 0
+
+    index = {name: i for i, name in enumerate(header)}
+    rank_i = index['rank']
+    id_i = index['id']
+    expansion_i = index['is_expansion']
+    if len(columns) == 1:
+        single = itemgetter(index[columns[0]])
+        pick = lambda fields: (single(fields),)
+    else:
+        pick = itemgetter(*(index[column] for column in columns))
+
+    try:
+        for fields in reader:
+            read_count += 1
+            if ranked_only or max_rank is not None:
+                rank_str = fields[rank_i].strip()
+                if not rank_str or rank_str == '0':
+                    unranked_count += 1
+                    continue
+                if max_rank is not None and int(rank_str) > max_rank:
+                    cutoff_count += 1
+                    continue
+
+            if exclude_ids is not None or only_ids is not None:
+                game_id = parse_id(fields[id_i])
+                if exclude_ids is not None and game_id in exclude_ids:
+                    excluded_count += 1
+                    continue
+                if only_ids is not None and game_id not in only_ids:
+                    unselected_count += 1
+                    continue
+
+            if not include_expansions and fields[expansion_i] == '1':
+                expansion_count += 1
+                continue
+
+            kept_count += 1
+            yield make_row([convert(value) for convert, value in zip(converters, pick(fields))])
+    finally:
+        if counts is not None:
+            add_counts(counts, read=read_count, unranked=unranked_count,
+                       rank_cutoff=cutoff_count, excluded=excluded_count,
+                       unselected=unselected_count, expansion=expansion_count,
+                       kept=kept_count)
+
+
+def add_counts(counts, **values):
+    """Add filter totals to a counts dict"""
+    for name, value in values.items():
+        counts[name] = counts.get(name, 0) + value
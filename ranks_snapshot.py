@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Binary columnar snapshot of boardgames_ranks.csv
+
+Run once after downloading a new ranks dump:
+
+    python3 ranks_snapshot.py
+
+This writes boardgames_ranks.bin next to the CSV. The file holds one
+fixed-width array per numeric column plus a string table for the names, and
+is read back through mmap, so opening it costs nothing and only the pages
+that are actually touched become resident. ranks_reader.read_ranks() uses
+the snapshot automatically whenever it is up to date with the CSV.
+
+Layout: 8-byte magic, little-endian uint32 header length, JSON header, then
+8-byte aligned arrays whose offsets, typecodes and lengths the header lists.
+"""
+
+import csv
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from game_ids import IdSet
+from instrumentation import run_report
+from ranks_reader import CATEGORY_RANK_COLUMNS, RANKS_CSV, add_counts, row_type
+
+SNAPSHOT_PATH = 'boardgames_ranks.bin'
+MAGIC = b'BGGRANK1'
+
+# Stored in place of a missing yearpublished
+YEAR_MISSING = -2**31
+
+NUMERIC_COLUMNS = {
+    'id': 'i',
+    'rank': 'i',
+    'bayesaverage': 'd',
+    'average': 'd',
+    'usersrated': 'i',
+    'yearpublished': 'i',
+    'is_expansion': 'b',
+}
+NUMERIC_COLUMNS.update((column, 'i') for column in CATEGORY_RANK_COLUMNS)
+
+
+def snapshot_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + '.bin'
+
+
+def _parse_numeric(column, value):
+    if column == 'yearpublished':
+        return int(value) if value else YEAR_MISSING
+    if NUMERIC_COLUMNS[column] == 'd':
+        return float(value) if value else 0.0
+    return int(value.strip()) if value.strip() else 0
+
+
+def build_snapshot(csv_path=RANKS_CSV, out_path=None):
+    """Convert the ranks CSV into a columnar snapshot and return its path"""
+    out_path = out_path or snapshot_path_for(csv_path)
+    stat = os.stat(csv_path)
+
+    columns = {column: array(typecode) for column, typecode in NUMERIC_COLUMNS.items()}
+    name_offsets = array('I', [0])
+    name_data = bytearray()
+
+    with open(csv_path, 'r', encoding='utf-8', newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        header = next(reader)
+        index = {name: i for i, name in enumerate(header)}
+        name_i = index['name']
+        sources = [(columns[column], column, index[column]) for column in NUMERIC_COLUMNS]
+
+        for fields in reader:
+            for values, column, i in sources:
+                values.append(_parse_numeric(column, fields[i]))
+            name_data += fields[name_i].encode('utf-8')
+            name_offsets.append(len(name_data))
+
+    blocks = [(column, values) for column, values in columns.items()]
+    blocks.append(('name_offsets', name_offsets))
+    blocks.append(('name_data', array('B', name_data)))
+
+    # Offsets are relative to the (8-byte aligned) start of the data
+    # section, which begins right after the header
+    layout = {}
+    position = 0
+    for column, values in blocks:
+        position = (position + 7) & ~7
+        layout[column] = {
+            'typecode': values.typecode,
+            'offset': position,
+            'length': len(values),
+        }
+        position += len(values) * values.itemsize
+
+    header = json.dumps({
+        'byteorder': sys.byteorder,
+        'rows': len(columns['id']),
+        'source_size': stat.st_size,
+        'source_mtime_ns': stat.st_mtime_ns,
+        'columns': layout,
+    }).encode('utf-8')
+    data_start = (len(MAGIC) + 4 + len(header) + 7) & ~7
+
+    tmp_path = f'{out_path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for column, values in blocks:
+            f.write(b'\0' * (data_start + layout[column]['offset'] - f.tell()))
+            values.tofile(f)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+class RanksSnapshot:
+    """Memory-mapped, read-only view of a snapshot written by build_snapshot()"""
+
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+
+        if view[:len(MAGIC)] != MAGIC:
+            view.release()
+            self._mmap.close()
+            raise ValueError(f"{path} is not a ranks snapshot")
+        (header_len,) = struct.unpack_from('<I', view, len(MAGIC))
+        header_start = len(MAGIC) + 4
+        self.header = json.loads(bytes(view[header_start:header_start + header_len]))
+        if self.header['byteorder'] != sys.byteorder:
+            view.release()
+            self._mmap.close()
+            raise ValueError(f"{path} was written on a {self.header['byteorder']}-endian machine")
+
+        data_start = (header_start + header_len + 7) & ~7
+        self._views = [view]
+        self._columns = {}
+        for column, spec in self.header['columns'].items():
+            itemsize = array(spec['typecode']).itemsize
+            start = data_start + spec['offset']
+            raw = view[start:start + spec['length'] * itemsize]
+            self._columns[column] = raw.cast(spec['typecode'])
+            self._views.append(raw)
+
+    def __len__(self):
+        return self.header['rows']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for column in self._columns.values():
+            column.release()
+        self._columns.clear()
+        for view in self._views:
+            view.release()
+        self._views.clear()
+        self._mmap.close()
+
+    def column(self, name):
+        """Typed memoryview over one numeric column"""
+        return self._columns[name]
+
+    def name(self, i):
+        offsets = self._columns['name_offsets']
+        return bytes(self._columns['name_data'][offsets[i]:offsets[i + 1]]).decode('utf-8')
+
+    def is_current(self, csv_path):
+        """True if the snapshot was built from the CSV as it is on disk now"""
+        try:
+            stat = os.stat(csv_path)
+        except FileNotFoundError:
+            return True
+        return (stat.st_size == self.header['source_size']
+                and stat.st_mtime_ns == self.header['source_mtime_ns'])
+
+    def _value(self, column, i):
+        if column == 'name':
+            return self.name(i)
+        value = self._columns[column][i]
+        if column == 'yearpublished':
+            return None if value == YEAR_MISSING else value
+        return value
+
+    def rows(self, columns, max_rank=None, ranked_only=True,
+             include_expansions=False, exclude_ids=None, counts=None, only_ids=None):
+        """Same filtering and row shape as ranks_reader.read_ranks()"""
+        make_row = row_type(columns)._make
+        value = self._value
+        ids = self._columns['id']
+        ranks = self._columns['rank']
+        expansions = self._columns['is_expansion']
+        # Exclusion and selection are decided for the whole id column up front
+        excluded = None if exclude_ids is None else _id_mask(exclude_ids, ids)
+        selected = None if only_ids is None else _id_mask(only_ids, ids)
+        unranked_count = 0
+        cutoff_count = 0
+        excluded_count = 0
+        unselected_count = 0
+        expansion_count = 0
+        kept_count = 0
+
+        try:
+            for i, rank in enumerate(ranks):
+                if ranked_only or max_rank is not None:
+                    if rank == 0:
+                        unranked_count += 1
+                        continue
+                    if max_rank is not None and rank > max_rank:
+                        cutoff_count += 1
+                        continue
+
+                if excluded is not None and excluded[i]:
+                    excluded_count += 1
+                    continue
+
+                if selected is not None and not selected[i]:
+                    unselected_count += 1
+                    continue
+
+                if not include_expansions and expansions[i] == 1:
+                    expansion_count += 1
+                    continue
+
+                kept_count += 1
+                yield make_row([value(column, i) for column in columns])
+        finally:
+            if counts is not None:
+                read_count = (unranked_count + cutoff_count + excluded_count
+                              + unselected_count + expansion_count + kept_count)
+                add_counts(counts, read=read_count, unranked=unranked_count,
+                           rank_cutoff=cutoff_count, excluded=excluded_count,
+                           unselected=unselected_count, expansion=expansion_count,
+                           kept=kept_count)
+
+
+def _id_mask(game_ids, column):
+    if not isinstance(game_ids, IdSet):
+        game_ids = IdSet(game_ids)
+    return game_ids.mask(column)
+
+
+def open_current_snapshot(csv_path=RANKS_CSV):
+    """Open the snapshot belonging to csv_path if it exists and is up to date"""
+    path = snapshot_path_for(csv_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        snapshot = RanksSnapshot(path)
+    except ValueError:
+        return None
+    if not snapshot.is_current(csv_path):
+        snapshot.close()
+        return None
+    return snapshot
+
+
+if __name__ == '__main__':
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else RANKS_CSV
+    with run_report():
+        out_path = build_snapshot(csv_path)
+        with RanksSnapshot(out_path) as snapshot:
+            rows = len(snapshot)
+    print(f"✓ Created {out_path} with {rows} games ({os.path.getsize(out_path) / 1e6:.1f} MB)")
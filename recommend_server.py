@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Local recommendation server for the page
+
+    python3 recommend_server.py                # http://127.0.0.1:8000/
+    python3 recommend_server.py --port 9000
+
+Loads both game lists from the catalog once, precomputes the matching game
+positions for every player count (and fit) / complexity / duration
+combination, and serves:
+
+    GET /                                   index.html (and the other files of the page)
+    GET /play?players=4&complexity=heavy    3 random owned games matching the filters
+    GET /buy?duration=long                  3 random buy recommendations
+    GET /play?players=3&fit=best            owned games that play best with 3 (BGG poll)
+    GET /status                             list sizes
+
+/play and /buy answer {"count": <matching games>, "games": [...]}. Each game
+is serialized once at startup, so a request is a dict lookup, 3 picks from
+the filter combination's CyclingSampler (see sampler.py: owned games
+uniformly, buy recommendations weighted by sampleWeight, no repeats until
+every match was shown) and a join; the time spent is sent back in a
+Server-Timing header. When index.html is served from here it asks the
+server instead of downloading the game lists.
+
+Only the standard library is used (asyncio streams, a minimal HTTP/1.1
+implementation with keep-alive), and it binds to 127.0.0.1 by default.
+"""
+
+import argparse
+import asyncio
+import json
+import mimetypes
+import os
+import time
+from array import array
+from urllib.parse import parse_qs, urlsplit
+
+from catalog_db import load_games
+from filter_index import (
+    COMPLEXITIES, DURATIONS, PLAYER_COUNTS, PLAYER_FITS, build_filter_index, matching_positions,
+)
+from sampler import CyclingSampler
+
+SAMPLE_SIZE = 3
+MAX_REQUEST_BYTES = 16 * 1024
+
+# Files the page may load from the server
+STATIC_FILES = {'/': 'index.html', '/index.html': 'index.html'}
+
+ENDPOINTS = {'/play': 'owned', '/buy': 'recommendations'}
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large'}
+
+
+class GameIndex:
+    """One game list with its games pre-serialized and the matches of every filter combination"""
+
+    def __init__(self, games):
+        self.encoded = [json.dumps(game, ensure_ascii=False).encode('utf-8') for game in games]
+        self.weights = None
+        if games and 'sampleWeight' in games[0]:
+            self.weights = array('Q', (game['sampleWeight'] for game in games))
+        index = build_filter_index(games)
+        self.matches = {}
+        self.samplers = {}
+        for players in [''] + PLAYER_COUNTS:
+            # A fit only means something together with a player count
+            for fit in [''] + (PLAYER_FITS if players else []):
+                for complexity in [''] + COMPLEXITIES:
+                    for duration in [''] + DURATIONS:
+                        self.matches[players, complexity, duration, fit] = array(
+                            'I', matching_positions(index, len(games), players, complexity, duration, fit))
+
+    def __len__(self):
+        return len(self.encoded)
+
+    def sampler(self, key):
+        """The CyclingSampler of a filter combination, created on first use"""
+        sampler = self.samplers.get(key)
+        if sampler is None:
+            positions = self.matches[key]
+            weights = None if self.weights is None else [self.weights[p] for p in positions]
+            sampler = self.samplers[key] = CyclingSampler(positions, weights)
+        return sampler
+
+    def sample(self, players='', complexity='', duration='', fit='', k=SAMPLE_SIZE):
+        """JSON response body with up to k matching games (KeyError for unknown filter values)"""
+        if not players:
+            fit = ''
+        sampler = self.sampler((players, complexity, duration, fit))
+        return b''.join([
+            b'{"count": ', str(len(sampler)).encode('ascii'), b', "games": [',
+            b', '.join(self.encoded[p] for p in sampler.sample(k)),
+            b']}',
+        ])
+
+
+def load_indexes():
+    return {list_name: GameIndex(load_games(list_name)) for list_name in ENDPOINTS.values()}
+
+
+class RecommendServer:
+    def __init__(self, indexes, static_dir='.'):
+        self.indexes = indexes
+        self.static_dir = static_dir
+
+    def handle(self, method, target):
+        """(status, content type, body, extra headers) for a request"""
+        if method not in ('GET', 'HEAD'):
+            return 405, 'text/plain', b'Only GET is supported\n', {}
+
+        url = urlsplit(target)
+        if url.path in ENDPOINTS:
+            start = time.perf_counter()
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            try:
+                body = self.indexes[ENDPOINTS[url.path]].sample(
+                    params.get('players', ''), params.get('complexity', ''), params.get('duration', ''),
+                    params.get('fit', ''))
+            except KeyError:
+                return 400, 'text/plain', b'Unknown filter value\n', {}
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            return 200, 'application/json', body, {
+                'Server-Timing': f'sample;dur={elapsed_ms:.3f}',
+                'Cache-Control': 'no-store',
+            }
+
+        if url.path == '/status':
+            body = json.dumps({name: len(index) for name, index in self.indexes.items()})
+            return 200, 'application/json', body.encode('utf-8'), {'Cache-Control': 'no-store'}
+
+        if url.path in STATIC_FILES:
+            path = os.path.join(self.static_dir, STATIC_FILES[url.path])
+            try:
+                with open(path, 'rb') as f:
+                    body = f.read()
+            except FileNotFoundError:
+                return 404, 'text/plain', b'Not found\n', {}
+            content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            if content_type.startswith('text/'):
+                content_type += '; charset=utf-8'
+            return 200, content_type, body, {}
+
+        return 404, 'text/plain', b'Not found\n', {}
+
+    async def serve_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._respond(writer, 413, 'text/plain', b'Request too large\n', {}, False)
+                    break
+
+                lines = head.decode('latin-1').split('\r\n')
+                parts = lines[0].split()
+                if len(parts) != 3:
+                    await self._respond(writer, 400, 'text/plain', b'Bad request\n', {}, False)
+                    break
+                method, target, version = parts
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                connection = headers.get('connection', '').lower()
+                keep_alive = (connection != 'close') if version == 'HTTP/1.1' else (connection == 'keep-alive')
+
+                status, content_type, body, extra = self.handle(method, target)
+                if method == 'HEAD':
+                    extra = dict(extra, **{'Content-Length': str(len(body))})
+                    body = b''
+                await self._respond(writer, status, content_type, body, extra, keep_alive)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, content_type, body, extra, keep_alive):
+        headers = {
+            'Content-Type': content_type,
+            'Content-Length': str(len(body)),
+            'Connection': 'keep-alive' if keep_alive else 'close',
+        }
+        headers.update(extra)
+        head = f'HTTP/1.1 {status} {REASONS[status]}\r\n' + ''.join(
+            f'{name}: {value}\r\n' for name, value in headers.items()) + '\r\n'
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+
+async def serve(host, port, static_dir='.'):
+    indexes = load_indexes()
+    app = RecommendServer(indexes, static_dir)
+    server = await asyncio.start_server(app.serve_connection, host, port, limit=MAX_REQUEST_BYTES)
+    print(f"✓ Loaded {len(indexes['owned'])} owned games and "
+          f"{len(indexes['recommendations'])} recommendations")
+    print(f"✓ Serving on http://{host}:{port}/ (Ctrl-C to stop)")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
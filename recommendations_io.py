@@ -0,0 +1,203 @@
+"""
+Compact reader/writer for the game lists the page loads
+(bgg-recommendations.json and owned-games.json)
+
+Games are stored column-oriented and minified instead of as an indented
+array of objects:
+
+    {"format": "columns", "version": 1, "count": 2,
+     "fields": ["id", "name", "rating", ...],
+     "constants": {"rating": 0, "bggbestplayers": 0},
+     "columns": {"id": [321608, 184267], "name": [...], ...}}
+
+`fields` keeps the original key order. A field that has the same value for
+every game is stored once in `constants` instead of as a column. The page's
+loadData() and test_filters.js expand this back into game objects, and still
+accept the old plain-array files.
+
+Lists carrying the filter fields also get an `index` of per-filter bitsets
+(see filter_index.py), so the page can filter without scanning every game.
+
+write_games() streams: each column is spilled to a temporary file as games
+arrive and the index is built incrementally, so builders can pass a
+generator and never hold the whole list.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+
+from filter_index import INDEX_FIELDS, FilterIndexBuilder, build_filter_index, has_filter_fields
+
+FORMAT = 'columns'
+FORMAT_VERSION = 1
+SPILL_CHUNK = 1024  # values buffered per column before spilling
+
+
+def encode_games(games):
+    """Column-oriented payload for a list of game dicts"""
+    fields = list(games[0]) if games else []
+    for game in games:
+        if len(game) != len(fields) or any(field not in game for field in fields):
+            raise ValueError(f"Game {game.get('id')} does not have the fields {fields}")
+
+    constants = {}
+    columns = {}
+    for field in fields:
+        values = [game[field] for game in games]
+        first = values[0]
+        if all(value == first and type(value) is type(first) for value in values):
+            constants[field] = first
+        else:
+            columns[field] = values
+
+    payload = {
+        'format': FORMAT,
+        'version': FORMAT_VERSION,
+        'count': len(games),
+        'fields': fields,
+        'constants': constants,
+        'columns': columns,
+    }
+    if has_filter_fields(games):
+        payload['index'] = build_filter_index(games)
+    return payload
+
+
+def decode_games(data):
+    """List of game dicts from a compact payload (or an old plain array)"""
+    if isinstance(data, list):
+        return data
+    if data.get('format') != FORMAT or data.get('version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported game list format: {data.get('format')} v{data.get('version')}")
+
+    constants = data['constants']
+    columns = data['columns']
+    fields = data['fields']
+    return [
+        {field: constants[field] if field in constants else columns[field][i] for field in fields}
+        for i in range(data['count'])
+    ]
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+class GameListWriter:
+    """Incremental writer producing the same file as json.dump(encode_games(games))
+
+    Values are buffered per column and spilled to temporary files in chunks;
+    constant detection and the filter index are tracked as games arrive.
+    close() assembles the file and moves it into place.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self.fields = None
+        self.columns = {}
+        self.pending = {}
+        self.first = {}
+        self.constant = {}
+        self.index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self._discard()
+
+    def _start(self, game):
+        self.fields = list(game)
+        self.columns = {field: tempfile.TemporaryFile('w+', encoding='utf-8') for field in self.fields}
+        self.pending = {field: [] for field in self.fields}
+        self.first = dict(game)
+        self.constant = {field: True for field in self.fields}
+        if all(field in game for field in INDEX_FIELDS):
+            self.index = FilterIndexBuilder()
+
+    def write(self, game):
+        if self.fields is None:
+            self._start(game)
+        elif len(game) != len(self.fields) or any(field not in game for field in self.fields):
+            raise ValueError(f"Game {game.get('id')} does not have the fields {self.fields}")
+
+        for field in self.fields:
+            value = game[field]
+            if self.constant[field]:
+                first = self.first[field]
+                if value == first and type(value) is type(first):
+                    continue
+                self.constant[field] = False
+                self._write_repeated(field, first, self.count)
+            self.pending[field].append(value)
+        if self.index is not None:
+            self.index.add(game)
+        self.count += 1
+        if self.count % SPILL_CHUNK == 0:
+            self._spill()
+
+    def _write_values(self, field, values):
+        column = self.columns[field]
+        if column.tell():
+            column.write(',')
+        column.write(_dumps(values)[1:-1])
+
+    def _write_repeated(self, field, value, count):
+        """Backfill a field that was constant so far"""
+        for start in range(0, count, SPILL_CHUNK):
+            self._write_values(field, [value] * min(SPILL_CHUNK, count - start))
+
+    def _spill(self):
+        for field, values in self.pending.items():
+            if values:
+                self._write_values(field, values)
+                values.clear()
+
+    def close(self):
+        fields = self.fields or []
+        constant_fields = [field for field in fields if self.constant[field]]
+        self._spill()
+
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(f'{{"format":{_dumps(FORMAT)},"version":{FORMAT_VERSION},"count":{self.count},'
+                    f'"fields":{_dumps(fields)},'
+                    f'"constants":{_dumps({field: self.first[field] for field in constant_fields})},'
+                    f'"columns":{{')
+            columns = [field for field in fields if field not in constant_fields]
+            for i, field in enumerate(columns):
+                f.write(f'{"," if i else ""}{_dumps(field)}:[')
+                column = self.columns[field]
+                column.seek(0)
+                shutil.copyfileobj(column, f)
+                f.write(']')
+            f.write('}')
+            if self.index is not None:
+                f.write(f',"index":{_dumps(self.index.encode())}')
+            f.write('}')
+        self._discard()
+        os.replace(tmp_path, self.path)
+
+    def _discard(self):
+        for column in self.columns.values():
+            column.close()
+        self.columns = {}
+
+
+def write_games(games, path):
+    """Write an iterable of game dicts; returns the number of games written"""
+    with GameListWriter(path) as writer:
+        for game in games:
+            writer.write(game)
+    return writer.count
+
+
+def read_games(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return decode_games(json.load(f))
@@ -0,0 +1,78 @@
+"""
+Batch scoring engine for personalized recommendations
+
+The preference profile (preference_profile.json) describes three bucket
+lists of (low, high, expected_rating). BucketTable sorts a list once and
+looks values up with bisect instead of scanning the buckets per game, and
+score_batch() scores whole candidate columns in one pass.
+"""
+
+from bisect import bisect_right
+
+# Share of the personalized score contributed by each preference
+BGG_WEIGHT = 0.5        # BGG consensus
+COMPLEXITY_WEIGHT = 0.3  # Complexity preference
+RECENCY_WEIGHT = 0.2     # Recency preference
+
+# Games ranked within this depth get a boost of up to RANK_BOOST
+RANK_BOOST_DEPTH = 5000
+RANK_BOOST = 0.5
+
+
+class BucketTable:
+    """Half-open [low, high) buckets, with `default` for values outside all of them"""
+
+    def __init__(self, buckets, default):
+        ordered = sorted(buckets, key=lambda bucket: bucket[0])
+        self.lows = [low for low, _, _ in ordered]
+        self.highs = [high for _, high, _ in ordered]
+        self.values = [value for _, _, value in ordered]
+        self.default = default
+
+    def lookup(self, value):
+        i = bisect_right(self.lows, value) - 1
+        if i >= 0 and value < self.highs[i]:
+            return self.values[i]
+        return self.default
+
+    def lookup_many(self, values):
+        lows, highs, scores, default = self.lows, self.highs, self.values, self.default
+        result = []
+        for value in values:
+            i = bisect_right(lows, value) - 1
+            result.append(scores[i] if i >= 0 and value < highs[i] else default)
+        return result
+
+
+class ProfileScorer:
+    """Preference profile compiled into bucket tables"""
+
+    def __init__(self, profile):
+        baseline = profile['baseline_rating']
+        self.weight = BucketTable(profile['weight_preferences'], baseline)
+        self.bgg = BucketTable(profile['bgg_preferences'], baseline)
+        self.year = BucketTable(profile['year_preferences'], baseline)
+
+    def score_batch(self, weights, averages, years, ranks):
+        """Final personalizedScore for each game, rounded like the JSON output"""
+        weight_scores = self.weight.lookup_many(weights)
+        bgg_scores = self.bgg.lookup_many(averages)
+        year_scores = self.year.lookup_many(years)
+        return [
+            round(
+                (bgg * BGG_WEIGHT + weight * COMPLEXITY_WEIGHT + year * RECENCY_WEIGHT)
+                + rank_boost(rank),
+                3,
+            )
+            for weight, bgg, year, rank in zip(weight_scores, bgg_scores, year_scores, ranks)
+        ]
+
+    def score(self, weight, average, year, rank):
+        return self.score_batch([weight], [average], [year], [rank])[0]
+
+
+def rank_boost(rank):
+    """Bonus for well-ranked games; unranked (0) and deep ranks get nothing"""
+    if rank <= 0:
+        return 0
+    return max(0, (RANK_BOOST_DEPTH + 1 - rank) / RANK_BOOST_DEPTH * RANK_BOOST)
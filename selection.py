@@ -0,0 +1,132 @@
+"""
+Top-K selection for the recommendation builders
+
+Only the first few hundred games of a buy list are ever seen, so fully
+sorting a candidate pool of the whole BGG catalog wastes O(n log n) work.
+top_k() orders just the best k with a bounded heap (O(n log k)) and can
+append the rest as an unordered tail.
+
+iter_top_k() is the streaming variant for generator pipelines: it consumes
+any iterable and keeps memory bounded by k, spilling to temporary files
+where the whole input has to be kept (a full sort or an unordered tail).
+"""
+
+import heapq
+import pickle
+import tempfile
+
+RUN_SIZE = 10000  # items sorted in memory per run before spilling to disk
+
+
+def top_k(items, k, key, reverse=False, keep_tail=False):
+    """Return the best `k` items ordered by `key`, optionally followed by the rest
+
+    With k=None everything is sorted, exactly like sorted(). Ties keep their
+    input order, so the head always equals sorted(items, ...)[:k]. The tail
+    (keep_tail=True) holds the remaining items in input order.
+    """
+    if k is None:
+        return sorted(items, key=key, reverse=reverse)
+
+    select = heapq.nlargest if reverse else heapq.nsmallest
+    if not keep_tail:
+        return select(k, items, key=key)
+
+    items = list(items)
+    head = select(k, range(len(items)), key=lambda i: key(items[i]))
+    chosen = set(head)
+    return [items[i] for i in head] + [item for i, item in enumerate(items) if i not in chosen]
+
+
+class _Spill:
+    """Pickled items in a temporary file, read back in write order"""
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+
+    def write(self, item):
+        pickle.dump(item, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def __iter__(self):
+        self.file.seek(0)
+        try:
+            while True:
+                yield pickle.load(self.file)
+        except EOFError:
+            pass
+        finally:
+            self.file.close()
+
+
+def _spill_run(run, key, reverse):
+    run.sort(key=lambda pair: key(pair[1]), reverse=reverse)
+    spill = _Spill()
+    for pair in run:
+        spill.write(pair)
+    return spill
+
+
+def _external_sort(items, key, reverse, run_size):
+    """Stable sort holding at most run_size items, merging sorted runs from disk"""
+    runs = []
+    run = []
+    for pair in enumerate(items):
+        run.append(pair)
+        if len(run) == run_size:
+            runs.append(_spill_run(run, key, reverse))
+            run = []
+
+    if not runs:
+        run.sort(key=lambda pair: key(pair[1]), reverse=reverse)
+        for _, item in run:
+            yield item
+        return
+
+    if run:
+        runs.append(_spill_run(run, key, reverse))
+    # The input position breaks ties, keeping the merge as stable as sorted()
+    if reverse:
+        merge_key = lambda pair: (key(pair[1]), -pair[0])
+    else:
+        merge_key = lambda pair: (key(pair[1]), pair[0])
+    for _, item in heapq.merge(*runs, key=merge_key, reverse=reverse):
+        yield item
+
+
+def iter_top_k(items, k, key, reverse=False, keep_tail=False, run_size=RUN_SIZE):
+    """Streaming top_k(): same order, but yields items and accepts any iterable
+
+    Selecting k items holds only those k. A full sort (k=None) holds at most
+    run_size items at a time, and keep_tail spills the input to disk to
+    replay the tail afterwards.
+    """
+    if k is None:
+        yield from _external_sort(items, key, reverse, run_size)
+        return
+
+    select = heapq.nlargest if reverse else heapq.nsmallest
+    if not keep_tail:
+        items = iter(items)
+        head = select(k, items, key=key)
+        for _ in items:
+            pass  # select() stops early for k=0; drain so upstream counters finish
+        yield from head
+        return
+
+    spill = _Spill()
+
+    def spilled():
+        for pair in enumerate(items):
+            spill.write(pair)
+            yield pair
+
+    pairs = spilled()
+    head = select(k, pairs, key=lambda pair: key(pair[1]))
+    for _ in pairs:
+        pass  # select() stops early for k=0; the tail still needs every item
+    chosen = {seq for seq, _ in head}
+    for _, item in head:
+        yield item
+    for seq, item in spill:
+        if seq not in chosen:
+            yield item
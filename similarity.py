@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+"More like this": content-based similar games for owned and buy list games
+
+    python3 similarity.py                               # rebuild similar-games.json
+    python3 similarity.py "Brass: Birmingham"          # 10 most similar unowned games
+    python3 similarity.py 224517 -n 20 --kdtree
+
+Every game of the two lists becomes a feature vector: weight, log playing
+time, player range, year, BGG average, a flag per ranks dump category and
+a bit per player count of the best/recommended polls. Each column is
+standardized over all games (poll columns over the games with a poll
+result, and an unknown poll is left at the mean so it neither matches nor
+mismatches), weighted, and every row scaled to unit length, so the
+similarity of two games is the dot product of their rows: their cosine.
+
+The vectors are one flat row-major array('d') matrix (stdlib, like
+the rest of the pipeline). The blocked scan scores BLOCK_ROWS candidates
+per query in one pass: each column of a block is packed, as 20-bit fixed
+point numbers in 64-bit fields, into one big integer, so a query times a
+block is DIM integer multiply-adds and the block's scores come out as an
+array('Q'). The best 2n + 1 of those are re-scored in floating point. The
+fixed point error of a packed score is below 1e-5, so this only differs
+from an exact scan when more than n games tie with the n-th to that
+precision. A KD-tree over the candidate rows is an exact alternative (for
+unit vectors the Euclidean nearest neighbours are the cosine nearest ones,
+|a - b|^2 = 2 - 2 cos).
+
+The neighbour table (the top NEIGHBOURS buy list games of every owned
+game) is stored in the catalog and exported as similar-games.json by
+`python3 similarity.py` (a pipeline.py stage) and sync_collection.py. It
+is keyed on the features of the two lists and only recomputed when they
+change.
+"""
+
+import argparse
+import hashlib
+import heapq
+import math
+import os
+from array import array
+from operator import itemgetter, mul
+
+from catalog_db import CATALOG_PATH, SIMILAR_GAMES_JSON, Catalog, load_games
+from game_ids import IdSet
+from imputation import MAX_PLAYERS, YEAR_RANGE, YEAR_UNKNOWN
+from instrumentation import run_report, span
+from player_polls import OVERFLOW_PLAYERS, player_bit
+from ranks_reader import CATEGORY_RANK_COLUMNS, RANKS_CSV, read_ranks
+
+NEIGHBOURS = 10  # similar games stored per owned game
+BLOCK_ROWS = 1024  # candidate rows per block of the blocked scan
+FIXED_POINT = 1 << 20  # scale of the packed block scores
+TABLE_VERSION = 1  # part of the table key: bump when the features change
+LEAF_SIZE = 16  # KD-tree leaf size
+METHODS = ('blocked', 'kdtree')
+
+NUMERIC_FEATURES = ('avgweight', 'playingtime', 'minplayers', 'maxplayers', 'yearpublished', 'average')
+POLL_FIELDS = ('bggbestplayers', 'bggrecplayers')
+# Weights after standardization; the categories and poll bits are many
+# columns each, so they count for less one by one
+CATEGORY_WEIGHT = 0.75
+POLL_WEIGHT = 0.5
+
+
+def _year(value):
+    try:
+        year = int(value)
+    except (TypeError, ValueError):
+        return YEAR_UNKNOWN
+    return min(max(year, YEAR_RANGE[0]), YEAR_RANGE[1])
+
+
+def numeric_features(game):
+    """Raw numeric features of a game dict (NUMERIC_FEATURES order)"""
+    return [
+        game['avgweight'],
+        math.log(max(game['playingtime'], 1)),
+        min(game['minplayers'], MAX_PLAYERS),
+        min(game['maxplayers'], MAX_PLAYERS),
+        _year(game['yearpublished']),
+        game.get('average', 0),
+    ]
+
+
+def poll_features(game):
+    """One 0/1 feature per player count of each poll (None if the game has no poll result)"""
+    masks = [game.get(field, 0) for field in POLL_FIELDS]
+    if not any(masks):
+        return None
+    return [1.0 if mask & player_bit(players) else 0.0
+            for mask in masks for players in range(1, OVERFLOW_PLAYERS + 1)]
+
+
+def category_flags(ids, ranks_path=RANKS_CSV):
+    """{game id: 0/1 per CATEGORY_RANK_COLUMNS} from the ranks dump (empty without one)"""
+    try:
+        rows = read_ranks(['id'] + CATEGORY_RANK_COLUMNS, path=ranks_path, ranked_only=False,
+                          include_expansions=True, only_ids=IdSet(ids))
+        return {row.id: [1.0 if rank else 0.0 for rank in row[1:]] for row in rows}
+    except FileNotFoundError:
+        return {}
+
+
+def _pack(values):
+    """One big integer holding `values` (non-negative, < 2**64) as little-endian 64-bit fields"""
+    return int.from_bytes(array('Q', values).tobytes(), 'little')
+
+
+def _standardize(columns, weight):
+    """Columns (lists, None = unknown) as weighted z-scores; unknown values become 0"""
+    result = []
+    for column in columns:
+        known = [value for value in column if value is not None]
+        mean = sum(known) / len(known) if known else 0.0
+        std = math.sqrt(sum((value - mean) ** 2 for value in known) / len(known)) if known else 0.0
+        scale = weight / std if std else 0.0
+        result.append([0.0 if value is None else (value - mean) * scale for value in column])
+    return result
+
+
+class KDTree:
+    """KD-tree over rows of a SimilarityIndex matrix, for exact Euclidean nearest neighbours"""
+
+    def __init__(self, rows, positions, leaf_size=LEAF_SIZE):
+        self.rows = rows
+        self.leaf_size = leaf_size
+        self.root = self._build(list(positions))
+
+    def _build(self, positions):
+        if len(positions) <= self.leaf_size:
+            return positions
+        rows = self.rows
+        # Split on the axis with the widest spread, at the median
+        dim = len(rows[positions[0]])
+        axis = max(range(dim), key=lambda j: max(rows[p][j] for p in positions)
+                   - min(rows[p][j] for p in positions))
+        positions.sort(key=lambda p: rows[p][axis])
+        middle = len(positions) // 2
+        split = rows[positions[middle]][axis]
+        return (axis, split, self._build(positions[:middle]), self._build(positions[middle:]))
+
+    def nearest(self, query, n, skip=-1):
+        """(squared distance, position) of the n rows nearest to `query`, nearest first"""
+        rows = self.rows
+        heap = []  # max-heap of the best n as (-distance, -position)
+
+        def visit(node):
+            if isinstance(node, list):
+                for p in node:
+                    if p == skip:
+                        continue
+                    distance = sum((a - b) ** 2 for a, b in zip(query, rows[p]))
+                    if len(heap) < n:
+                        heapq.heappush(heap, (-distance, -p))
+                    elif (-distance, -p) > heap[0]:
+                        heapq.heapreplace(heap, (-distance, -p))
+                return
+            axis, split, left, right = node
+            diff = query[axis] - split
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            if len(heap) < n or diff * diff <= -heap[0][0]:
+                visit(far)
+
+        visit(self.root)
+        return sorted((-distance, -p) for distance, p in heap)
+
+
+class SimilarityIndex:
+    """Unit-length feature vectors of a list of games, as one row-major matrix"""
+
+    def __init__(self, games, categories=None):
+        games = list({game['id']: game for game in games}.values())
+        categories = categories or {}
+        self.ids = [game['id'] for game in games]
+        self.names = [game['name'] for game in games]
+        self.positions = {game_id: p for p, game_id in enumerate(self.ids)}
+
+        numeric = [numeric_features(game) for game in games]
+        flags = [categories.get(game['id'], [0.0] * len(CATEGORY_RANK_COLUMNS)) for game in games]
+        polls = [poll_features(game) for game in games]
+        columns = (
+            _standardize([[row[j] for row in numeric] for j in range(len(NUMERIC_FEATURES))], 1.0)
+            + _standardize([[row[j] for row in flags] for j in range(len(CATEGORY_RANK_COLUMNS))],
+                           CATEGORY_WEIGHT)
+            + _standardize([[None if bits is None else bits[j] for bits in polls]
+                            for j in range(2 * OVERFLOW_PLAYERS)], POLL_WEIGHT)
+        )
+        self.dim = len(columns)
+
+        self.matrix = array('d')
+        for row in zip(*columns):
+            # A row with nothing but average values stays all zeros (similarity 0)
+            norm = math.sqrt(sum(value * value for value in row)) or 1.0
+            self.matrix.extend(value / norm for value in row)
+        view = memoryview(self.matrix)
+        self.rows = [view[p * self.dim:(p + 1) * self.dim] for p in range(len(self.ids))]
+        self._blocks = {}
+        self._trees = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, game_id):
+        return game_id in self.positions
+
+    def similarity(self, a, b):
+        """Cosine similarity of two games by id"""
+        return sum(map(mul, self.rows[self.positions[a]], self.rows[self.positions[b]]))
+
+    def _candidate_positions(self, candidate_ids):
+        if candidate_ids is None:
+            return list(range(len(self.ids)))
+        return [self.positions[game_id] for game_id in candidate_ids if game_id in self.positions]
+
+    def _packed_blocks(self, candidates):
+        """(first, positions, packed columns, offsets, ones) per BLOCK_ROWS candidates
+
+        Values are stored as v * FIXED_POINT + FIXED_POINT, so every field
+        is non-negative. offsets holds FIXED_POINT * the row sum of each
+        candidate and ones a 1 in every field; _blocked() uses both to remove
+        the bias again.
+        """
+        key = tuple(candidates)
+        blocks = self._blocks.get(key)
+        if blocks is not None:
+            return blocks
+        blocks = self._blocks[key] = []
+        for start in range(0, len(candidates), BLOCK_ROWS):
+            positions = candidates[start:start + BLOCK_ROWS]
+            fixed = [[round(value * FIXED_POINT) + FIXED_POINT for value in self.rows[p]]
+                     for p in positions]
+            columns = [_pack([row[j] for row in fixed]) for j in range(self.dim)]
+            offsets = _pack([FIXED_POINT * sum(row) for row in fixed])
+            blocks.append((positions, columns, offsets, _pack([1] * len(positions))))
+        return blocks
+
+    def _blocked(self, queries, candidates, n):
+        """Top n (similarity, position) per query position, scoring BLOCK_ROWS candidates at a time"""
+        rows = self.rows
+        blocks = self._packed_blocks(candidates)
+        keep = 2 * n + 1
+        found = {}
+        for q in queries:
+            query = [round(value * FIXED_POINT) + FIXED_POINT for value in rows[q]]
+            # Every field ends up as (dot product + dim) * FIXED_POINT^2
+            bias = 2 * self.dim * FIXED_POINT * FIXED_POINT - FIXED_POINT * sum(query)
+            best = []
+            for positions, columns, offsets, ones in blocks:
+                packed = sum(map(mul, query, columns)) - offsets + bias * ones
+                scores = array('Q')
+                scores.frombytes(packed.to_bytes(8 * len(positions), 'little'))
+                best = heapq.nlargest(keep, best + list(zip(scores, positions)))
+            exact = ((sum(map(mul, rows[q], rows[c])), -c) for _, c in best if c != q)
+            found[q] = [(score, -c) for score, c in heapq.nlargest(n, exact)]
+        return found
+
+    def _kdtree(self, queries, candidates, n):
+        key = tuple(candidates)
+        tree = self._trees.get(key)
+        if tree is None:
+            tree = self._trees[key] = KDTree(self.rows, candidates)
+        rows = self.rows
+        return {q: [(sum(map(mul, rows[q], rows[c])), c) for _, c in tree.nearest(rows[q], n, skip=q)]
+                for q in queries}
+
+    def neighbours(self, query_ids, candidate_ids=None, n=NEIGHBOURS, method='blocked'):
+        """{query id: [(game id, similarity), ...]} of the n candidates most like each query
+
+        candidate_ids limits the neighbours to those games (default: every
+        game in the index); a game is never its own neighbour.
+        """
+        if method not in METHODS:
+            raise ValueError(f"Unknown method {method!r} (expected one of {', '.join(METHODS)})")
+        queries = [self.positions[game_id] for game_id in query_ids]
+        candidates = self._candidate_positions(candidate_ids)
+        found = (self._blocked if method == 'blocked' else self._kdtree)(queries, candidates, n)
+        return {self.ids[q]: [(self.ids[c], round(score, 4)) for score, c in top]
+                for q, top in found.items()}
+
+    def similar(self, game_id, candidate_ids=None, n=NEIGHBOURS, method='blocked'):
+        """[(game id, similarity), ...] of the n games most like one game"""
+        return self.neighbours([game_id], candidate_ids, n, method)[game_id]
+
+
+def load_index(ranks_path=RANKS_CSV, owned=None, recommendations=None):
+    """(SimilarityIndex over the owned and buy list games, owned games, buy list games)"""
+    owned = load_games('owned') if owned is None else owned
+    recommendations = load_games('recommendations') if recommendations is None else recommendations
+    games = owned + recommendations
+    index = SimilarityIndex(games, category_flags([game['id'] for game in games], ranks_path))
+    return index, owned, recommendations
+
+
+def table_key(owned, recommendations, n=NEIGHBOURS, ranks_path=RANKS_CSV):
+    """Identifies a neighbour table's inputs: the features of both lists and the ranks dump
+
+    Scores, ratings and play counts don't change it, nor does the buy
+    list's order.
+    """
+    fields = ('id', 'name') + NUMERIC_FEATURES + POLL_FIELDS
+    digest = hashlib.sha1()
+    for games in (owned, sorted(recommendations, key=itemgetter('id'))):
+        for game in games:
+            digest.update(repr([game.get(field) for field in fields]).encode('utf-8'))
+        digest.update(b'|')
+    try:
+        stat = os.stat(ranks_path)
+        digest.update(f'{stat.st_size}:{stat.st_mtime_ns}'.encode('ascii'))
+    except FileNotFoundError:
+        pass
+    digest.update(f'{n}:v{TABLE_VERSION}'.encode('ascii'))
+    return digest.hexdigest()
+
+
+def neighbour_table(n=NEIGHBOURS, method='blocked', ranks_path=RANKS_CSV, owned=None, recommendations=None):
+    """The n most similar buy list games of every owned game, in owned list order"""
+    index, owned, recommendations = load_index(ranks_path, owned, recommendations)
+    owned_ids = list(dict.fromkeys(game['id'] for game in owned))
+    neighbours = index.neighbours(owned_ids, [game['id'] for game in recommendations], n, method)
+    names = dict(zip(index.ids, index.names))
+    return [
+        {
+            'id': game_id,
+            'name': names[game_id],
+            'similar': [{'id': other, 'name': names[other], 'similarity': score}
+                        for other, score in neighbours[game_id]],
+        }
+        for game_id in owned_ids
+    ]
+
+
+def save_neighbour_table(n=NEIGHBOURS, ranks_path=RANKS_CSV, owned=None, recommendations=None,
+                         path=CATALOG_PATH):
+    """Recompute the neighbour table if its inputs changed; returns its size (None if unchanged)
+
+    The owned and buy lists are loaded unless given. The table goes to the
+    catalog and similar-games.json.
+    """
+    owned = load_games('owned', path) if owned is None else owned
+    recommendations = load_games('recommendations', path) if recommendations is None else recommendations
+    key = table_key(owned, recommendations, n, ranks_path)
+    with Catalog(path) as catalog:
+        if catalog.similar_games_key() == key:
+            if not os.path.exists(SIMILAR_GAMES_JSON):
+                catalog.export_similar_games()
+            return None
+        table = neighbour_table(n, 'blocked', ranks_path, owned, recommendations)
+        catalog.set_similar_games(table, key)
+        catalog.export_similar_games()
+    return len(table)
+
+
+def similar_games(game, n=NEIGHBOURS, include_owned=False, method='blocked', ranks_path=RANKS_CSV):
+    """Game dicts (plus 'similarity') most like `game`, an id or an exact name
+
+    Only buy list games unless include_owned. Raises KeyError for a game in
+    neither list.
+    """
+    index, owned, recommendations = load_index(ranks_path)
+    if game not in index:
+        matches = [game_id for game_id, name in zip(index.ids, index.names) if name == game]
+        if not matches:
+            raise KeyError(game)
+        game = matches[0]
+    by_id = {candidate['id']: candidate for candidate in owned + recommendations}
+    candidates = None if include_owned else [candidate['id'] for candidate in recommendations]
+    return [dict(by_id[game_id], similarity=score)
+            for game_id, score in index.similar(game, candidates, n, method)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('game', nargs='?',
+                        help='BGG id or exact name of an owned or buy list game '
+                             '(without one, similar-games.json is rebuilt)')
+    parser.add_argument('-n', type=int, default=NEIGHBOURS, help='number of similar games')
+    parser.add_argument('--owned', action='store_true', help='include owned games')
+    parser.add_argument('--kdtree', action='store_true', help='search a KD-tree instead of scanning')
+    args = parser.parse_args()
+
+    if args.game is None:
+        with span('similar_games'):
+            count = save_neighbour_table()
+        if count is None:
+            print("✓ similar-games.json is up to date")
+        else:
+            print(f"✓ Saved the {NEIGHBOURS} most similar buy list games of {count} owned games to similar-games.json")
+        return
+
+    game = int(args.game) if args.game.isdigit() else args.game
+    try:
+        games = similar_games(game, args.n, args.owned, 'kdtree' if args.kdtree else 'blocked')
+    except KeyError:
+        print(f"Error: {args.game} is neither an owned nor a buy list game")
+        return
+    for other in games:
+        print(f"  {other['similarity']:.3f}  {other['id']:>7} {other['name']}")
+    print(f"✓ {len(games)} similar games")
+
+
+if __name__ == '__main__':
+    with run_report():
+        main()
@@ -0,0 +1,54 @@
+"""
+Union of several pre-sorted candidate lists, deduplicated by game id
+
+A builder that draws buy candidates from more than one place (wishlist,
+tracked collection games, the ranks dump) passes each source as a list
+already sorted by the output key. merge_sources() then:
+
+1. records, per integer game id, which sources list it (a bitmask of the
+   flags below, stored on the game as 'sources') and keeps the record from
+   the highest-priority source that has it, in one pass over all sources;
+2. k-way merges the sources with a heap, skipping the duplicates.
+
+Both steps are linear in the number of games (times log k for the merge
+of k sources), so adding a source or a few thousand games stays cheap.
+"""
+
+import heapq
+
+# Source flags, in priority order
+WISHLIST = 1
+TRACKED = 2
+RANKS = 4
+
+SOURCE_NAMES = {WISHLIST: 'wishlist', TRACKED: 'tracked', RANKS: 'ranks'}
+
+
+def merge_sources(sources, key, reverse=False):
+    """Yield the games of all sources once each, ordered by key
+
+    sources is a list of (flag, games) pairs from highest to lowest priority;
+    every games list must already be sorted by key (with reverse). Ties keep
+    the higher-priority source first, then each source's own order, which
+    is what one stable sort of the concatenated sources would give.
+    """
+    flags = {}
+    chosen = {}
+    for flag, games in sources:
+        for game in games:
+            game_id = int(game['id'])
+            flags[game_id] = flags.get(game_id, 0) | flag
+            # Sources come in priority order, so the first record wins
+            chosen.setdefault(game_id, game)
+
+    sign = -1 if reverse else 1
+
+    def decorated(priority, games):
+        for seq, game in enumerate(games):
+            if chosen[int(game['id'])] is game:
+                yield (key(game), sign * priority, sign * seq), game
+
+    streams = [decorated(priority, games) for priority, (_, games) in enumerate(sources)]
+    for _, game in heapq.merge(*streams, key=lambda pair: pair[0], reverse=reverse):
+        game['sources'] = flags[int(game['id'])]
+        yield game
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Sync a fresh collection.csv export into the catalog and its JSON files
+
+Instead of regenerating everything, the new export is diffed against the
+snapshot taken at the previous sync (rows are matched by objectid/collid)
+and only the games that changed are patched:
+
+- owned-games.json: entries of changed games are rebuilt, in collection order
+- excluded-game-ids.json: only the catalog's collection rows of changed
+  games are replaced before the ids are exported
+- bgg-recommendations.json: newly excluded games are removed, changed games
+  are re-scored and moved to their new position. Only games that (re)enter
+  the list need a read of the ranks data.
+- similar-games.json: recomputed only if a game's features changed (see
+  similarity.py)
+
+If the ratings move the preference profile, every recommendation is
+re-scored from the rank and score stored in the file. If the games with
+known stats change (e.g. a new game in the collection), the imputation
+model is refitted and the buy list is rebuilt with the new estimates. Without a snapshot
+(first run) or with a buy list that has no scores, everything is rebuilt.
+The changeset of the last sync is written to .cache/collection-changeset.json.
+"""
+
+import argparse
+import json
+import os
+import pickle
+from datetime import datetime
+
+from analyze_preferences import analyze_preferences, build_profile, rated_games
+from build_personalized_recommendations import (
+    MAX_RANK, RANKS_COLUMNS, TOP_K, apply_estimates, build_personalized_recommendations,
+    load_known_stats, recommendation_for, score_games, score_order,
+)
+from catalog_db import load_games, load_profile, save_collection, save_games, save_profile
+from collection_store import CollectionRecord, load_collection
+from imputation import load_imputer
+from instrumentation import count_all, run_report, span
+from parse_collection import owned_game, parse_csv_to_json
+from ranks_reader import read_ranks
+from similarity import save_neighbour_table
+
+SNAPSHOT_PATH = os.path.join('.cache', 'collection-sync.pickle')
+CHANGESET_PATH = os.path.join('.cache', 'collection-changeset.json')
+SNAPSHOT_VERSION = 2
+
+def record_key(record):
+    return (record.objectid, record.collid)
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    try:
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        return None
+    return snapshot['records']
+
+
+def save_snapshot(records, path=SNAPSHOT_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({'version': SNAPSHOT_VERSION, 'records': records}, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def diff_collections(old_records, new_records):
+    """Changeset between two collection parses, matching rows by objectid/collid"""
+    old_by_key = {record_key(record): record for record in old_records}
+    new_by_key = {record_key(record): record for record in new_records}
+
+    def describe(record):
+        return {'objectid': record.objectid, 'collid': record.collid, 'name': record.objectname}
+
+    changeset = {'added': [], 'removed': [], 'changed': []}
+    for key, record in new_by_key.items():
+        old = old_by_key.get(key)
+        if old is None:
+            changeset['added'].append(describe(record))
+            continue
+        fields = {
+            name: [getattr(old, name), getattr(record, name)]
+            for name in CollectionRecord.__slots__
+            if getattr(old, name) != getattr(record, name)
+        }
+        if fields:
+            changeset['changed'].append(dict(describe(record), fields=fields))
+    for key, record in old_by_key.items():
+        if key not in new_by_key:
+            changeset['removed'].append(describe(record))
+    return changeset
+
+
+def changed_ids(changeset):
+    return {entry['objectid'] for entries in changeset.values() for entry in entries}
+
+
+def patch_owned_games(games, records, affected):
+    """Owned games in collection order, re-using the entries of unaffected games"""
+    unchanged = {}
+    for game in games:
+        if game['id'] not in affected:
+            unchanged.setdefault(game['id'], []).append(game)
+
+    patched = []
+    for record in records:
+        if record.own != 1:
+            continue
+        entries = unchanged.get(record.objectid)
+        patched.append(entries.pop(0) if entries else owned_game(record))
+    return patched
+
+
+def patch_recommendations(games, records, affected, excluded_ids, profile, rescore_all, imputer=None):
+    """Patched, re-ordered buy list plus counts of removed/added/re-scored games"""
+    collection_data = load_known_stats(records)
+
+    kept = []
+    touched = []
+    present = set()
+    removed = 0
+    refetch = set()
+    for game in games:
+        game_id = game['id']
+        if game_id in excluded_ids:
+            removed += 1
+        elif game_id not in affected:
+            kept.append(game)
+            present.add(game_id)
+        elif game_id in collection_data:
+            apply_estimates(game, collection_data[game_id])
+            touched.append(game)
+            present.add(game_id)
+        else:
+            # Left the collection, so it falls back to estimated stats
+            refetch.add(game_id)
+
+    # Games that are no longer excluded come back from the ranks data
+    refetch |= {game_id for game_id in affected if game_id not in excluded_ids and game_id not in present}
+    added = 0
+    if refetch:
+        listed = {game['id'] for game in games}
+        current_year = datetime.now().year
+        for row in read_ranks(RANKS_COLUMNS, max_rank=MAX_RANK, exclude_ids=excluded_ids):
+            if row.id in refetch:
+                touched.append(recommendation_for(row, collection_data, current_year, imputer))
+                added += row.id not in listed
+
+    rescored = kept + touched if rescore_all else touched
+    score_games(rescored, profile)
+
+    # The kept games are already in score order, so this is a merge of a
+    # sorted run with a few re-scored games; same key as the full build
+    patched = sorted(kept + touched, key=score_order, reverse=True)
+    if TOP_K is not None:
+        patched = patched[:TOP_K]
+    return patched, {'removed': removed, 'added': added, 'rescored': len(rescored)}
+
+
+def update_similar_games(owned=None, recommendations=None):
+    """Recompute similar-games.json, unless the games' features are unchanged"""
+    with span('similar_games'):
+        count = save_neighbour_table(owned=owned, recommendations=recommendations)
+    if count is not None:
+        print(f"✓ Rebuilt similar-games.json ({count} owned games)")
+
+
+def full_rebuild(records):
+    parse_csv_to_json()
+    analyze_preferences()
+    build_personalized_recommendations()
+    update_similar_games()
+    save_snapshot(records)
+
+
+def sync_collection(full=False):
+    records = load_collection()
+    previous = None if full else load_snapshot()
+    if previous is None:
+        print("No previous sync snapshot, rebuilding everything\n")
+        full_rebuild(records)
+        return
+
+    changeset = diff_collections(previous, records)
+    os.makedirs(os.path.dirname(CHANGESET_PATH) or '.', exist_ok=True)
+    with open(CHANGESET_PATH, 'w', encoding='utf-8') as f:
+        json.dump(changeset, f, indent=2)
+    print(f"✓ Changeset: {len(changeset['added'])} added, {len(changeset['changed'])} changed, "
+          f"{len(changeset['removed'])} removed rows (saved to {CHANGESET_PATH})")
+
+    affected = changed_ids(changeset)
+    if not affected:
+        print("✓ Nothing to sync")
+        return
+
+    recommendations = load_games('recommendations')
+    if recommendations and 'personalizedScore' not in recommendations[0]:
+        print("bgg-recommendations.json has no personalized scores, rebuilding everything\n")
+        full_rebuild(records)
+        return
+
+    owned_games = patch_owned_games(load_games('owned'), records, affected)
+    save_games('owned', owned_games)
+    print(f"✓ Patched owned-games.json ({len(owned_games)} games)")
+
+    excluded_ids = save_collection(records, objectids=affected)
+    print(f"✓ Patched excluded-game-ids.json ({len(excluded_ids)} excluded games)")
+
+    # Round-trip through JSON so the bucket tuples compare equal to the file's lists
+    profile = json.loads(json.dumps(build_profile(rated_games(records))))
+    profile_changed = load_profile() != profile
+    if profile_changed:
+        save_profile(profile)
+        print(f"✓ Preference profile changed (baseline rating {profile['baseline_rating']:.2f})")
+
+    imputer, refitted = load_imputer(records)
+    if refitted:
+        print("✓ Imputation model refitted, rebuilding bgg-recommendations.json\n")
+        build_personalized_recommendations()
+        update_similar_games(owned_games)
+        save_snapshot(records)
+        return
+
+    recommendations, counts = patch_recommendations(
+        recommendations, records, affected, excluded_ids, profile,
+        rescore_all=profile_changed, imputer=imputer)
+    save_games('recommendations', recommendations)
+    count_all('sync', counts)
+    print(f"✓ Patched bgg-recommendations.json ({len(recommendations)} games): "
+          f"{counts['removed']} removed, {counts['added']} added, {counts['rescored']} re-scored")
+
+    update_similar_games(owned_games, recommendations)
+
+    save_snapshot(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--full', action='store_true', help='ignore the snapshot and rebuild everything')
+    args = parser.parse_args()
+    sync_collection(full=args.full)
+
+
+if __name__ == '__main__':
+    with run_report():
+        main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Generate synthetic BGG data files for benchmarks
+
+    python3 synthetic_data.py ranks 1000000 boardgames_ranks.csv
+    python3 synthetic_data.py collection 5000 collection.csv --ranks boardgames_ranks.csv
+
+The files have the same columns and quirks as the real exports (unranked
+rows, expansions, empty category ranks, names with quoted commas and
+newlines), so every script reads them unchanged. Output is deterministic
+for a given seed, and rows are written as they are generated, so even a
+multi-million row dump needs little memory.
+"""
+
+import argparse
+import csv
+import random
+
+from ranks_reader import CATEGORY_RANK_COLUMNS, read_ranks
+
+RANKS_HEADER = [
+    'id', 'name', 'yearpublished', 'rank', 'bayesaverage', 'average',
+    'usersrated', 'is_expansion',
+] + CATEGORY_RANK_COLUMNS
+
+COLLECTION_HEADER = [
+    'objectname', 'objectid', 'rating', 'numplays', 'weight', 'own', 'fortrade',
+    'want', 'wanttobuy', 'wanttoplay', 'prevowned', 'preordered', 'wishlist',
+    'wishlistpriority', 'wishlistcomment', 'comment', 'conditiontext',
+    'haspartslist', 'wantpartslist', 'collid', 'baverage', 'average',
+    'avgweight', 'rank', 'numowned', 'objecttype', 'originalname', 'minplayers',
+    'maxplayers', 'playingtime', 'maxplaytime', 'minplaytime', 'yearpublished',
+    'bggrecplayers', 'bggbestplayers', 'bggrecagerange', 'bgglanguagedependence',
+    'publisherid', 'imageid', 'year', 'language', 'other', 'itemtype', 'barcode',
+    'version_publishers', 'version_languages', 'version_yearpublished',
+    'version_nickname',
+]
+
+CORRECTIONS_HEADER = ['Current ID', 'Game Name', 'Year', 'Correct ID (fill this in)']
+
+# Roughly the shape of the real dump: ~16% of rows ranked
+RANKED_FRACTION = 0.16
+EXPANSION_FRACTION = 0.25
+PLAYING_TIMES = [15, 20, 30, 45, 60, 90, 120, 150, 180, 240]
+
+
+def _name(rng, game_id):
+    roll = rng.random()
+    if roll < 0.001:
+        return f'Game {game_id}\nSecond Edition'
+    if roll < 0.01:
+        return f'Game {game_id}, Deluxe "Big Box"'
+    return f'Game {game_id}'
+
+
+def generate_ranks(path, rows, seed=0, ranked_fraction=RANKED_FRACTION):
+    """Write a boardgames_ranks.csv with `rows` games"""
+    rng = random.Random(seed)
+    ranked_total = int(rows * ranked_fraction)
+    # Ranks are a permutation of 1..ranked_total: the j-th ranked row gets
+    # (stride * j) % ranked_total + 1 with stride coprime to the total
+    stride = 7919 if ranked_total % 7919 else 7907
+
+    ranked_seen = 0
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(RANKS_HEADER)
+        for i in range(rows):
+            game_id = i * 3 + rng.randrange(1, 4)
+            year = '' if rng.random() < 0.01 else rng.randint(1950, 2025)
+
+            # Selection sampling: exactly ranked_total rows end up ranked
+            if rng.random() * (rows - i) < ranked_total - ranked_seen:
+                rank = (stride * ranked_seen) % ranked_total + 1
+                ranked_seen += 1
+                bayes = 8.5 - 3.0 * rank / ranked_total + rng.uniform(-0.05, 0.05)
+                average = bayes + rng.uniform(0.0, 1.0)
+                usersrated = int(30 + 100000 * (1 - rank / ranked_total) ** 6 + rng.randrange(50))
+                is_expansion = 1 if rng.random() < 0.02 else 0
+                categories = [''] * len(CATEGORY_RANK_COLUMNS)
+                for c in rng.sample(range(len(categories)), rng.randint(0, 2)):
+                    categories[c] = rng.randint(1, max(1, ranked_total // 4))
+                writer.writerow([game_id, _name(rng, game_id), year, rank,
+                                 f'{bayes:.5f}', f'{average:.5f}', usersrated, is_expansion]
+                                + categories)
+            else:
+                is_expansion = 1 if rng.random() < EXPANSION_FRACTION else 0
+                usersrated = rng.randrange(30)
+                average = f'{rng.uniform(1, 10):.5f}' if usersrated else 0
+                writer.writerow([game_id, _name(rng, game_id), year, 0, 0, average,
+                                 usersrated, is_expansion] + [''] * len(CATEGORY_RANK_COLUMNS))
+
+
+def _players_list(low, high):
+    return ','.join(str(n) for n in range(low, high + 1))
+
+
+def generate_collection(path, rows, ranks_path=None, seed=0):
+    """Write a collection.csv export with `rows` rows
+
+    With ranks_path, the games are drawn from the ranked games of that dump,
+    so the builders' exclusion and cross-referencing have real work to do.
+    """
+    rng = random.Random(seed)
+    games = []
+    if ranks_path:
+        games = [(row.id, row.name, row.yearpublished)
+                 for row in read_ranks(['id', 'name', 'yearpublished'], path=ranks_path,
+                                       use_snapshot=False)]
+        rng.shuffle(games)
+
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+        writer.writerow(COLLECTION_HEADER)
+        for i in range(rows):
+            if i < len(games):
+                game_id, name, year = games[i]
+            else:
+                game_id = 10_000_000 + i
+                name, year = f'Game {game_id}', rng.randint(1980, 2025)
+            year = '' if year is None else year
+
+            own = 1 if rng.random() < 0.6 else 0
+            prevowned = 1 if not own and rng.random() < 0.25 else 0
+            wishlist = 1 if not own and not prevowned and rng.random() < 0.5 else 0
+            rating = f'{rng.randint(2, 20) / 2:g}' if (own or prevowned) and rng.random() < 0.7 else ''
+            minplayers = rng.randint(1, 2)
+            maxplayers = rng.randint(minplayers, 8)
+            playingtime = rng.choice(PLAYING_TIMES)
+            average = rng.uniform(5.5, 8.8)
+            weight = rng.uniform(1.0, 4.8)
+
+            values = {
+                'objectname': name,
+                'objectid': game_id,
+                'rating': rating,
+                'numplays': rng.randrange(40) if own else 0,
+                'weight': 0,
+                'own': own,
+                'fortrade': 0,
+                'want': 0,
+                'wanttobuy': 1 if wishlist and rng.random() < 0.3 else 0,
+                'wanttoplay': 0,
+                'prevowned': prevowned,
+                'preordered': 0,
+                'wishlist': wishlist,
+                'wishlistpriority': 3,
+                'collid': 100_000_000 + i,
+                'baverage': f'{average - 0.6:.5f}',
+                'average': f'{average:.5f}',
+                'avgweight': f'{weight:.4f}',
+                'rank': 0,
+                'numowned': rng.randrange(100, 100000),
+                'objecttype': 'thing',
+                'originalname': name,
+                'minplayers': minplayers,
+                'maxplayers': maxplayers,
+                'playingtime': playingtime,
+                'maxplaytime': playingtime,
+                'minplaytime': playingtime // 2,
+                'yearpublished': year,
+                'bggrecplayers': _players_list(minplayers, maxplayers),
+                'bggbestplayers': str(rng.randint(minplayers, maxplayers)),
+                'bggrecagerange': '10+',
+                'itemtype': 'expansion' if rng.random() < 0.1 else 'standalone',
+            }
+            writer.writerow([values.get(column, '') for column in COLLECTION_HEADER])
+
+
+def generate_corrections(path, games, count, seed=0):
+    """Write a bgg-id-corrections.csv correcting `count` of the given games"""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CORRECTIONS_HEADER)
+        for game in rng.sample(games, min(count, len(games))):
+            writer.writerow([game['id'], game['name'], game['yearpublished'],
+                             int(game['id']) + 1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('kind', choices=['ranks', 'collection'])
+    parser.add_argument('rows', type=int)
+    parser.add_argument('path')
+    parser.add_argument('--ranks', help='ranks CSV to draw collection games from')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.kind == 'ranks':
+        generate_ranks(args.path, args.rows, seed=args.seed)
+    else:
+        generate_collection(args.path, args.rows, ranks_path=args.ranks, seed=args.seed)
+    print(f"✓ Wrote {args.rows} rows to {args.path}")
+
+
+if __name__ == '__main__':
+    main()
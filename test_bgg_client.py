@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Tests for bgg_client.BGGClient against a local stub of the BGG XML API
+
+    python3 test_bgg_client.py        # or: python3 -m pytest test_bgg_client.py
+
+The stub (http.server on a free port) answers `thing` requests from
+STUB_GAMES, records every request it gets, and can be told to answer the
+next requests with a 202 or a 429 first.
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from bgg_client import THING_BATCH_SIZE, BGGClient
+from player_polls import players_mask
+
+STUB_GAMES = {
+    1: {'name': 'Stub One', 'minplayers': 2, 'maxplayers': 4},
+    2: {'name': 'Stub Two', 'minplayers': 1, 'maxplayers': 5},
+    3: {'name': 'Stub Three', 'minplayers': 3, 'maxplayers': 6},
+}
+MISSING_ID = 999
+
+# numplayers -> (best, recommended, not recommended) votes of every stub game;
+# "4+" is BGG's "more than the box says", read as 5 players
+POLL = {
+    '2': (1, 3, 10),
+    '3': (8, 4, 1),
+    '4': (2, 9, 1),
+    '4+': (6, 1, 0),
+}
+
+
+def thing_item(game_id):
+    game = STUB_GAMES[game_id]
+    results = ''.join(
+        f'<results numplayers="{numplayers}">'
+        f'<result value="Best" numvotes="{best}"/>'
+        f'<result value="Recommended" numvotes="{rec}"/>'
+        f'<result value="Not Recommended" numvotes="{not_rec}"/>'
+        '</results>'
+        for numplayers, (best, rec, not_rec) in POLL.items())
+    return (
+        f'<item type="boardgame" id="{game_id}">'
+        f'<name type="primary" value="{game["name"]}"/>'
+        '<yearpublished value="2020"/>'
+        f'<minplayers value="{game["minplayers"]}"/>'
+        f'<maxplayers value="{game["maxplayers"]}"/>'
+        '<playingtime value="90"/>'
+        f'<poll name="suggested_numplayers">{results}</poll>'
+        '<statistics><ratings><average value="7.5"/><averageweight value="2.75"/></ratings></statistics>'
+        '</item>'
+    )
+
+
+class StubBGG(BaseHTTPRequestHandler):
+    requests = []  # query parameters of every request, in arrival order
+    queued = []  # status codes to answer the next requests with before a 200
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        StubBGG.requests.append(dict(params, status=StubBGG.queued[0] if StubBGG.queued else 200))
+
+        if StubBGG.queued:
+            status = StubBGG.queued.pop(0)
+            self.send_response(status)
+            if status == 429:
+                self.send_header('Retry-After', '0')
+            self.end_headers()
+            return
+
+        ids = [int(game_id) for game_id in params['id'].split(',')]
+        body = '<items>' + ''.join(thing_item(game_id) for game_id in ids if game_id in STUB_GAMES) + '</items>'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.end_headers()
+        self.wfile.write(body.encode('utf-8'))
+
+    def log_message(self, format, *args):
+        pass
+
+
+server = None
+client = None
+
+
+def setup_module(module=None):
+    """Start the stub on a free port and a client pointed at it (pytest calls this too)"""
+    global server, client
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubBGG)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    client = BGGClient(base_url=f'http://{host}:{port}', rate=1000, burst=1000, backoff=0)
+
+
+def teardown_module(module=None):
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_retries_202_then_429():
+    StubBGG.requests.clear()
+    StubBGG.queued[:] = [202, 429]
+    games = client.fetch_things([1])
+    statuses = [request['status'] for request in StubBGG.requests]
+    assert statuses == [202, 429, 200], statuses
+    assert list(games) == [1], games
+    print("✓ 202 and 429 (with Retry-After) are retried until BGG answers")
+
+
+def test_batching_and_dedup():
+    StubBGG.requests.clear()
+    ids = [1, 2, 1, 3, '2'] + [MISSING_ID] * (THING_BATCH_SIZE + 1)
+    games = client.fetch_things(ids)
+    assert len(StubBGG.requests) == 1, StubBGG.requests
+    requested = StubBGG.requests[0]['id'].split(',')
+    assert requested == ['1', '2', '3', str(MISSING_ID)], requested
+    assert StubBGG.requests[0]['stats'] == '1'
+    assert sorted(games) == [1, 2, 3], sorted(games)
+    print("✓ Duplicate ids are requested once, in one comma-separated batch")
+
+    StubBGG.requests.clear()
+    client.fetch_things(range(1000, 1000 + 2 * THING_BATCH_SIZE + 1))
+    sizes = sorted(len(request['id'].split(',')) for request in StubBGG.requests)
+    assert sizes == [1, THING_BATCH_SIZE, THING_BATCH_SIZE], sizes
+    print(f"✓ Batches hold at most {THING_BATCH_SIZE} ids")
+
+
+def test_missing_id_left_out():
+    games = client.fetch_things([2, MISSING_ID])
+    assert list(games) == [2], games
+    print("✓ Ids BGG returns no item for are left out")
+
+
+def test_parsed_game():
+    game = client.fetch_things([3])[3]
+    assert game['name'] == 'Stub Three'
+    assert (game['minplayers'], game['maxplayers'], game['playingtime']) == (3, 6, 90)
+    assert (game['average'], game['avgweight']) == (7.5, 2.75)
+    # Best: 3 and "4+" (5 players); recommended: 3, 4 and "4+"
+    assert game['bggbestplayers'] == players_mask(3) | players_mask(5), game['bggbestplayers']
+    assert game['bggrecplayers'] == players_mask(3) | players_mask(4) | players_mask(5), game['bggrecplayers']
+    print("✓ Poll results are encoded as bitmasks, \"N+\" as N + 1 players")
+
+
+def main():
+    setup_module()
+    try:
+        test_retries_202_then_429()
+        test_batching_and_dedup()
+        test_missing_id_left_out()
+        test_parsed_game()
+    finally:
+        teardown_module()
+    print("\n✓ All BGG client tests passed!")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,206 @@
 // Simple test to verify filtering logic
 const fs = require('fs');
 
+// Expand a game list into an array of game objects. Lists are written
+// column-oriented (see recommendations_io.py); plain arrays from older
+// builds are passed through unchanged.
+function decodeGames(data) {
+    if (Array.isArray(data)) return data;
+
+    const { count, fields, constants, columns } = data;
+    const games = new Array(count);
+    for (let i = 0; i < count; i++) {
+        const game = {};
+        for (const field of fields) {
+            game[field] = field in constants ? constants[field] : columns[field][i];
+        }
+        games[i] = game;
+    }
+    if (data.index) games.filterIndex = decodeFilterIndex(data.index);
+    return games;
+}
+
+// Bitset shipped by filter_index.py: base64 of little-endian bytes,
+// padded to whole 32-bit words (bit i = game i)
+function decodeBitset(encoded) {
+    const binary = atob(encoded);
+    const words = new Uint32Array(binary.length / 4);
+    const bytes = new Uint8Array(words.buffer);
+    for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+    return words;
+}
+
+function decodeFilterIndex(index) {
+    const decoded = {};
+    for (const [filter, bitsets] of Object.entries(index)) {
+        decoded[filter] = {};
+        for (const [value, encoded] of Object.entries(bitsets)) {
+            decoded[filter][value] = decodeBitset(encoded);
+        }
+    }
+    return decoded;
+}
+
+// Answer a filter combination by ANDing the precomputed bitsets.
+// Returns null if the index doesn't cover one of the filter values.
+function filterWithIndex(games, index, playerCount, complexity, duration, fit = '') {
+    const bitsets = [];
+    if (playerCount) bitsets.push((index[fit || 'players'] || {})[playerCount]);
+    if (complexity) bitsets.push(index.complexity[complexity]);
+    if (duration) bitsets.push(index.duration[duration]);
+    if (bitsets.some(bitset => !bitset)) return null;
+    if (bitsets.length === 0) return games.slice();
+
+    const matches = [];
+    for (let w = 0; w < bitsets[0].length; w++) {
+        let word = bitsets[0][w];
+        for (let b = 1; b < bitsets.length && word; b++) word &= bitsets[b][w];
+        while (word) {
+            const bit = 31 - Math.clz32(word & -word);
+            matches.push(games[w * 32 + bit]);
+            word &= word - 1;
+        }
+    }
+    return matches;
+}
+
+// Random picks that cycle through every matching game before any
+// repeats (the same sampler as sampler.py). Uniform picks use a
+// partial Fisher-Yates shuffle; weighted picks (buy recommendations,
+// by sampleWeight) use Vose's alias method, redrawing games already
+// shown this cycle and rebuilding the table over the rest once those
+// hold half of its weight.
+function createAliasTable(weights) {
+    const n = weights.length;
+    const total = weights.reduce((sum, weight) => sum + weight, 0);
+    const scaled = weights.map(weight => weight * n / total);
+    const prob = new Float64Array(n).fill(1);
+    const alias = new Int32Array(n).map((_, i) => i);
+
+    const small = [];
+    const large = [];
+    scaled.forEach((p, i) => (p < 1 ? small : large).push(i));
+    while (small.length && large.length) {
+        const s = small.pop();
+        const l = large.pop();
+        prob[s] = scaled[s];
+        alias[s] = l;
+        scaled[l] -= 1 - scaled[s];
+        (scaled[l] < 1 ? small : large).push(l);
+    }
+    return { prob, alias };
+}
+
+function drawAlias(table) {
+    const i = Math.floor(Math.random() * table.prob.length);
+    return Math.random() < table.prob[i] ? i : table.alias[i];
+}
+
+class CyclingSampler {
+    constructor(items, weights = null) {
+        this.items = items;
+        this.weights = weights;
+        this.newCycle();
+    }
+
+    newCycle() {
+        const n = this.items.length;
+        if (this.weights === null) {
+            this.order = Array.from({ length: n }, (_, i) => i);
+            this.remaining = n;
+        } else {
+            this.shown = new Uint8Array(n);
+            this.shownCount = 0;
+            this.rebuild(Array.from({ length: n }, (_, i) => i));
+        }
+    }
+
+    rebuild(active) {
+        this.active = active;
+        this.table = active.length ? createAliasTable(active.map(i => this.weights[i])) : null;
+        this.activeWeight = active.reduce((sum, i) => sum + this.weights[i], 0);
+        this.shownWeight = 0;
+    }
+
+    pickUniform() {
+        if (this.remaining === 0) this.remaining = this.order.length;
+        const j = Math.floor(Math.random() * this.remaining);
+        this.remaining--;
+        const order = this.order;
+        [order[j], order[this.remaining]] = [order[this.remaining], order[j]];
+        return order[this.remaining];
+    }
+
+    pickWeighted() {
+        if (this.shownCount === this.items.length) {
+            this.newCycle();
+        } else if (2 * this.shownWeight >= this.activeWeight) {
+            this.rebuild(this.active.filter(i => !this.shown[i]));
+        }
+        let i;
+        do {
+            i = this.active[drawAlias(this.table)];
+        } while (this.shown[i]);
+        this.shown[i] = 1;
+        this.shownCount++;
+        this.shownWeight += this.weights[i];
+        return i;
+    }
+
+    putBack(i) {
+        if (this.weights === null) {
+            this.remaining++;
+        } else {
+            this.shown[i] = 0;
+            this.shownCount--;
+            this.shownWeight -= this.weights[i];
+        }
+    }
+
+    sample(k) {
+        k = Math.min(k, this.items.length);
+        const picked = [];
+        while (picked.length < k) {
+            const i = this.weights === null ? this.pickUniform() : this.pickWeighted();
+            // A new cycle started mid-click: wait for a later click
+            if (picked.includes(i)) this.putBack(i);
+            else picked.push(i);
+        }
+        return picked.map(i => this.items[i]);
+    }
+}
+
+// `node test_filters.js --bench <file>...` times the filters on the given
+// lists instead of testing (used by benchmark.py)
+if (process.argv[2] === '--bench') {
+    console.log(JSON.stringify(benchmarkFilters(process.argv.slice(3))));
+    process.exit(0);
+}
+
 // Load data
-const ownedGames = JSON.parse(fs.readFileSync('owned-games.json', 'utf8'));
-const buyGames = JSON.parse(fs.readFileSync('bgg-recommendations.json', 'utf8'));
+const ownedGames = decodeGames(JSON.parse(fs.readFileSync('owned-games.json', 'utf8')));
+const buyGames = decodeGames(JSON.parse(fs.readFileSync('bgg-recommendations.json', 'utf8')));
 
 console.log('=== Filter Test ===\n');
 console.log(`Total owned games: ${ownedGames.length}`);
 console.log(`Total buy recommendations: ${buyGames.length}\n`);
 
-// Test filter function
-function filterGames(games, playerCount, complexity, duration) {
+// Player count poll bitmask for a player count option (see player_polls.py)
+const POLL_OVERFLOW_PLAYERS = 8;
+function pollMask(playerCount) {
+    const players = parseInt(playerCount);
+    const bit = 1 << (Math.min(players, POLL_OVERFLOW_PLAYERS) - 1);
+    return players === 6 ? (1 << POLL_OVERFLOW_PLAYERS) - bit : bit;
+}
+
+// Test filter function (full scan, as used for lists without an index)
+function scanGames(games, playerCount, complexity, duration, fit = '') {
     return games.filter(game => {
-        // Player count filter
-        if (playerCount) {
+        // Player count filter: recommended / best in the BGG poll
+        if (playerCount && fit) {
+            const poll = fit === 'best' ? game.bggbestplayers : game.bggrecplayers;
+            if (!(poll & pollMask(playerCount))) return false;
+        } else if (playerCount) {
             const players = parseInt(playerCount);
             if (players === 6) {
                 if (game.maxplayers < 6) return false;
@@ -43,21 +230,130 @@ function filterGames(games, playerCount, complexity, duration) {
     });
 }
 
+function filterGames(games, playerCount, complexity, duration, fit = '') {
+    if (games.filterIndex) {
+        const matches = filterWithIndex(games, games.filterIndex, playerCount, complexity, duration, fit);
+        if (matches) return matches;
+    }
+    return scanGames(games, playerCount, complexity, duration, fit);
+}
+
+// The precomputed index must agree with a full scan for every combination
+function checkIndex(label, games) {
+    if (!games.filterIndex) {
+        console.log(`${label}: no filter index, using full scans`);
+        return;
+    }
+    let combinations = 0;
+    for (const players of ['', '1', '2', '3', '4', '5', '6']) {
+        for (const fit of players ? ['', 'recommended', 'best'] : ['']) {
+            for (const complexity of ['', 'light', 'medium', 'heavy']) {
+                for (const duration of ['', 'quick', 'medium', 'long', 'verylong']) {
+                    const indexed = filterGames(games, players, complexity, duration, fit);
+                    const scanned = scanGames(games, players, complexity, duration, fit);
+                    if (indexed.length !== scanned.length || indexed.some((game, i) => game !== scanned[i])) {
+                        throw new Error(`${label}: index mismatch for players=${players} fit=${fit} complexity=${complexity} duration=${duration}`);
+                    }
+                    combinations++;
+                }
+            }
+        }
+    }
+    console.log(`${label}: filter index matches full scan for all ${combinations} combinations`);
+}
+
+// Best-of-`repeats` milliseconds to decode each list and to answer every
+// filter combination by full scan and through the index
+function benchmarkFilters(files, repeats = 5) {
+    const time = fn => {
+        let best = Infinity;
+        for (let r = 0; r < repeats; r++) {
+            const start = process.hrtime.bigint();
+            fn();
+            best = Math.min(best, Number(process.hrtime.bigint() - start) / 1e6);
+        }
+        return best;
+    };
+    const combinations = [];
+    for (const players of ['', '1', '2', '3', '4', '5', '6']) {
+        for (const complexity of ['', 'light', 'medium', 'heavy']) {
+            for (const duration of ['', 'quick', 'medium', 'long', 'verylong']) {
+                combinations.push([players, complexity, duration]);
+            }
+        }
+    }
+
+    return files.map(file => {
+        const text = fs.readFileSync(file, 'utf8');
+        const games = decodeGames(JSON.parse(text));
+        const result = {
+            file,
+            games: games.length,
+            combinations: combinations.length,
+            decode_ms: time(() => decodeGames(JSON.parse(text))),
+            scan_ms: time(() => combinations.forEach(c => scanGames(games, ...c))),
+        };
+        if (games.filterIndex) {
+            result.index_ms = time(() => combinations.forEach(c => filterWithIndex(games, games.filterIndex, ...c)));
+        }
+        return result;
+    });
+}
+
+// Repeated clicks must show every match once before any game repeats, and
+// weighted picks must favour heavier games
+function checkSampler(label, games) {
+    const weighted = games.length > 0 && 'sampleWeight' in games[0];
+    const sampler = new CyclingSampler(games, weighted ? games.map(game => game.sampleWeight) : null);
+    const shown = [];
+    while (shown.length < 2 * games.length) {
+        const picked = sampler.sample(3);
+        if (new Set(picked).size !== picked.length) throw new Error(`${label}: repeated game within one click`);
+        shown.push(...picked);
+    }
+    if (new Set(shown.slice(0, games.length)).size !== games.length) {
+        throw new Error(`${label}: a game repeated before the cycle was complete`);
+    }
+
+    if (weighted) {
+        // Heavier games come out earlier in a cycle
+        const third = Math.floor(games.length / 3);
+        const meanWeight = part => part.reduce((sum, game) => sum + game.sampleWeight, 0) / part.length;
+        if (third > 0 && meanWeight(shown.slice(0, third)) <= meanWeight(shown.slice(games.length - third, games.length))) {
+            throw new Error(`${label}: weighted sampling does not favour higher weights`);
+        }
+    }
+    console.log(`${label}: ${weighted ? 'weighted' : 'uniform'} sampler cycles through all ${games.length} games`);
+}
+
+checkIndex('Owned games', ownedGames);
+checkIndex('Buy recommendations', buyGames);
+checkSampler('Owned games', ownedGames);
+checkSampler('Buy recommendations', buyGames);
+console.log('');
+
 // Test cases
 const tests = [
     { name: 'All games (no filters)', players: '', complexity: '', duration: '' },
     { name: '2 players, light, quick', players: '2', complexity: 'light', duration: 'quick' },
     { name: '4 players, medium complexity', players: '4', complexity: 'medium', duration: '' },
     { name: 'Heavy games, long duration', players: '', complexity: 'heavy', duration: 'long' },
+    { name: 'Best at 3 players (BGG poll)', players: '3', complexity: '', duration: '', fit: 'best' },
+    // Buy list games cross-referenced with the collection carry its poll results
+    { name: 'Buy list, recommended at 4 players (BGG poll)', players: '4', complexity: '', duration: '', fit: 'recommended', buyMatches: true },
+    { name: 'Buy list, best at 2 players (BGG poll)', players: '2', complexity: '', duration: '', fit: 'best', buyMatches: true },
 ];
 
 tests.forEach(test => {
-    const ownedFiltered = filterGames(ownedGames, test.players, test.complexity, test.duration);
-    const buyFiltered = filterGames(buyGames, test.players, test.complexity, test.duration);
+    const ownedFiltered = filterGames(ownedGames, test.players, test.complexity, test.duration, test.fit);
+    const buyFiltered = filterGames(buyGames, test.players, test.complexity, test.duration, test.fit);
 
     console.log(`Test: ${test.name}`);
     console.log(`  Owned games matching: ${ownedFiltered.length}`);
     console.log(`  Buy recommendations matching: ${buyFiltered.length}`);
+    if (test.buyMatches && buyFiltered.length === 0) {
+        throw new Error(`${test.name}: no buy recommendation matches`);
+    }
 
     if (ownedFiltered.length > 0) {
         console.log(`  Sample owned: ${ownedFiltered[0].name}`);